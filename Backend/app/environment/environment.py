@@ -6,6 +6,11 @@ AUTH_TOKEN = "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJleHAiOjE3NDI0NDg3MDgsInN1Y
 
 #IP for DreamsEdge API
 IP_API = "54.252.196.164"
+HTTP_POOL_SIZE = 20  # Pooled connections to the DreamsEdge API
+
+# Registered-device cache: IDs in it skip POST /device/create
+DEVICE_CACHE_PATH = "Backend/app/cache/registered_devices.json"
+DEVICE_CACHE_TTL = 604800  # Seconds a registration is trusted (7 days)
 
 # TCP server information
 TCP_SERVER_NAME = "another-tcp-server"
@@ -33,9 +38,49 @@ cert_path = "Backend/app/upload/tcp-server.cert.pem"
 
 MQTT_PORT = 8883  # Port MQTT SSL
 
+# MQTT publisher pool shared by every device connection
+MQTT_POOL_SIZE = 2        # Number of long-lived MQTT connections
+MQTT_MAX_INFLIGHT = 100   # Unacknowledged QoS1 messages allowed per connection
+
+# Telemetry batching: None = one MQTT message per sample (default),
+# "device" = one batch per device topic, "facility" = one batch per facility topic
+TELEMETRY_BATCH_MODE = None
+TELEMETRY_BATCH_WINDOW = 1.0   # Seconds a batch may wait before it is published
+TELEMETRY_BATCH_SIZE = 50      # Samples that trigger an immediate publish
+
+# Upstream payload encoding: "json_pretty" (indent=4, the original format), "json" (compact),
+# "json_zlib", "binary" or "binary_zlib". TELEMETRY_ENCODING_BY_TOPIC overrides it per
+# facility topic prefix, e.g. {"another-tcp-server": "binary_zlib"}
+TELEMETRY_ENCODING = "json_pretty"
+TELEMETRY_ENCODING_BY_TOPIC = {}
+
+# Store-and-forward spool used while AWS IoT is unreachable
+SPOOL_DIR = "Backend/app/spool"
+SPOOL_SEGMENT_BYTES = 4194304   # Size of one spool segment file (4 MB)
+SPOOL_FSYNC_INTERVAL = 1.0      # Seconds between fsyncs of the active segment
+SPOOL_REPLAY_RATE = 50          # Messages per second replayed once AWS IoT is back, on top of the live rate
+
+# Ingest queues between the device sockets and the publisher
+INGEST_QUEUE_HIGH_WATER = 5000      # Queued records above which sockets stop being read
+INGEST_QUEUE_LOW_WATER = 2500       # Queued records below which reading resumes
+INGEST_SHED_LIMIT = 20000           # Queued records above which new samples are shed
+INGEST_SHED_POLICY = "keep_transitions"  # "keep_transitions" (only out_of_bed changes), "drop_all" or None
+INGEST_PUBLISH_QUEUE_SIZE = 5000    # Decoded samples waiting to be published
+
 # TCP_SERVER
 TCP_SERVER_HOST = '0.0.0.0'
 TCP_SERVER_PORT = 8899
+TCP_WORKER_PROCESSES = 1  # > 1: fork this many worker processes sharing the port with SO_REUSEPORT
+TCP_MAX_CONNECTIONS = 10000   # Concurrent device connections (split between workers), None = no limit
+TCP_IDLE_TIMEOUT = 120        # Seconds without data before a connection is reaped, None = never
+TCP_KEEPALIVE = True          # SO_KEEPALIVE on device connections
+TCP_KEEPALIVE_IDLE = 60       # Seconds of silence before the first keepalive probe
+TCP_KEEPALIVE_INTERVAL = 10   # Seconds between probes
+TCP_KEEPALIVE_COUNT = 5       # Unanswered probes before the kernel drops the connection
+
+# Metrics and health probes (/metrics, /healthz, /readyz)
+METRICS_HOST = '0.0.0.0'
+METRICS_PORT = 9100           # TCP worker N listens on METRICS_PORT + N + 1, None = disabled
 
 # Facility list
 FACILITY_LIST = {'data': [{'name': 'Bene St.Paul', 'address': 'St.Paul', 'timezone': 'Australia/Sydney', 'tcp_server_name': 'another-tcp-server', 'id': 1, 'created_at': '2025-03-05T12:58:28.316924', 'updated_at': '2025-03-05T12:58:28.316940'}, {'name': 'Rob_Test', 'address': '', 'timezone': 'Australia/Sydney', 'tcp_server_name': 'another-tcp-server', 'id': 6, 'created_at': '2025-03-05T11:31:50.493161', 'updated_at': '2025-03-06T04:04:02.621634'}, {'name': 'facility123', 'address': '123 somewhere', 'timezone': 'UTC+10:00 - AEST - Australian Eastern Standard Time', 'tcp_server_name': None, 'id': 12, 'created_at': '2025-03-19T06:23:55.485983', 'updated_at': '2025-03-19T06:25:17.553137'}, {'name': 'UAT-Facility', 'address': '123 Fake Street', 'timezone': 'UTC+10:00 - AEST - Australian Eastern Standard Time', 'tcp_server_name': 'another-tcp-server', 'id': 11, 'created_at': '2025-03-19T01:06:07.328601', 'updated_at': '2025-03-19T07:05:17.264383'}], 'count': 4}
@@ -45,15 +90,32 @@ START_CHECK_AWS = True
 CONNECTION_AWS = True
 
 # Server Status
-TCP_SERVER_STATUS = True
-AWS_SERVER_STATUS = True
+# TCP / AWS state and the last ack of each device live in Redis (status_registry),
+# written by the backend when they change
+STATUS_ACK_FLUSH_INTERVAL = 5    # Seconds between writes of the last ack times
+STATUS_WAIT_MAX = 25             # Longest a status page request waits for a change (seconds)
+STATUS_MAX_WAITERS = 50          # Status requests waiting at once; beyond that they answer at once
 
 # Control Server
+# START_SERVER / STOP_SERVER: state to restore when the backend starts; the UI
+# sends start / stop / reload / status over CONTROL_SOCKET (Unix domain socket)
 START_SERVER = True
 STOP_SERVER = False
+CONTROL_SOCKET = "Backend/app/control.sock"
+CONTROL_TIMEOUT = 15     # Seconds the UI waits for an answer (stop flushes the queues first)
 
 # Logging Configuration
+# MAX_BYTES: size of the active log file before it is rotated,
+# BACKUP_COUNT: rotated (gzipped) log files kept, over every date
 MAX_BYTES = 1048576
 BACKUP_COUNT = 10
+LOG_DIR = "Backend/app/logs"     # Log files (made absolute at start)
+LOG_FILE_QUEUE_SIZE = 20000  # Records waiting for the log file thread; beyond this they are dropped
+LOG_QUEUE_SIZE = 20000       # Messages waiting for the log writer thread; beyond this they are dropped
+LOG_BATCH_SIZE = 500         # Messages written to Redis / the log file per batch
+LOG_FALLBACK_SIZE = 5000     # Messages kept in memory while Redis is unreachable
+LOG_LEVEL = "INFO"           # Default threshold: "DEBUG", "INFO", "WARNING" or "ERROR" (runtime value lives in Redis)
+LOG_PACKET_SAMPLE = 100      # At DEBUG, log 1 in N packet dumps / samples, 0 = none
+LOG_SETTINGS_POLL_INTERVAL = 2   # Seconds between checks for settings changed from the system log page
 
 
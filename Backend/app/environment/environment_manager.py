@@ -1,12 +1,90 @@
 import os
-import importlib
 import re
 import json
+import time
+import fcntl
+import shutil
+import hashlib
+import tempfile
+import threading
 import app.environment.environment as environment
 
 ENV_FILE_PATH = os.path.join(os.path.dirname(__file__), "environment.py")
 UPLOAD_FOLDER = "Backend/app/upload"
 
+# A file modified less than this many seconds before it was last checked may
+# change again without a visible mtime change (coarse timestamps): its content
+# hash is compared as well.
+RACY_WINDOW = 2.0
+
+# -------------------------------------------------
+# Configuration store.
+# The 'environment' module is the in-memory copy of
+# environment.py. Getters call refresh(), which only
+# stats the file; the file is read again only if its
+# inode, size or mtime changed (or it is too recent
+# to trust its mtime), and re-executed only if its
+# content hash changed.
+# -------------------------------------------------
+_store_lock = threading.Lock()
+_signature = None     # (inode, size, mtime_ns) of the loaded file
+_digest = None        # sha256 of the loaded file
+_checked_at = 0.0     # time.time() of the last check
+
+config_checks = 0     # refresh() calls
+config_reads = 0      # File reads (signature changed or racy)
+config_reloads = 0    # Re-executions (content changed)
+
+def _file_signature():
+    stat = os.stat(ENV_FILE_PATH)
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+def _load(source):
+    # Executes the source that was hashed, not the file again (or a stale .pyc),
+    # in a fresh namespace: a key deleted from the file disappears here too
+    namespace = {"__name__": environment.__name__, "__file__": ENV_FILE_PATH}
+    exec(compile(source, ENV_FILE_PATH, "exec"), namespace)
+
+    loaded = {name: value for name, value in namespace.items() if not name.startswith("_")}
+    environment.__dict__.update(loaded)  # New values first, readers never see a key missing that still exists
+    for name in [name for name in vars(environment) if not name.startswith("_") and name not in loaded]:
+        delattr(environment, name)
+
+def refresh():
+    global _signature, _digest, _checked_at, config_checks, config_reads, config_reloads
+
+    config_checks += 1
+    now = time.time()
+    signature = _file_signature()
+    if signature == _signature and signature[2] / 1e9 < _checked_at - RACY_WINDOW:
+        _checked_at = now
+        return False
+
+    with _store_lock:
+        with open(ENV_FILE_PATH, "rb") as f:
+            source = f.read()
+        config_reads += 1
+        digest = hashlib.sha256(source).digest()
+
+        changed = digest != _digest
+        if changed:
+            _load(source)
+            config_reloads += 1
+        _signature = signature
+        _digest = digest
+        _checked_at = now
+    return changed
+
+def get_config_stats():
+    return {"checks": config_checks, "reads": config_reads, "reloads": config_reloads,
+            "writes": config_writes, "fsyncs": config_fsyncs, "skipped_writes": config_skipped_writes}
+
+# The module was just imported from this file: only remember what it was
+with open(ENV_FILE_PATH, "rb") as _f:
+    _digest = hashlib.sha256(_f.read()).digest()
+_signature = _file_signature()
+_checked_at = time.time()
+
 # -------------------------------------------------
 # Convert Python values to the correct format for 
 # environment.py.
@@ -19,6 +97,8 @@ def _serialize_value(value):
         return "None"
     if isinstance(value, (int, float)):
         return str(value)
+    if isinstance(value, (dict, list)):
+        return repr(value)  # FACILITY_LIST
     else:  
         return f'"{value}"'
     
@@ -37,222 +117,214 @@ def _update_env_line(lines, var_name, new_value):
             replaced = True
             break
 
+    # Not in the file yet: append it
+    if not replaced:
+        lines.append(f"{var_name} = {_serialize_value(new_value)}\n")
+
     return lines
 
+# -------------------------------------------------
+# Transactional update of environment.py.
+# Applies every key of 'values' in one write:
+# temporary file in the same directory, fsync,
+# rename over environment.py, fsync of the
+# directory. Readers see the old or the new file,
+# never a half-written one.
+# Writers are serialized by a lock file (flock),
+# across the web UI and the backend processes, and
+# the file is read under that lock, so concurrent
+# updates of different keys are never lost.
+# Returns the number of fsyncs (0: nothing changed).
+# -------------------------------------------------
+LOCK_FILE_PATH = ENV_FILE_PATH + ".lock"
+
+_write_lock = threading.Lock()   # flock is per open file: threads of one process need this too
+
+config_writes = 0          # Transactions that rewrote the file
+config_fsyncs = 0          # fsync calls made by them
+config_skipped_writes = 0  # Updates that changed nothing (no lock, no write)
+last_write_fsyncs = 0      # fsyncs of the last update_environment() call
+
+def _unchanged(values):
+    refresh()
+    missing = object()
+    return all(
+        getattr(environment, name, missing) is not missing and
+        _serialize_value(getattr(environment, name)) == _serialize_value(value)
+        for name, value in values.items()
+    )
+
+def update_environment(values):
+    global config_writes, config_fsyncs, config_skipped_writes, last_write_fsyncs
+
+    # Most status updates write what is already there (e.g. on every MQTT ack)
+    if _unchanged(values):
+        config_skipped_writes += 1
+        last_write_fsyncs = 0
+        return 0
+
+    directory = os.path.dirname(ENV_FILE_PATH)
+    with _write_lock, open(LOCK_FILE_PATH, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            with open(ENV_FILE_PATH, "r", encoding="utf-8") as f:
+                original = f.read()
+
+            lines = original.splitlines(keepends=True)
+            for name, value in values.items():
+                lines = _update_env_line(lines, name, value)
+            content = "".join(lines)
+
+            if content == original:
+                config_skipped_writes += 1
+                last_write_fsyncs = 0
+                return 0
+
+            descriptor, temporary = tempfile.mkstemp(prefix=".environment.", suffix=".tmp", dir=directory)
+            try:
+                with os.fdopen(descriptor, "w", encoding="utf-8") as f:
+                    f.write(content)
+                    f.flush()  # Force Python to flush its internal buffers
+                    os.fsync(f.fileno())  # Force the OS to write buffers to the disk
+                shutil.copymode(ENV_FILE_PATH, temporary)
+                os.replace(temporary, ENV_FILE_PATH)
+            except BaseException:
+                os.remove(temporary)
+                raise
+
+            # Make the rename itself durable
+            directory_fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(directory_fd)
+            finally:
+                os.close(directory_fd)
+
+            config_writes += 1
+            config_fsyncs += 2
+            last_write_fsyncs = 2
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # Reload to updated values
+    refresh()
+    return 2
+
 # -------------------------------------------------
 # Return the latest USERNAME and PASSWORD from 
 # environment.py.
 # -------------------------------------------------
 def get_login_info():
-    importlib.reload(environment)
+    refresh()
     return {"login_username": environment.LOGIN_USERNAME, "login_password": environment.LOGIN_PASSWORD}
 
 # -------------------------------------------------
 # Update USERNAME and PASSWORD in environment.py
 # -------------------------------------------------
 def update_info_user(username, password):
-    with open(ENV_FILE_PATH, "r", encoding="utf-8") as f:
-        lines = f.readlines()
-
-    lines = _update_env_line(lines, "USERNAME", username)
-    lines = _update_env_line(lines, "PASSWORD", password)
-
-    with open(ENV_FILE_PATH, "w", encoding="utf-8") as f:
-        f.writelines(lines)
-        f.flush()  # Force Python to flush its internal buffers
-        os.fsync(f.fileno())  # Force the OS to write buffers to the disk
-
-    # Reload to updated values
-    importlib.reload(environment)
+    update_environment({"USERNAME": username, "PASSWORD": password})
 
 # -------------------------------------------------
 # Update 
 # -------------------------------------------------
 def update_start_server_status(token):
-    with open(ENV_FILE_PATH, "r", encoding="utf-8") as f:
-        lines = f.readlines()
-
-    lines = _update_env_line(lines, "START_SERVER", token)
-
-    with open(ENV_FILE_PATH, "w", encoding="utf-8") as f:
-        f.writelines(lines)
-        f.flush()  # Force Python to flush its internal buffers
-        os.fsync(f.fileno())  # Force the OS to write buffers to the disk
-
-    # Reload to updated values
-    importlib.reload(environment)
+    update_environment({"START_SERVER": token})
 
 # -------------------------------------------------
 # Update 
 # -------------------------------------------------
 def update_stop_server_status(token):
-    with open(ENV_FILE_PATH, "r", encoding="utf-8") as f:
-        lines = f.readlines()
-
-    lines = _update_env_line(lines, "STOP_SERVER", token)
+    update_environment({"STOP_SERVER": token})
 
-    with open(ENV_FILE_PATH, "w", encoding="utf-8") as f:
-        f.writelines(lines)
-        f.flush()  # Force Python to flush its internal buffers
-        os.fsync(f.fileno())  # Force the OS to write buffers to the disk
-
-    # Reload to updated values
-    importlib.reload(environment)
+# -------------------------------------------------
+# START_SERVER / STOP_SERVER together, one write
+# -------------------------------------------------
+def update_server_state(start):
+    return update_environment({"START_SERVER": start, "STOP_SERVER": not start})
 
 # -------------------------------------------------
 # Return the latest AUTH_TOKEN from environment.py
 # -------------------------------------------------
 def get_auth_token():
-    importlib.reload(environment)
+    refresh()
     return environment.AUTH_TOKEN
 
 # -------------------------------------------------
 # Update AUTH_TOKEN in environment.py.
 # -------------------------------------------------
 def update_auth_token(token):
-    with open(ENV_FILE_PATH, "r", encoding="utf-8") as f:
-        lines = f.readlines()
-
-    lines = _update_env_line(lines, "AUTH_TOKEN", token)
-
-    with open(ENV_FILE_PATH, "w", encoding="utf-8") as f:
-        f.writelines(lines)
-        f.flush()  # Force Python to flush its internal buffers
-        os.fsync(f.fileno())  # Force the OS to write buffers to the disk
-
-    # Reload so environment.AUTH_TOKEN is updated
-    importlib.reload(environment)
+    update_environment({"AUTH_TOKEN": token})
 
 # -------------------------------------------------
 # Return the latest Facility Lists from environment.py
 # -------------------------------------------------
 def get_facility_list():
-    importlib.reload(environment)
+    refresh()
     return environment.FACILITY_LIST
 
 # -------------------------------------------------
 # Update the facility list in environment.py
 # -------------------------------------------------
 def update_facility_list(facilities):
-    with open(ENV_FILE_PATH, "r", encoding="utf-8") as f:
-        lines = f.readlines()
-
-    # Update the FACILITY_LIST entry in environment.py
-    updated = False
-    for i, line in enumerate(lines):
-        if line.strip().startswith("FACILITY_LIST"):
-            lines[i] = f'FACILITY_LIST = {facilities}\n'
-            updated = True
-            break
-
-    # If FACILITY_LIST is not found, append it
-    if not updated:
-        lines.append(f'FACILITY_LIST = {facilities}\n')
-
-    with open(ENV_FILE_PATH, "w", encoding="utf-8") as f:
-        f.writelines(lines)
-        f.flush()  # Force Python to flush its internal buffers
-        os.fsync(f.fileno())  # Force the OS to write buffers to the disk
-
-    # Reload to updated values
-    importlib.reload(environment)
+    update_environment({"FACILITY_LIST": facilities})
 
 # -------------------------------------------------
 # Update FACILITY_ID in environment.py.
 # -------------------------------------------------
 def update_facility_id(token):
-    with open(ENV_FILE_PATH, "r", encoding="utf-8") as f:
-        lines = f.readlines()
-
-    token = int(token)
-    lines = _update_env_line(lines, "FACILITY_ID", token)
-
-    
-    with open(ENV_FILE_PATH, "w", encoding="utf-8") as f:
-        f.writelines(lines)
-        f.flush()  # Force Python to flush its internal buffers
-        os.fsync(f.fileno())  # Force the OS to write buffers to the disk
-
-    # Reload to updated  
-    importlib.reload(environment)
+    update_environment({"FACILITY_ID": int(token)})
 
 # -------------------------------------------------
 # Return the latest AWS_IOT_ENDPOINT 
 # from environment.py
 # -------------------------------------------------
 def get_aws_endpoint():
-    importlib.reload(environment)
+    refresh()
     return environment.AWS_IOT_ENDPOINT
 
 # -------------------------------------------------
 # Update AWS_IOT_ENDPOINT in environment.py.
 # -------------------------------------------------
 def update_aws_endpoint(token):
-    with open(ENV_FILE_PATH, "r", encoding="utf-8") as f:
-        lines = f.readlines()
-
-    lines = _update_env_line(lines, "AWS_IOT_ENDPOINT", token)
-
-    with open(ENV_FILE_PATH, "w", encoding="utf-8") as f:
-        f.writelines(lines)
-        f.flush()  # Force Python to flush its internal buffers
-        os.fsync(f.fileno())  # Force the OS to write buffers to the disk
-
-    # Reload the updated environment variables
-    importlib.reload(environment)
+    update_environment({"AWS_IOT_ENDPOINT": token})
 
 # -------------------------------------------------
 # Return the latest Facility Lists from environment.py
 # -------------------------------------------------
 def get_allow_extensions():
-    importlib.reload(environment)
+    refresh()
     return environment.ALLOWED_EXTENSIONS
 
 # ------------------------------------------------- 
 # Update environment.py with new file paths
-# ------------------------------------------------- 
-def update_environment_file(new_file_path, file_type):
-    
-    # Convert to relative path
-    relative_path = os.path.relpath(new_file_path, start=os.getcwd())  
-
-    with open(ENV_FILE_PATH, "r") as file:
-        lines = file.readlines()
-
-    # Identify which variable needs updating
-    updated_lines = []
-    for line in lines:
-        if file_type == "root_ca" and line.startswith("root_ca_path"):
-            updated_lines.append(f'root_ca_path = "{relative_path}"\n')
-        elif file_type == "private_key" and line.startswith("private_key_path"):
-            updated_lines.append(f'private_key_path = "{relative_path}"\n')
-        elif file_type == "cert" and line.startswith("cert_path"):
-            updated_lines.append(f'cert_path = "{relative_path}"\n')
-        else:
-            updated_lines.append(line)  # Keep other lines unchanged
+# -------------------------------------------------
+CERT_PATH_VARIABLES = {"root_ca": "root_ca_path", "private_key": "private_key_path", "cert": "cert_path"}
 
-    # Write the updated content back to the file
-    with open(ENV_FILE_PATH, "w") as file:
-        file.writelines(updated_lines)
+# {variable: relative path} of an uploaded file, to be
+# written with other keys in one update_environment()
+def certificate_path_update(new_file_path, file_type):
+    # Convert to relative path
+    relative_path = os.path.relpath(new_file_path, start=os.getcwd())
+    return {CERT_PATH_VARIABLES[file_type]: relative_path}
 
-    # Reload to get updated values
-    importlib.reload(environment) 
+def update_environment_file(new_file_path, file_type):
+    values = certificate_path_update(new_file_path, file_type)
+    update_environment(values)
 
-    return relative_path  # Return the updated relative path
+    return next(iter(values.values()))  # Return the updated relative path
 
 # -------------------------------------------------
 # Return path of aws certificates
 # -------------------------------------------------
 def get_root_ca_path():
-    importlib.reload(environment)
+    refresh()
     return environment.root_ca_path
 
 def get_private_key_path():
-    importlib.reload(environment)
+    refresh()
     return environment.private_key_path
 
 def get_cert_path():
-    importlib.reload(environment)
+    refresh()
     return environment.cert_path
 # ------------------------------------------------- 
 # Retrieve files with the required extensions 
@@ -261,7 +333,7 @@ def get_cert_path():
 def get_uploaded_files():
     
     # Reload to get the latest AWS IoT Endpoint dynamically
-    importlib.reload(environment) 
+    refresh() 
     
     files = [
         f for f in os.listdir(UPLOAD_FOLDER) 
@@ -274,109 +346,41 @@ def get_uploaded_files():
 # Return MQTT PORT
 # -------------------------------------------------
 def get_MQTT_PORT():
-    importlib.reload(environment)
+    refresh()
     return environment.MQTT_PORT
 
 # -------------------------------------------------
 # Return START_SERVER
 # -------------------------------------------------
 def get_start_server():
-    importlib.reload(environment)
+    refresh()
     return environment.START_SERVER
 
 # -------------------------------------------------
 # Return Facility ID
 # -------------------------------------------------
 def get_facility_id():
-    importlib.reload(environment)
+    refresh()
     return environment.FACILITY_ID
 
-# -------------------------------------------------
-# Retrieve the TCP_SERVER_STATUS from environment.py 
-# -------------------------------------------------    
-def get_status_tcp_server():
-    # Reload environment to get updated values
-    importlib.reload(environment)  
-    return environment.TCP_SERVER_STATUS
-
-# -------------------------------------------------
-# Update TCP_SERVER_STATUS in environment.py.
-# -------------------------------------------------    
-def update_status_tcp_server(value):
-    with open(ENV_FILE_PATH, "r", encoding="utf-8") as f:
-        lines = f.readlines()
-
-    # Find the "keyword" and replace None
-    lines = _update_env_line(lines, "TCP_SERVER_STATUS", value)
-    
-    # Open and Write in environment.py
-    with open(ENV_FILE_PATH, "w", encoding="utf-8") as f:
-        f.writelines(lines)
-        f.flush()  # Force Python to flush its internal buffers
-        os.fsync(f.fileno())  # Force the OS to write buffers to the disk
-
-    # Reload to get updated values
-    importlib.reload(environment)  
-
-# -------------------------------------------------
-# Retrieve the AWS_SERVER_STATUS from environment.py 
-# -------------------------------------------------    
-def get_status_aws_server():
-    # Reload environment to get updated values
-    importlib.reload(environment)  
-    return environment.AWS_SERVER_STATUS
-
-# -------------------------------------------------
-# Update AWS_SERVER_STATUS in environment.py.
-# -------------------------------------------------    
-def update_status_aws_server(value):
-    with open(ENV_FILE_PATH, "r", encoding="utf-8") as f:
-        lines = f.readlines()
-
-    # Find the "keyword" and replace None
-    lines = _update_env_line(lines, "AWS_SERVER_STATUS", value)
-    
-    # Open and Write in environment.py
-    with open(ENV_FILE_PATH, "w", encoding="utf-8") as f:
-        f.writelines(lines)
-        f.flush()  # Force Python to flush its internal buffers
-        os.fsync(f.fileno())  # Force the OS to write buffers to the disk
-
-    # Reload to get updated values
-    importlib.reload(environment) 
-
 # -------------------------------------------------
 # Retrieve the Logging Configuration from 
 # environment.py 
 # ------------------------------------------------- 
 def get_logging_configuration():
     # Reload environment to get updated values
-    importlib.reload(environment)  
+    refresh()  
     return environment.MAX_BYTES, environment.BACKUP_COUNT
 
 # -------------------------------------------------
 # Update Logging Configuration in environment.py.
 # -------------------------------------------------    
 def update_logging_configuration(max_bytes, backup_count):
-    with open(ENV_FILE_PATH, "r", encoding="utf-8") as f:
-        lines = f.readlines()
-
-    # Find the "keyword" and replace None
-    lines = _update_env_line(lines, "MAX_BYTES", max_bytes)
-    lines = _update_env_line(lines, "BACKUP_COUNT", backup_count)
-    
-    # Open and Write in environment.py
-    with open(ENV_FILE_PATH, "w", encoding="utf-8") as f:
-        f.writelines(lines)
-        f.flush()  # Force Python to flush its internal buffers
-        os.fsync(f.fileno())  # Force the OS to write buffers to the disk
-
-    # Reload to get updated values
-    importlib.reload(environment) 
+    update_environment({"MAX_BYTES": max_bytes, "BACKUP_COUNT": backup_count})
 
 # ------------------------------------------------- 
 # Reload value of variables in Environment.py
+# (only if the file changed since the last call)
 # -------------------------------------------------
 def reload_environment():
-    # Reload environment.py to get the latest updates
-    importlib.reload(environment)
\ No newline at end of file
+    refresh()
\ No newline at end of file
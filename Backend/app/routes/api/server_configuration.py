@@ -1,6 +1,8 @@
 from flask import Blueprint, session, redirect, url_for, render_template, jsonify, request
 
 import app.services.control_server as control_server
+import app.services.control_channel as control_channel
+import app.services.status_registry as status_registry
 import app.environment.environment_manager as environment_manager
 import app.services.auth_server as auth_server
 import app.routes.api.system_log as system_log
@@ -45,14 +47,19 @@ def server_configuration():
 
 # ------------------------------------------------------
 # Start TCP server and accept data from devices 
+# (saved for the next backend start, applied now
+# through the control channel)
 # ------------------------------------------------------ 
 @server_config_bp.route("/start_server", methods=["GET", "POST"])
 def start_server():
 
-    environment_manager.update_start_server_status(True)
-    environment_manager.update_stop_server_status(False)
+    environment_manager.update_server_state(True)
 
-    return jsonify({"success": True, "message": "TCP Server started successfully!"})
+    response = control_channel.send_command("start")
+    if not response.get("reachable", True):
+        return jsonify({"success": False, "message": f"Saved, the TCP Server starts with the backend. {response['message']}"})
+
+    return jsonify({"success": response["success"], "message": response["message"]})
     
 # ------------------------------------------------------
 # Stop TCP server and not accept data from devices 
@@ -61,10 +68,13 @@ def start_server():
 @server_config_bp.route("/stop_server", methods=["GET"])
 def stop_server():
 
-    environment_manager.update_start_server_status(False)
-    environment_manager.update_stop_server_status(True)
+    environment_manager.update_server_state(False)
+
+    response = control_channel.send_command("stop")
+    if not response.get("reachable", True):
+        return jsonify({"success": False, "message": f"Saved, the TCP Server stays stopped. {response['message']}"})
 
-    return jsonify({"success": True, "message": "TCP Server stopped successfully!"})
+    return jsonify({"success": response["success"], "message": response["message"]})
 
 # --------------------------------------------------
 # Authenticate Function
@@ -119,6 +129,7 @@ def select_facility_id():
 
         # Update the selected Facility ID in environment
         environment_manager.update_facility_id(facility_id)
+        control_channel.request_reload()
 
         print(f"[INFO] Facility ID Updated: {facility_id}")
         system_log.log_to_redis(f"[INFO] Facility ID Updated: {facility_id}")
@@ -127,11 +138,25 @@ def select_facility_id():
 
         http_client.register_tcp_server(environment.FACILITY_ID, environment.TCP_SERVER_NAME)
 
+        # Devices register again under the new facility on their next 0x0001
+        http_client.invalidate_device()
+
         return jsonify({"success": True, "message": f"Facility ID '{facility_id}' updated successfully!"})
 
     except Exception as e:
         return jsonify({"success": False, "message": f"Error: {str(e)}"}), 500
 
+# --------------------------------------------------
+# Paths of the certificates saved so far, in one
+# write of environment.py; AWS IoT counts as not
+# connected until a message goes through with them
+# --------------------------------------------------
+def _save_certificate_paths(env_updates):
+    if env_updates:
+        environment_manager.update_environment(env_updates)
+        status_registry.reset_aws_status()
+        control_channel.request_reload()  # The MQTT pool reconnects with the new certificates
+
 # --------------------------------------------------
 # Upload Certificates function: 
 # -> Get 3 files of certificates and stored it in 
@@ -147,6 +172,7 @@ def upload_cert():
 
     saved_files = []
     updated_paths = {}
+    env_updates = {}  # Written to environment.py in one transaction
 
     for key, file_type in file_mapping.items():
         file = request.files.get(key)
@@ -160,6 +186,7 @@ def upload_cert():
 
         # Check if the extension is allowed
         if not any(file.filename.endswith(ext) for ext in ALLOWED_EXTENSIONS):
+            _save_certificate_paths(env_updates)  # Files saved before this one
             return jsonify({
                 "success": False,
                 "message": f"Invalid file type: {file.filename}. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
@@ -176,17 +203,18 @@ def upload_cert():
             file_path = os.path.join(UPLOAD_FOLDER, file.filename)
             file.save(file_path)
 
-            updated_paths[key] = file_path.replace("\\", "/")
-
-            updated_paths[key] = environment_manager.update_environment_file(file_path, file_type)
+            path_update = environment_manager.certificate_path_update(file_path, file_type)
+            env_updates.update(path_update)
+            updated_paths[key] = next(iter(path_update.values()))
 
             saved_files.append(file.filename)
 
-            environment_manager.update_status_aws_server(False)
-
         except Exception as e:
+            _save_certificate_paths(env_updates)
             return jsonify({"success": False, "error": str(e)}), 500
 
+    _save_certificate_paths(env_updates)
+
     if saved_files:
         return jsonify({"success": True, "uploaded_files": saved_files, "updated_paths": updated_paths}), 200
     else:
@@ -206,6 +234,7 @@ def update_aws_endpoint_route():
         return jsonify({"success": False, "message": "AWS IoT Endpoint cannot be empty!"}), 400
 
     environment_manager.update_aws_endpoint(new_endpoint)
+    control_channel.request_reload()
 
     return jsonify({"success": True, "new_endpoint": new_endpoint})
 
@@ -254,12 +283,12 @@ def check_aws_connection():
 @server_config_bp.route("/button_server_status")
 def button_server_status():
     
-    status_server = environment_manager.get_start_server()
-
-    if status_server:
-        server_running = True
+    # Ask the backend; the saved state if it is not running
+    response = control_channel.send_command("status", timeout=2)
+    if response["success"]:
+        server_running = response["status"]["running"]
     else:
-        server_running = False
+        server_running = bool(environment_manager.get_start_server())
 
     auth_token = environment_manager.get_auth_token()
 
@@ -1,6 +1,8 @@
-from flask import Blueprint, session, redirect, url_for, render_template, jsonify
+from flask import Blueprint, session, redirect, url_for, render_template, jsonify, request
+import app.environment.environment as environment
 import app.environment.environment_manager as environment_manager
 import app.services.auth_server as auth_server
+import app.services.status_registry as status_registry
 import asyncio
 import time
 
@@ -21,16 +23,37 @@ def server_management():
 # ------------------------------------------------------
 # Check server status function: 
 # -> Check status of TCP server and AWS server
+# (status_registry in Redis, not environment.py)
+#   /check_status_server                 current status
+#   /check_status_server?since=<v>&wait=<s>
+#       waits until the status is newer than version
+#       <v>, at most <s> seconds (STATUS_WAIT_MAX)
 # ------------------------------------------------------
 @server_manage_bp.route("/check_status_server", methods=["GET"])
 def check_status_server():
+    try:
+        since = request.args.get("since")
+        since = int(since) if since not in (None, "") else None
+        wait = min(max(0.0, float(request.args.get("wait", 0))), environment.STATUS_WAIT_MAX)
+    except ValueError as e:
+        return jsonify({"success": False, "message": f"Invalid status parameters: {str(e)}"}), 400
 
-    environment_manager.reload_environment()
-
-    status = auth_server.check_tcp_aws_status()
+    status = auth_server.check_tcp_aws_status(since, wait)
 
     return jsonify(status)
 
+# ------------------------------------------------------
+# Last acknowledged message of each device:
+# {"devices": {device ID: unix time}}, written by the
+# backend every STATUS_ACK_FLUSH_INTERVAL seconds
+# ------------------------------------------------------
+@server_manage_bp.route("/device_last_ack", methods=["GET"])
+def device_last_ack():
+    try:
+        return jsonify({"success": True, "devices": status_registry.get_last_acks()})
+    except Exception as e:
+        return jsonify({"success": False, "message": f"Error retrieving device status: {str(e)}"}), 500
+
 # ------------------------------------------------------
 # Fetch and return facility list, selected facility ID
 # and AWS IoT endpoint.
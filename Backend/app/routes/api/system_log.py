@@ -1,12 +1,24 @@
-from flask import Blueprint, session, redirect, url_for, render_template, jsonify, request
+from flask import Blueprint, session, redirect, url_for, render_template, jsonify, request, Response
+import app.environment.environment as environment
 import app.environment.environment_manager as environment_manager
 import app.services.auth_server as auth_server
+import app.services.metrics as metrics
+import app.services.log_index as log_index
 import redis
 
 import os
+import sys
+import time
+import json
+import atexit
+import queue
 import logging
-from datetime import datetime
-from logging.handlers import RotatingFileHandler
+import sqlite3
+import threading
+import multiprocessing
+from collections import deque
+from datetime import datetime, timedelta
+from logging.handlers import QueueHandler, QueueListener
 
 # Initialize Flask Blueprint
 system_log_bp = Blueprint("system_log", __name__)
@@ -14,98 +26,624 @@ system_log_bp = Blueprint("system_log", __name__)
 # Connect to Redis
 redis_client = redis.Redis(host='127.0.0.1', port=6379, db=0, decode_responses=True)
 
-LOG_KEY = "system_logs"  # Key for storing logs in Redis
+LOG_KEY = "system_logs"  # Old list of logs (before the stream), only deleted by /clear_logs
+LOG_STREAM_KEY = "system_log_stream"  # Redis Stream of logs: fields m (message) and l (level)
+LOG_TTL = 7*24*60*60     # Auto-delete after 7 days
+LOG_MAX_ENTRIES = 1000   # Logs kept in Redis (approximate MAXLEN trimming)
+LOG_FETCH_LIMIT = 1000   # Most entries returned by one /get_logs call
 
-# ------------------------------------------------------
-# Custom RotatingFileHandler with Date Format
-# ------------------------------------------------------
-class CustomRotatingFileHandler(RotatingFileHandler):
-    def __init__(self, filename, maxBytes=1024*1024, backupCount=5):
-        self.current_date = datetime.now().strftime("%Y-%m-%d")
-        self.base_filename = filename.replace(".txt", f"_{self.current_date}.txt")
-        super().__init__(self.base_filename, maxBytes=maxBytes, backupCount=backupCount)
-        
-    # Check if rollover is needed (size limit or new day).
-    def shouldRollover(self, record):
-        self.stream.flush()  # Ensure file size is updated
-        if os.path.getsize(self.baseFilename) >= self.maxBytes:  # Force check file size
-            return True
+# Live tail (/stream_logs)
+TAIL_BACKLOG = 500       # Recent entries replayed to a browser when it connects
+TAIL_QUEUE_SIZE = 1000   # Entries buffered per browser; a slower browser misses entries
+TAIL_BLOCK_MS = 5000     # XREAD BLOCK timeout of the shared reader
+TAIL_KEEPALIVE = 15      # Seconds between SSE comments on a quiet stream
 
-        new_date = datetime.now().strftime("%Y-%m-%d")
-        if new_date != self.current_date:
-            self.current_date = new_date
-            self.base_filename = self.baseFilename.replace(self.baseFilename.split("_")[-1], f"{new_date}.txt")
-            return True
+# Seconds between reconnect attempts while Redis is unreachable
+REDIS_RETRY_INTERVAL = 5
 
-        return False
+# Severity levels (the numbers of the logging module)
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+WARNING = logging.WARNING
+ERROR = logging.ERROR
+LEVELS = {"DEBUG": DEBUG, "INFO": INFO, "WARNING": WARNING, "ERROR": ERROR}
+
+# Redis hash with the runtime log settings (level, packet_sample, capture_devices),
+# written by the system log page and polled by every process's log writer
+SETTINGS_KEY = "log_settings"
+
+# ------------------------------------------------------
+# File logging.
+#
+# Every record (log_to_redis, logger.* and Flask's own
+# logs) reaches the root logger's QueueHandler, which
+# only enqueues it. The "log-file" listener thread owns
+# LogFileHandler and writes batches with one flush.
+# Rotated files are gzipped by the "log-compress"
+# thread, so neither formatting, disk writes, rotation
+# nor compression run on the ingest loop.
+#
+# Each process writes its own files (the web UI, the
+# TCP server, every TCP worker), named after LOG_SOURCE,
+# so the byte offsets kept by log_index are exact.
+# ------------------------------------------------------
+LOG_FILE_PREFIX = "system_logs_"
+
+def _log_source():
+    # "ui", "main", "tcp-worker-0", ...: no '_' or '.', they separate the parts of a file name
+    name = multiprocessing.current_process().name
+    if name == "MainProcess":
+        name = os.path.splitext(os.path.basename(sys.argv[0] if sys.argv and sys.argv[0] else ""))[0]
+    name = "".join(char if char.isalnum() or char == "-" else "-" for char in name).strip("-")
+    return name or "python"
+
+LOG_SOURCE = _log_source()
+
+def _parse_log_name(name):
+    """
+    (source, date, n, compressed) of system_logs_<source>_<date>[.<n>].txt[.gz], n is None
+    for an active file; None for any other file.
+    """
+    if not name.startswith(LOG_FILE_PREFIX):
+        return None
+    parts = name[len(LOG_FILE_PREFIX):].split(".")
+    compressed = parts[-1] == "gz"
+    if compressed:
+        parts.pop()
+    if parts.pop() != "txt" or not parts or len(parts) > 2:
+        return None
+    if len(parts) == 2 and not parts[1].isdigit():
+        return None
+
+    source, _, date = parts[0].rpartition("_")
+    return source, date, int(parts[1]) if len(parts) == 2 else None, compressed
+
+
+class LogFileHandler(logging.Handler):
+    """
+    Size- and date-rotating file handler, used by the listener thread only.
+
+    Active file: <LOG_DIR>/system_logs_<source>_<date>.txt. It rotates once it reaches
+    max_bytes or when the day changes: the file is renamed to
+    system_logs_<source>_<date>.<n>.txt and handed to the compressor. The written size is
+    tracked in memory instead of being read back from the file system on every record,
+    and every line is added to the search index (log_index) with its offset.
+    """
+
+    def __init__(self, directory, max_bytes, compressor):
+        super().__init__()
+        self.directory = os.path.abspath(directory)  # Immune to a later chdir()
+        os.makedirs(self.directory, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.compressor = compressor
+        self.index = log_index.LogIndex(self.directory)
+
+        self.stream = None
+        self.path = None
+        self.date = None
+        self.file_id = None
+        self.size = 0
+        self.rollover_at = 0.0  # Timestamp of the next midnight
+
+    def _open(self, created):
+        day = datetime.fromtimestamp(created)
+        self.date = day.strftime("%Y-%m-%d")
+        name = f"{LOG_FILE_PREFIX}{LOG_SOURCE}_{self.date}.txt"
+        self.path = os.path.join(self.directory, name)
+
+        # Active file of an earlier day (the process was stopped over midnight): rotate it
+        for other in os.listdir(self.directory):
+            parsed = _parse_log_name(other)
+            if parsed and parsed[0] == LOG_SOURCE and parsed[1] != self.date and parsed[2] is None:
+                self._rename(os.path.join(self.directory, other), parsed[1], None)
+
+        self.stream = open(self.path, "a", encoding="utf-8", buffering=64 * 1024)
+        self.size = self.stream.tell()
+        self.file_id = self.index.open_file(name, self.size)
+        self.rollover_at = (day.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)).timestamp()
+
+    def _rename(self, path, date, file_id):
+        rotated = _rotated_path(self.directory, LOG_SOURCE, date)
+        os.rename(path, rotated)
+        if file_id is None:
+            file_id = self.index.open_file(os.path.basename(path), os.path.getsize(rotated))
+        self.index.rename_file(file_id, os.path.basename(rotated))
+        self.compressor.submit(rotated)
+
+    def _rotate(self, created):
+        self.stream.close()
+        self.stream = None
+        self.index.commit()
+
+        if self.size > 0:
+            self._rename(self.path, self.date, self.file_id)
+
+        self._open(created)
 
-    # Perform log rotation while ensuring the file is reopened correctly.
-    def doRollover(self):
-        if self.stream:
-            self.stream.close()
-            self.stream = None  # Ensure the stream is properly closed
-
-        # If the date changed, start a new log file
-        new_date = datetime.now().strftime("%Y-%m-%d")
-        if new_date != self.current_date:
-            self.current_date = new_date
-            self.base_filename = self.baseFilename.replace(self.baseFilename.split("_")[-1], f"{new_date}.txt")
-
-        # Rotate old logs with new format
-        for i in range(self.backupCount - 1, 0, -1):
-            old_file = f"system_logs_{i}_{self.current_date}.txt"
-            new_file = f"system_logs_{i+1}_{self.current_date}.txt"
-            if os.path.exists(old_file):
-                os.rename(old_file, new_file)
-
-        # Rename the current log file
-        log_backup = f"system_logs_1_{self.current_date}.txt"
-        if os.path.exists(self.base_filename):
-            os.rename(self.base_filename, log_backup)
-
-        # **Reopen the log file to prevent "I/O operation on closed file" error**
-        self.stream = self._open()
-    # Ensure rollover happens before writing logs.
     def emit(self, record):
-        if self.shouldRollover(record):  # Check file size and date
-            self.doRollover()
-        super().emit(record)  # Write log after rollover check
+        try:
+            line = self.format(record) + "\n"
+
+            if self.stream is None:
+                self._open(record.created)
+            elif self.size >= self.max_bytes or record.created >= self.rollover_at:
+                self._rotate(record.created)
+
+            self.stream.write(line)
+            offset = self.size
+            self.size += len(line) if line.isascii() else len(line.encode("utf-8"))
+            self.index.add(self.file_id, record.created, offset, self.size, record.message)
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        # The index only ever points at lines that reached the file
+        if self.stream is not None:
+            self.stream.flush()
+            self.index.commit(force=False)
+
+    def close(self):
+        self.acquire()
+        try:
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None
+                self.index.commit()
+            self.index.close()
+        finally:
+            self.release()
+        super().close()
+
+
+def _rotated_files(directory):
+    # (path, mtime) of every rotated file of every source, compressed or not, oldest first
+    rotated = []
+    for name in os.listdir(directory):
+        parsed = _parse_log_name(name)
+        if parsed is None or parsed[2] is None:
+            continue
+        path = os.path.join(directory, name)
+        try:
+            rotated.append((path, os.path.getmtime(path)))
+        except OSError:
+            continue
+    rotated.sort(key=lambda item: item[1])
+    return rotated
+
+def _rotated_path(directory, source, date):
+    highest = 0
+    for path, _ in _rotated_files(directory):
+        parsed = _parse_log_name(os.path.basename(path))
+        if parsed[0] == source and parsed[1] == date:
+            highest = max(highest, parsed[2])
+    return os.path.join(directory, f"{LOG_FILE_PREFIX}{source}_{date}.{highest + 1}.txt")
+
+
+class _LogCompressor:
+    """
+    Background gzip of rotated log files (in chunks, see log_index.compress), and
+    retention: at most backup_count rotated files are kept over every date and
+    source, so the logs on disk stay bounded even before compression.
+    """
+
+    def __init__(self, directory, backup_count):
+        self.directory = os.path.abspath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+        self.backup_count = backup_count
+        self.index = None  # Opened by the compressor thread
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="log-compress", daemon=True)
+        self.thread.start()
+
+        # Rotated by this source but not compressed yet (e.g. stopped during compression)
+        for path, _ in _rotated_files(self.directory):
+            parsed = _parse_log_name(os.path.basename(path))
+            if parsed[0] == LOG_SOURCE and not parsed[3]:
+                self.submit(path)
+        self.submit(None)  # Apply the retention once at start
+
+    def submit(self, path):
+        self.queue.put(path)
+
+    def _run(self):
+        self.index = log_index.LogIndex(self.directory)
+        try:
+            self.index.prune()
+        except sqlite3.Error as e:
+            print(f"[Log] Could not prune the log index: {e}")
+
+        while True:
+            path = self.queue.get()
+            try:
+                if path is not None:
+                    self._compress(path)
+                self._apply_retention()
+            except Exception as e:
+                print(f"[Log] Could not compress {path}: {e}")
+
+    def _compress(self, path):
+        if not os.path.exists(path):
+            return
+        temporary = path + ".gz.tmp"
+        chunks = log_index.compress(path, temporary)
+        os.replace(temporary, path + ".gz")
+        # Switch the index to the .gz before the .txt disappears
+        self.index.compressed_file(os.path.basename(path), os.path.basename(path) + ".gz", chunks)
+        os.remove(path)
+
+    def _apply_retention(self):
+        rotated = _rotated_files(self.directory)
+        removed = []
+        for path, _ in rotated[:max(0, len(rotated) - self.backup_count)]:
+            try:
+                os.remove(path)
+                removed.append(os.path.basename(path))
+            except OSError:
+                pass
+        if removed:
+            self.index.remove_files(removed)
+
+
+class _BatchingQueueListener(QueueListener):
+    # Handles everything queued, then flushes the file once per batch
+
+    def enqueue_sentinel(self):
+        # Waits for room: the listener is still draining a full queue
+        self.queue.put(self._sentinel)
+
+    def _monitor(self):
+        while True:
+            record = self.queue.get()
+            if record is self._sentinel:
+                break
+            self.handle(record)
+
+            stop = False
+            while True:
+                try:
+                    record = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is self._sentinel:
+                    stop = True
+                    break
+                self.handle(record)
+
+            for handler in self.handlers:
+                handler.flush()
+            if stop:
+                break
+
+
+class _DroppingQueueHandler(QueueHandler):
+    # Never blocks the caller: a full queue drops the record
+    def enqueue(self, record):
+        global file_log_dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            file_log_dropped += 1
+
+
+_file_queue = queue.Queue(maxsize=max(1, int(environment.LOG_FILE_QUEUE_SIZE)))
+_file_handler = None
+_file_listener = None
+_compressor = None
+file_log_dropped = 0
+
+def _stop_file_listener():
+    if _file_listener is not None and _file_listener._thread is not None:
+        _file_listener.stop()  # Writes everything queued before returning
+    if _file_handler is not None:
+        _file_handler.close()
 
 # ------------------------------------------------------
 # Configure Logging Dynamically
 # ------------------------------------------------------
-def configure_logging(max_bytes, backup_count):
-    global logger
+def configure_logging(max_bytes, backup_count, persist=True):
+    global _file_handler, _file_listener, _compressor
 
-    # Update data
-    environment_manager.update_logging_configuration(max_bytes, backup_count)
+    # Update data (not at import: every TCP worker process imports this module)
+    if persist:
+        environment_manager.update_logging_configuration(max_bytes, backup_count)
 
-    # Remove existing handlers
-    for handler in logger.handlers[:]:
-        logger.removeHandler(handler)
+    # Let the current listener write what it has, then swap the handler
+    _stop_file_listener()
+
+    if _compressor is None:
+        _compressor = _LogCompressor(environment.LOG_DIR, backup_count)
+    else:
+        _compressor.backup_count = backup_count
+        _compressor.submit(None)
 
-    # Create a new handler with updated settings
-    log_handler = CustomRotatingFileHandler("system_logs.txt", maxBytes=max_bytes, backupCount=backup_count)
+    log_handler = LogFileHandler(environment.LOG_DIR, max_bytes, _compressor)
     log_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-    
-    # Apply the new handler
-    logger.addHandler(log_handler)
+
+    _file_handler = log_handler
+    _file_listener = _BatchingQueueListener(_file_queue, log_handler)
+    _file_listener.start()
+
+    # The root logger only enqueues
+    for handler in logger.handlers[:]:
+        if not isinstance(handler, _DroppingQueueHandler):
+            logger.removeHandler(handler)
+    if not logger.handlers:
+        logger.addHandler(_DroppingQueueHandler(_file_queue))
+
+# ------------------------------------------------------
+# Runtime log settings. Read on the hot path from
+# these globals only; the writer thread refreshes
+# them from SETTINGS_KEY every
+# LOG_SETTINGS_POLL_INTERVAL seconds.
+# ------------------------------------------------------
+log_level = LEVELS.get(str(environment.LOG_LEVEL).upper(), INFO)
+packet_sample = max(0, int(environment.LOG_PACKET_SAMPLE or 0))
+capture_devices = frozenset()     # Device IDs whose packets are always logged in full
+
+_sample_counters = {}
+
+def is_enabled(level):
+    return level >= log_level
+
+# True for 1 in packet_sample calls per key (cheap, no randomness)
+def sample(key):
+    if packet_sample <= 0:
+        return False
+    count = _sample_counters.get(key, 0) + 1
+    _sample_counters[key] = count
+    return count % packet_sample == 0
+
+def is_captured(device_id):
+    return device_id in capture_devices
+
+def get_settings():
+    return {
+        "level": logging.getLevelName(log_level),
+        "packet_sample": packet_sample,
+        "capture_devices": sorted(capture_devices),
+    }
+
+def _apply_settings(values):
+    global log_level, packet_sample, capture_devices
+
+    level = LEVELS.get(str(values.get("level", "")).upper())
+    if level is not None:
+        log_level = level
+
+    try:
+        packet_sample = max(0, int(values.get("packet_sample", packet_sample)))
+    except (TypeError, ValueError):
+        pass
+
+    if "capture_devices" in values:
+        capture_devices = frozenset(_parse_device_ids(values["capture_devices"]))
+
+def _parse_device_ids(text):
+    return [device_id.strip().lower() for device_id in str(text).replace(",", " ").split() if device_id.strip()]
+
+def _poll_settings():
+    try:
+        values = redis_client.hgetall(SETTINGS_KEY)
+    except redis.RedisError:
+        return  # Keep the current settings
+    if values:
+        _apply_settings(values)
+
+# ------------------------------------------------------
+# Validate and store new settings (system log page).
+# Applied here at once and by the TCP server
+# processes within LOG_SETTINGS_POLL_INTERVAL.
+# Raises ValueError on invalid input.
+# ------------------------------------------------------
+def update_settings(level, sample_every, devices):
+    level = str(level).upper()
+    if level not in LEVELS:
+        raise ValueError(f"Unknown level {level}, expected one of {', '.join(LEVELS)}")
+
+    sample_every = int(sample_every)
+    if sample_every < 0:
+        raise ValueError("Packet sampling must be 0 or more")
+
+    device_ids = _parse_device_ids(devices)
+    for device_id in device_ids:
+        try:
+            bytes.fromhex(device_id)
+        except ValueError:
+            raise ValueError(f"Invalid device ID {device_id}, expected hex")
+
+    values = {"level": level, "packet_sample": sample_every, "capture_devices": ",".join(device_ids)}
+    redis_client.hset(SETTINGS_KEY, mapping=values)
+    _apply_settings(values)
 
 # ------------------------------------------------------
 # Log message to Redis and store it locally.
+#
+# Only queues the message: a background writer thread
+# pushes batches to Redis (one pipelined round trip)
+# and to the log file (one write). Never blocks and
+# never raises, so it is safe inside handle_client
+# and the paho threads.
 # ------------------------------------------------------
-def log_to_redis(message):
-    logs = redis_client.lrange(LOG_KEY, -10, -1)  # Get the last 10 logs
+_log_queue = None
+_writer_thread = None
+_writer_lock = threading.Lock()
+
+log_dropped = 0                 # Messages dropped because the queue was full
+redis_available = True
+fallback_logs = None            # Ring buffer of messages Redis has not received yet
+_recent = deque(maxlen=10)      # Last messages pushed, for the duplicate check
 
-    if message not in logs:
-        redis_client.rpush(LOG_KEY, message)
-        redis_client.ltrim(LOG_KEY, -1000, -1)  # Keep last 10000 logs
+def log_to_redis(message, level=INFO):
+    global log_dropped
 
-        logger.info(message)   # Store log locally
+    if level < log_level:
+        return
+
+    if _writer_thread is None:
+        _start_writer()
+
+    try:
+        _log_queue.put_nowait((time.time(), level, message))
+    except queue.Full:
+        log_dropped += 1
+
+def _start_writer():
+    global _log_queue, _writer_thread, fallback_logs
+
+    with _writer_lock:
+        if _writer_thread is not None:
+            return
+
+        _log_queue = queue.Queue(maxsize=max(1, int(environment.LOG_QUEUE_SIZE)))
+        fallback_logs = deque(maxlen=max(1, int(environment.LOG_FALLBACK_SIZE)))
+
+        _poll_settings()
+
+        thread = threading.Thread(target=_writer_loop, name="log-writer", daemon=True)
+        thread.start()
+        _writer_thread = thread
+
+        atexit.register(flush_logs)
+
+# ------------------------------------------------------
+# Writer thread
+# ------------------------------------------------------
+def _writer_loop():
+    batch_size = max(1, int(environment.LOG_BATCH_SIZE))
+    poll_interval = max(0.1, float(environment.LOG_SETTINGS_POLL_INTERVAL))
+    retry_at = 0.0
+    reported_dropped = 0
+    settings_due = time.monotonic() + poll_interval
+
+    while True:
+        if time.monotonic() >= settings_due:
+            _poll_settings()
+            settings_due = time.monotonic() + poll_interval
+
+        try:
+            batch = [_log_queue.get(timeout=poll_interval)]
+        except queue.Empty:
+            continue
+        while len(batch) < batch_size:
+            try:
+                batch.append(_log_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        done = [item for item in batch if item is None]  # flush_logs() markers
+        batch = [item for item in batch if item is not None]
+
+        try:
+            # Same rule as before: skip a message equal to one of the last 10
+            messages = []
+            for created, level, message in batch:
+                if message in _recent:
+                    continue
+                _recent.append(message)
+                messages.append((created, level, message))
+
+            if messages:
+                _write_file(messages)
+
+                if redis_available or time.monotonic() >= retry_at:
+                    if not _push_redis([(level, message) for _, level, message in messages]):
+                        retry_at = time.monotonic() + REDIS_RETRY_INTERVAL
+                else:
+                    fallback_logs.extend((level, message) for _, level, message in messages)
+
+            if log_dropped != reported_dropped:
+                logger.warning(f"[Log] Queue full, {log_dropped - reported_dropped} message(s) dropped.")
+                reported_dropped = log_dropped
+        except Exception as e:
+            # The thread must survive anything, otherwise every later log is lost
+            print(f"[Log] Writer error: {e}")
+
+        for _ in done:
+            _log_queue.task_done()
+        for _ in batch:
+            _log_queue.task_done()
+
+def _write_file(messages):
+    records = [
+        logger.makeRecord(logger.name, level, __file__, 0, message, None, None)
+        for _, level, message in messages
+    ]
+    for record, (created, _, _) in zip(records, messages):
+        record.created = created  # Time of the call, not of the write
+        record.msecs = (created - int(created)) * 1000
+
+    # Straight to the handlers: DEBUG records must pass the root logger's INFO level
+    for handler in logger.handlers:
+        for record in records:
+            handler.handle(record)
+
+def _push_redis(entries):
+    global redis_available
+
+    # Whatever piled up while Redis was down goes first, in order
+    if fallback_logs:
+        entries = list(fallback_logs) + entries
+
+    started = time.perf_counter()
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for level, message in entries:
+            # "~" trimming: Redis drops whole nodes, far cheaper than an exact MAXLEN
+            pipe.xadd(LOG_STREAM_KEY, {"m": message, "l": level}, maxlen=LOG_MAX_ENTRIES, approximate=True)
+        pipe.ttl(LOG_STREAM_KEY)
+        ttl = pipe.execute()[-1]
 
         # Only set expiry if not already set!
-        if redis_client.ttl(LOG_KEY) == -1:
-            redis_client.expire(LOG_KEY, 7*24*60*60)  # Auto-delete after 7 days
+        if ttl == -1:
+            redis_client.expire(LOG_STREAM_KEY, LOG_TTL)
+    except redis.RedisError as e:
+        fallback_logs.clear()
+        fallback_logs.extend(entries)  # Oldest are dropped once the ring buffer is full
+        if redis_available:
+            redis_available = False
+            logger.warning(f"[Log] Redis unreachable ({e}), keeping the last {fallback_logs.maxlen} logs in memory.")
+        return False
+
+    metrics.redis_latency.observe(time.perf_counter() - started)
+    fallback_logs.clear()
+    if not redis_available:
+        redis_available = True
+        logger.warning("[Log] Redis reachable again, buffered logs pushed.")
+    return True
+
+# ------------------------------------------------------
+# Wait until everything queued so far is written
+# (called at exit)
+# ------------------------------------------------------
+def flush_logs(timeout=5):
+    if _writer_thread is None or not _writer_thread.is_alive():
+        return
+
+    try:
+        _log_queue.put(None, timeout=timeout)
+    except queue.Full:
+        return
+
+    deadline = time.monotonic() + timeout
+    with _log_queue.all_tasks_done:
+        while _log_queue.unfinished_tasks:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            _log_queue.all_tasks_done.wait(remaining)
+
+def get_log_stats():
+    return {
+        "queued": _log_queue.qsize() if _log_queue is not None else 0,
+        "dropped": log_dropped,
+        "redis_available": redis_available,
+        "fallback": len(fallback_logs) if fallback_logs is not None else 0,
+        "file_queued": _file_queue.qsize(),
+        "file_dropped": file_log_dropped,
+    }
+
+metrics.register_collector("log", get_log_stats)
+metrics.register_collector("config", environment_manager.get_config_stats)
 
 # Initialize Logger
 logger = logging.getLogger()
@@ -113,7 +651,8 @@ logger.setLevel(logging.INFO)
 
 max_bytes, backup_count = environment_manager.get_logging_configuration()
 
-configure_logging(max_bytes, backup_count)
+configure_logging(max_bytes, backup_count, persist=False)
+atexit.register(_stop_file_listener)  # Runs after flush_logs, which is registered later
 # ------------------------------------------------------
 # System log home
 # ------------------------------------------------------
@@ -130,26 +669,246 @@ def system_log_home():
     return render_template("system_log.html")
 
 # ------------------------------------------------------
-# Fetch logs from Redis and remove duplicates 
-# before returning.
+# Live tail fan-out.
+#
+# One "log-tail" thread per Flask process reads the
+# stream with a blocking XREAD and hands each new
+# entry to every connected browser whose filters
+# match. However many pages are open, Redis sees one
+# reader; with no page open the thread idles
+# without touching Redis.
+# ------------------------------------------------------
+class _TailSubscriber:
+    __slots__ = ("queue", "min_level", "device", "text", "after", "dropped")
+
+    def __init__(self, min_level, device, text, after):
+        self.queue = queue.Queue(maxsize=TAIL_QUEUE_SIZE)
+        self.min_level = min_level
+        self.device = device      # Lower-case device ID, "" = any
+        self.text = text          # Substring, "" = any
+        self.after = after        # Stream ID tuple, entries up to it were already seen
+        self.dropped = 0
+
+    def matches(self, entry):
+        entry_id, level, message = entry
+        if level < self.min_level:
+            return False
+        if self.after is not None and _stream_id(entry_id) <= self.after:
+            return False
+        if self.device and self.device not in message.lower():
+            return False
+        if self.text and self.text not in message:
+            return False
+        return True
+
+    def offer(self, entry):
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+
+_tail_lock = threading.Lock()
+_tail_subscribers = set()
+_tail_backlog = deque(maxlen=TAIL_BACKLOG)  # (id, level, message) of the newest entries
+_tail_thread = None
+_tail_wakeup = threading.Event()
+
+def _stream_id(entry_id):
+    milliseconds, _, sequence = str(entry_id).partition("-")
+    return int(milliseconds), int(sequence or 0)
+
+def _tail_entry(entry_id, fields):
+    try:
+        level = int(fields.get("l", INFO))
+    except ValueError:
+        level = INFO
+    return entry_id, level, fields.get("m", "")
+
+def _publish_tail(entries):
+    # Caller holds _tail_lock
+    for entry in entries:
+        _tail_backlog.append(entry)
+        for subscriber in _tail_subscribers:
+            if subscriber.matches(entry):
+                subscriber.offer(entry)
+
+def _tail_loop():
+    last_id = None
+
+    while True:
+        with _tail_lock:
+            idle = not _tail_subscribers
+            if idle:
+                _tail_backlog.clear()  # Stale by the time someone connects again
+                _tail_wakeup.clear()
+        if idle:
+            last_id = None
+            _tail_wakeup.wait()
+            continue
+
+        try:
+            if last_id is None:
+                # Seed the backlog with the newest entries, then follow the stream
+                seed = [_tail_entry(entry_id, fields) for entry_id, fields in
+                        redis_client.xrevrange(LOG_STREAM_KEY, count=TAIL_BACKLOG)[::-1]]
+                with _tail_lock:
+                    _publish_tail(seed)
+                last_id = seed[-1][0] if seed else "0-0"
+
+            response = redis_client.xread({LOG_STREAM_KEY: last_id}, count=LOG_FETCH_LIMIT, block=TAIL_BLOCK_MS)
+            if not response:
+                continue
+
+            entries = [_tail_entry(entry_id, fields) for entry_id, fields in response[0][1]]
+            with _tail_lock:
+                _publish_tail(entries)
+            last_id = entries[-1][0]
+        except redis.RedisError as e:
+            print(f"[Log] Live tail cannot read Redis: {e}")
+            time.sleep(REDIS_RETRY_INTERVAL)
+
+def _subscribe(min_level, device, text, after):
+    global _tail_thread
+
+    subscriber = _TailSubscriber(min_level, device, text, after)
+    with _tail_lock:
+        backlog = [entry for entry in _tail_backlog if subscriber.matches(entry)]
+        _tail_subscribers.add(subscriber)
+
+        if _tail_thread is None:
+            _tail_thread = threading.Thread(target=_tail_loop, name="log-tail", daemon=True)
+            _tail_thread.start()
+    _tail_wakeup.set()
+    return subscriber, backlog
+
+def _unsubscribe(subscriber):
+    with _tail_lock:
+        _tail_subscribers.discard(subscriber)
+
+def _sse_event(entry):
+    entry_id, level, message = entry
+    data = json.dumps({"level": logging.getLevelName(level), "message": message})
+    return f"id: {entry_id}\ndata: {data}\n\n"
+
+# ------------------------------------------------------
+# Fetch logs from the Redis Stream.
+#   /get_logs            the newest LOG_FETCH_LIMIT entries
+#   /get_logs?after=<id> only the entries after stream
+#                        ID <id> (incremental polling)
+# "last_id" is the cursor for the next call.
+# (Duplicates are already skipped by the log writer.)
 # ------------------------------------------------------
 @system_log_bp.route("/get_logs", methods=["GET"])
 def get_logs():
+    after = request.args.get("after")
     try:
-        logs = redis_client.lrange(LOG_KEY, 0, -1)  # Fetch all logs
-        logs = list(dict.fromkeys(logs))  # Remove duplicates while keeping order
+        if after:
+            response = redis_client.xread({LOG_STREAM_KEY: after}, count=LOG_FETCH_LIMIT)
+            entries = response[0][1] if response else []
+        else:
+            entries = redis_client.xrevrange(LOG_STREAM_KEY, count=LOG_FETCH_LIMIT)[::-1]
 
-        return jsonify({"success": True, "logs": logs})
+        last_id = entries[-1][0] if entries else after
+        return jsonify({
+            "success": True,
+            "logs": [fields.get("m", "") for _, fields in entries],
+            "levels": [logging.getLevelName(int(fields.get("l", INFO))) for _, fields in entries],
+            "last_id": last_id,
+        })
+    except redis.ResponseError as e:
+        # Malformed cursor from the client
+        return jsonify({"success": False, "message": f"Invalid log cursor: {str(e)}"}), 400
     except Exception as e:
         return jsonify({"success": False, "message": f"Error fetching logs: {str(e)}"}), 500
 
+# ------------------------------------------------------
+# Live tail as server-sent events.
+#   /stream_logs?level=WARNING&device=<id>&q=<text>
+# level: minimum level, device: device ID contained in
+# the message, q: substring (all optional).
+# A reconnecting EventSource sends Last-Event-ID and
+# only gets what it missed from the recent backlog.
+# ------------------------------------------------------
+@system_log_bp.route("/stream_logs", methods=["GET"])
+def stream_logs():
+    min_level = LEVELS.get(request.args.get("level", "DEBUG").upper(), DEBUG)
+    device = request.args.get("device", "").strip().lower()
+    text = request.args.get("q", "").strip()
+
+    after = request.headers.get("Last-Event-ID") or request.args.get("after")
+    try:
+        after = _stream_id(after) if after else None
+    except ValueError:
+        after = None
+
+    subscriber, backlog = _subscribe(min_level, device, text, after)
+
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            for entry in backlog:
+                yield _sse_event(entry)
+
+            while True:
+                try:
+                    entry = subscriber.queue.get(timeout=TAIL_KEEPALIVE)
+                except queue.Empty:
+                    yield ": keepalive\n\n"  # Also how a closed browser tab is noticed
+                    continue
+                yield _sse_event(entry)
+        finally:
+            _unsubscribe(subscriber)
+
+    return Response(generate(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# ------------------------------------------------------
+# Search the log files (current and rotated) through
+# the index, for what is older than the Redis stream.
+#   /search_logs?device=<id>&ip=<ip>&start=<t>&end=<t>&q=<text>
+# start/end: "YYYY-MM-DDTHH:MM[:SS]" (server local
+# time) or a Unix timestamp; default: the last hour.
+# ------------------------------------------------------
+def _parse_time(value):
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+@system_log_bp.route("/search_logs", methods=["GET"])
+def search_logs():
+    device = request.args.get("device", "").strip()
+    ip = request.args.get("ip", "").strip()
+    text = request.args.get("q", "").strip()
+    try:
+        end = _parse_time(request.args["end"]) if request.args.get("end", "").strip() else time.time()
+        start = _parse_time(request.args["start"]) if request.args.get("start", "").strip() else end - 3600
+        limit = min(max(1, int(request.args.get("limit", LOG_FETCH_LIMIT))), LOG_FETCH_LIMIT)
+    except ValueError as e:
+        return jsonify({"success": False, "message": f"Invalid search parameters: {str(e)}"}), 400
+
+    if start > end:
+        return jsonify({"success": False, "message": "The start time is after the end time."}), 400
+
+    try:
+        index = log_index.LogIndex(environment.LOG_DIR)
+        try:
+            lines, truncated = index.search(device, ip, start, end, text, limit)
+        finally:
+            index.close()
+        return jsonify({"success": True, "logs": lines, "truncated": truncated})
+    except Exception as e:
+        return jsonify({"success": False, "message": f"Error searching logs: {str(e)}"}), 500
+
 # ------------------------------------------------------
 # Route: Clear Logs from Redis
 # ------------------------------------------------------
 @system_log_bp.route("/clear_logs", methods=["POST"])
 def clear_logs():
     try:
-        redis_client.delete(LOG_KEY)  # Delete log key from Redis
+        redis_client.delete(LOG_STREAM_KEY, LOG_KEY)  # Delete log keys from Redis
         return jsonify({"success": True, "message": "Logs cleared successfully"})
     except Exception as e:
         return jsonify({"success": False, "message": f"Error clearing logs: {str(e)}"}), 500
@@ -188,4 +947,24 @@ def update_logging_config():
 
         return jsonify({"success": True, "message": "Logging configuration updated successfully!"})
     except ValueError:
-        return jsonify({"success": False, "message": "Invalid input. Please enter valid numbers!"})
\ No newline at end of file
+        return jsonify({"success": False, "message": "Invalid input. Please enter valid numbers!"})
+
+# ------------------------------------------------------
+# Runtime log settings (level, sampling, capture)
+# ------------------------------------------------------
+@system_log_bp.route("/get_log_settings", methods=["GET"])
+def get_log_settings():
+    _poll_settings()
+    return jsonify({"success": True, **get_settings()})
+
+@system_log_bp.route("/update_log_settings", methods=["POST"])
+def update_log_settings():
+    try:
+        update_settings(request.form.get("level", "INFO"),
+                        request.form.get("packetSample", packet_sample),
+                        request.form.get("captureDevices", ""))
+        return jsonify({"success": True, "message": "Log settings updated, applied by the TCP server within a few seconds."})
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)})
+    except redis.RedisError as e:
+        return jsonify({"success": False, "message": f"Error saving log settings: {str(e)}"}), 500
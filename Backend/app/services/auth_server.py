@@ -1,7 +1,8 @@
-import time
 import socket
 import app.environment.environment_manager as environment_manager
 import app.services.http_client as http_client
+import app.services.status_registry as status_registry
+import app.services.control_channel as control_channel
 import uuid
 
 from flask import session
@@ -102,11 +103,13 @@ def authenticate_user(username, password):
 
     if auth_token:
         environment_manager.update_auth_token(auth_token)
+        control_channel.request_reload()
 
         print(f"[INFO] AUTH_TOKEN received for user '{username}': {auth_token}")
         return True, "/server_configuration"
     else:
         environment_manager.update_auth_token(None)
+        control_channel.request_reload()
         print(f"[ERROR] Authentication failed: Invalid username/password for '{username}'")
         return False, "/server_configuration"  # Redirect back to login page
         
@@ -167,29 +170,32 @@ async def process_aws_connection_check():
 
 # -----------------------------------------------
 # Check TCP Server & AWS IoT Status
+# since: version the page already shows. With
+# wait > 0 the call blocks (no polling) until the
+# status moves past it or wait seconds have passed.
+# "busy": too many pages waiting, ask again later.
 # -----------------------------------------------
-def check_tcp_aws_status():
-
-    environment_manager.reload_environment()
-
-    timeout = 10  # Stop waiting after 10 seconds
-    start_time = time.time()
-
-    while time.time() - start_time < timeout:
-        tcp_status = environment_manager.get_status_tcp_server()
-        aws_status = environment_manager.get_status_aws_server()
+def check_tcp_aws_status(since=None, wait=0):
+    if since is not None and wait > 0:
+        status, waited = status_registry.wait_for_change(since, wait)
+    else:
+        status, waited = status_registry.current_status(), True
 
-        # Return immediately if both statuses are determined
-        if tcp_status is not None and aws_status is not None:
-            return {
-                "tcp_status": "running" if tcp_status else "stopping",
-                "aws_status": "connected" if aws_status else "disconnected"
-            }
+    # Redis unreachable
+    if status is None:
+        return {
+            "tcp_status": "timeout",
+            "aws_status": "timeout",
+            "version": since,
+            "busy": True
+        }
 
-        time.sleep(0.5)  # Avoid CPU overuse
+    tcp_status = status["tcp"]
+    aws_status = status["aws"]
 
-    # If timed out, return timeout response
     return {
-        "tcp_status": "timeout",
-        "aws_status": "timeout"
-    }
\ No newline at end of file
+        "tcp_status": "unknown" if tcp_status is None else "running" if tcp_status else "stopping",
+        "aws_status": "unknown" if aws_status is None else "connected" if aws_status else "disconnected",
+        "version": status["version"],
+        "busy": not waited
+    }
@@ -0,0 +1,158 @@
+# -----------------------------------------------
+# Control channel between the web UI and the TCP
+# backend (control_server.main)
+#
+# A Unix domain socket at CONTROL_SOCKET, one JSON
+# object per line each way:
+#
+#   -> {"command": "start"}
+#   <- {"success": true, "message": "...", "status": {...}}
+#
+# Commands: start, stop, reload (re-read
+# environment.py now), status. They take effect as
+# soon as they arrive instead of on the next pass
+# of a polling loop.
+# -----------------------------------------------
+import asyncio
+import json
+import os
+import socket
+import stat
+
+import app.environment.environment as environment
+
+COMMANDS = ("start", "stop", "reload", "status")
+
+# Longest request line accepted by the backend
+MAX_REQUEST = 4096
+
+# -----------------------------------------------
+# Global variables (backend)
+# -----------------------------------------------
+_server = None
+_lock = None          # One command at a time: a start never overlaps a stop
+
+# -----------------------------------------------
+# Backend: serve commands. handler(command) is a
+# coroutine function returning the response dict.
+# -----------------------------------------------
+def _socket_path():
+    return os.path.abspath(environment.CONTROL_SOCKET)
+
+def _in_use(path):
+    # True if a live backend answers on path (a stale socket file is not)
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.settimeout(1)
+        probe.connect(path)
+        return True
+    except OSError:
+        return False
+    finally:
+        probe.close()
+
+async def start_server(handler):
+    global _server, _lock
+
+    if _server is not None:
+        return
+
+    path = _socket_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path):
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            raise OSError(f"{path} exists and is not a socket")
+        if _in_use(path):
+            raise OSError(f"another backend is listening on {path}")
+        os.remove(path)  # Left over by a backend that did not exit cleanly
+
+    _lock = asyncio.Lock()
+
+    async def serve(reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = await _dispatch(handler, line)
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    _server = await asyncio.start_unix_server(serve, path=path, limit=MAX_REQUEST)
+    os.chmod(path, 0o600)  # Only the user running the UI and the backend
+
+async def _dispatch(handler, line):
+    try:
+        request = json.loads(line)
+        command = request["command"]
+    except (ValueError, KeyError, TypeError):
+        return {"success": False, "message": "Malformed request"}
+
+    if command not in COMMANDS:
+        return {"success": False, "message": f"Unknown command {command!r}"}
+
+    async with _lock:
+        try:
+            return await handler(command)
+        except Exception as e:
+            return {"success": False, "message": f"{command} failed: {e}"}
+
+async def stop_server():
+    global _server
+
+    if _server is None:
+        return
+    _server.close()
+    await _server.wait_closed()
+    _server = None
+
+    try:
+        os.remove(_socket_path())
+    except OSError:
+        pass
+
+# -----------------------------------------------
+# UI side: send one command and wait for the
+# answer (blocking, called from Flask requests)
+# -----------------------------------------------
+def send_command(command, timeout=None):
+    """
+    Returns the backend's response dict. If the backend cannot be reached (not running,
+    or no answer within CONTROL_TIMEOUT), returns {"success": False, "reachable": False,
+    "message": ...}.
+    """
+    timeout = environment.CONTROL_TIMEOUT if timeout is None else timeout
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.settimeout(timeout)
+        client.connect(_socket_path())
+        client.sendall(json.dumps({"command": command}).encode() + b"\n")
+
+        data = b""
+        while not data.endswith(b"\n"):
+            chunk = client.recv(65536)
+            if not chunk:
+                raise ConnectionError("connection closed by the backend")
+            data += chunk
+
+        response = json.loads(data)
+        response.setdefault("reachable", True)
+        return response
+    except (OSError, ValueError) as e:
+        return {"success": False, "reachable": False, "message": f"TCP backend not reachable: {e}"}
+    finally:
+        client.close()
+
+# -----------------------------------------------
+# UI side: settings the backend uses (AUTH_TOKEN,
+# endpoint, facility, certificates) were just
+# saved, have it re-read environment.py now. A
+# stopped backend reads them when it starts.
+# -----------------------------------------------
+def request_reload():
+    return send_command("reload", timeout=2)
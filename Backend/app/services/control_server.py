@@ -3,13 +3,22 @@
 # -----------------------------------------------
 import app.services.http_client as http_client
 import app.services.handle_data as handle_data
+import app.services.protocol_codec as protocol_codec
+import app.services.mqtt_publisher as mqtt_publisher
+import app.services.telemetry_batcher as telemetry_batcher
+import app.services.publish_spool as publish_spool
+import app.services.telemetry_encoder as telemetry_encoder
+import app.services.tcp_workers as tcp_workers
+import app.services.ingest_pipeline as ingest_pipeline
+import app.services.device_sessions as device_sessions
+import app.services.metrics as metrics
+import app.services.control_channel as control_channel
+import app.services.status_registry as status_registry
 
 
 import asyncio
-import numpy as np
+import itertools
 import json
-import ssl
-import paho.mqtt.client as mqtt
 import os
 
 from datetime import datetime
@@ -30,17 +39,15 @@ import app.routes.api.system_log as system_log
 # -----------------------------------------------
 server = None  # Store server reference
 
-# Global counter (uint32)
-count = np.uint32(0)
-
-# Maps client_ip -> client_id_hex
-ip_to_id_map = {}
-
-# Maps client_ip -> current writer (so we can close the old writer if the same IP reconnects)
-ip_to_writer_map = {}
+# Connected devices (writer, IP, ID, counters) live in device_sessions
 
 server = None  # Stores the running TCP server task
 server_task = None  # Stores the running TCP server task
+reaper_task = None  # Closes connections idle for longer than TCP_IDLE_TIMEOUT
+
+# Connection admission / reaping counters since start
+connections_rejected = 0
+connections_reaped = 0
 
 
 # -----------------------------------------------
@@ -48,31 +55,67 @@ server_task = None  # Stores the running TCP server task
 # -----------------------------------------------
 async def start_tcp_server():
     global server_task
-    if server_task is None:  # Prevent multiple instances
+    if server_task is None and not tcp_workers.is_running():  # Prevent multiple instances
         print("[INFO] Starting TCP Server...")
         system_log.log_to_redis("[INFO] Starting TCP Server...")
-        server_task = asyncio.create_task(run_tcp_server())
+
+        if environment.TCP_WORKER_PROCESSES > 1:
+            # Each worker runs its own server, MQTT pool, spool and batcher
+            tcp_workers.start(environment.TCP_WORKER_PROCESSES)
+        else:
+            # One shared pool of MQTT connections for every device
+            mqtt_publisher.start(on_publish=on_publish)
+            publish_spool.start()
+            telemetry_batcher.start()
+            ingest_pipeline.start(process_records, publish_sample)
+
+            server_task = asyncio.create_task(run_tcp_server())
         
         # Update status of server
-        environment_manager.update_status_tcp_server(True)
+        status_registry.set_tcp_status(True)
+
+# -----------------------------------------------
+# Start the TCP server inside worker process
+# 'index' (multi-process mode, see tcp_workers)
+# -----------------------------------------------
+async def start_worker_server(index):
+    global server_task
+
+    # Client IDs and spool directories must not clash between workers
+    if environment.METRICS_PORT:
+        await start_metrics_server(environment.METRICS_PORT + index + 1)
+
+    mqtt_publisher.start(on_publish=on_publish, client_id_prefix=f"{environment.TCP_SERVER_NAME}-w{index}")
+    publish_spool.start(os.path.join(environment.SPOOL_DIR, f"worker-{index}"))
+    telemetry_batcher.start()
+    ingest_pipeline.start(process_records, publish_sample)
+
+    server_task = asyncio.create_task(run_tcp_server(reuse_port=True))
 
 # -----------------------------------------------
 # TCP Server Runner
 # -----------------------------------------------
-async def run_tcp_server():
-    global server, server_task
+async def run_tcp_server(reuse_port=False):
+    global server, server_task, reaper_task
 
     if server is not None:  # Prevent multiple instances
         print("[WARNING] TCP Server is already running.")
-        system_log.log_to_redis("[WARNING] TCP Server is already running.")
+        system_log.log_to_redis("[WARNING] TCP Server is already running.", system_log.WARNING)
         return
     try:
         server = await asyncio.start_server(
             control_server.handle_client,
             host=environment.TCP_SERVER_HOST,
-            port=environment.TCP_SERVER_PORT
+            port=environment.TCP_SERVER_PORT,
+            reuse_port=reuse_port
         )
 
+        # Accepted sockets inherit these options from the listener (Linux)
+        for sock in server.sockets:
+            configure_keepalive(sock)
+
+        reaper_task = asyncio.create_task(reap_idle_connections())
+
         addrs = ', '.join(str(sock.getsockname()) for sock in server.sockets)
 
         print(f"[Async] TCP Server is running on {addrs}")
@@ -82,36 +125,167 @@ async def run_tcp_server():
             await server.serve_forever()
 
         print("[DEBUG] Waiting 2 seconds before starting server...")
-        system_log.log_to_redis("[DEBUG] Waiting 2 seconds before starting server...")
+        system_log.log_to_redis("[DEBUG] Waiting 2 seconds before starting server...", system_log.DEBUG)
 
         await asyncio.sleep(2)
 
     
     except OSError as e:
         print(f"[ERROR] Failed to start TCP Server: {e}")
-        system_log.log_to_redis(f"[ERROR] Failed to start TCP Server: {e}")
+        system_log.log_to_redis(f"[ERROR] Failed to start TCP Server: {e}", system_log.ERROR)
         
+# -----------------------------------------------
+# TCP keepalive on the listening socket, so dead
+# peers (no FIN) are detected by the kernel
+# -----------------------------------------------
+def configure_keepalive(sock):
+    if not environment.TCP_KEEPALIVE:
+        return
+
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+    # Not every platform has the per-socket knobs
+    for option, value in (("TCP_KEEPIDLE", environment.TCP_KEEPALIVE_IDLE),
+                          ("TCP_KEEPINTVL", environment.TCP_KEEPALIVE_INTERVAL),
+                          ("TCP_KEEPCNT", environment.TCP_KEEPALIVE_COUNT)):
+        if hasattr(socket, option):
+            sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), int(value))
+
+# -----------------------------------------------
+# Maximum concurrent connections of this process
+# (TCP_MAX_CONNECTIONS is split between workers)
+# -----------------------------------------------
+def max_connections():
+    if not environment.TCP_MAX_CONNECTIONS:
+        return None
+    if tcp_workers.worker_index is not None:
+        return max(1, environment.TCP_MAX_CONNECTIONS // max(1, environment.TCP_WORKER_PROCESSES))
+    return environment.TCP_MAX_CONNECTIONS
+
+# -----------------------------------------------
+# Periodically close connections that sent nothing
+# for TCP_IDLE_TIMEOUT seconds (devices that
+# vanished without a FIN), and report rejections
+# -----------------------------------------------
+async def reap_idle_connections():
+    global connections_reaped
+
+    idle_timeout = environment.TCP_IDLE_TIMEOUT
+    interval = min(idle_timeout / 4, 5) if idle_timeout else 5
+    reported_rejected = connections_rejected
+
+    while True:
+        await asyncio.sleep(interval)
+
+        # Paused readers are quiet because of us, not because the device is gone
+        if idle_timeout and not ingest_pipeline.reading_paused():
+            deadline = time.monotonic() - idle_timeout
+            idle = [session for session in device_sessions.all_sessions() if session.last_seen < deadline]
+
+            for session in idle:
+                # abort(): no FIN handshake with a peer that is gone anyway;
+                # handle_client sees EOF and closes the session
+                session.last_seen = float("inf")  # Not reaped twice
+                session.writer.transport.abort()
+
+            if idle:
+                connections_reaped += len(idle)
+                print(f"[Async] Reaped {len(idle)} idle connection(s) (no data for {idle_timeout}s), {connections_reaped} in total.")
+                system_log.log_to_redis(f"[Async] Reaped {len(idle)} idle connection(s) (no data for {idle_timeout}s), {connections_reaped} in total.")
+
+        if connections_rejected != reported_rejected:
+            print(f"[Async] Rejected {connections_rejected - reported_rejected} connection(s) over the limit of {max_connections()}, {connections_rejected} in total.")
+            system_log.log_to_redis(f"[Async] Rejected {connections_rejected - reported_rejected} connection(s) over the limit of {max_connections()}, {connections_rejected} in total.")
+            reported_rejected = connections_rejected
+
+def get_connection_stats():
+    return {
+        "active": device_sessions.connected_count(),
+        "max": max_connections(),
+        "rejected": connections_rejected,
+        "reaped": connections_reaped,
+    }
+
+# -----------------------------------------------
+# /readyz: (ready, reason) from in-memory state
+# only, cheap enough to be probed every second
+# -----------------------------------------------
+def readiness():
+    if tcp_workers.is_running():
+        stats = tcp_workers.get_stats()
+        if stats["alive"] < stats["processes"]:
+            return False, f"{stats['alive']} of {stats['processes']} TCP workers alive"
+        return True, "ok"
+
+    if server is None or not server.is_serving():
+        return False, "TCP server not running"
+
+    if ingest_pipeline.shedding:
+        return False, "ingest queue full, shedding samples"
+
+    # Without the spool, samples are lost while MQTT is down
+    if not mqtt_publisher.is_connected() and publish_spool.spool_dir is None:
+        return False, "MQTT not connected"
+
+    return True, "ok"
+
+# -----------------------------------------------
+# Serve /metrics, /healthz and /readyz of this
+# process on 'port'
+# -----------------------------------------------
+async def start_metrics_server(port):
+    metrics.register_collector("connections", get_connection_stats)
+    metrics.register_collector("sessions", device_sessions.get_stats)
+    metrics.register_collector("ingest", ingest_pipeline.get_stats)
+    metrics.register_collector("spool", publish_spool.get_stats)
+    metrics.register_collector("mqtt", mqtt_publisher.get_stats)
+    metrics.register_collector("status", status_registry.get_stats)
+    if tcp_workers.worker_index is None:
+        metrics.register_collector("workers", tcp_workers.get_stats)
+    metrics.set_readiness_check(readiness)
+
+    try:
+        await metrics.start_server(environment.METRICS_HOST, port)
+        print(f"[Metrics] Serving /metrics, /healthz and /readyz on port {port}")
+        system_log.log_to_redis(f"[Metrics] Serving /metrics, /healthz and /readyz on port {port}")
+    except OSError as e:
+        print(f"[ERROR] Failed to start metrics endpoint on port {port}: {e}")
+        system_log.log_to_redis(f"[ERROR] Failed to start metrics endpoint on port {port}: {e}", system_log.ERROR)
+
 # -----------------------------------------------
 # Function to stop the TCP server
 # -----------------------------------------------
 async def stop_tcp_server():
-    global server, server_task, ip_to_writer_map
+    global server, server_task, reaper_task
+
+    if tcp_workers.is_running():
+        print("[INFO] Stopping TCP Server workers...")
+        system_log.log_to_redis("[INFO] Stopping TCP Server workers...")
+
+        await tcp_workers.stop()
+        status_registry.set_tcp_status(False)
+        status_registry.reset_aws_status(None)  # Fields of workers that did not stop cleanly
+
+        system_log.log_to_redis("[INFO] TCP Server stopped.")
+        print("[INFO] TCP Server stopped.")
+        return
 
     if server is not None:
         print("[INFO] Stopping TCP Server...")
         system_log.log_to_redis("[INFO] Stopping TCP Server...")
 
         # Close all active client connections
-        for writer in list(ip_to_writer_map.values()):  # Close all active client sockets
+        for session in device_sessions.all_sessions():  # Close all active client sockets
+            writer = session.writer
             writer.close()
             try:
                 await writer.wait_closed()  # Ensure closure
             except Exception as e:
                 print(f"[WARNING] Error closing client socket: {e}")
-                system_log.log_to_redis(f"[WARNING] Error closing client socket: {e}")
+                system_log.log_to_redis(f"[WARNING] Error closing client socket: {e}", system_log.WARNING)
                 writer.transport.abort()  # Force close if needed
 
-        ip_to_writer_map.clear()  # Clear all connections
+        device_sessions.clear()  # Clear all connections
 
         # Stop the server
         server.close()
@@ -119,11 +293,27 @@ async def stop_tcp_server():
             await asyncio.wait_for(server.wait_closed(), timeout=5)
         except asyncio.TimeoutError:
             print("[WARNING] Server took too long to close, forcing shutdown.")
-            system_log.log_to_redis("[WARNING] Server took too long to close, forcing shutdown.")
+            system_log.log_to_redis("[WARNING] Server took too long to close, forcing shutdown.", system_log.WARNING)
 
         server = None
         server_task = None
-        environment_manager.update_status_tcp_server(False)
+
+        if reaper_task is not None:
+            reaper_task.cancel()
+            reaper_task = None
+
+        # Publish the queued samples and the batches still waiting for their window before the pool goes away
+        await ingest_pipeline.stop()
+        await telemetry_batcher.stop()
+        await publish_spool.stop()
+        mqtt_publisher.stop()
+        await http_client.close_session()
+
+        # In multi-process mode the parent owns the server status
+        if tcp_workers.worker_index is None:
+            status_registry.set_tcp_status(False)
+        else:
+            await metrics.stop_server()
 
         system_log.log_to_redis("[INFO] TCP Server stopped.")
         print("[INFO] TCP Server stopped.")
@@ -144,24 +334,248 @@ async def refresh_auth_token():
             system_log.log_to_redis(f"[Auth Refresh] Exception while refreshing token: {e}")
             print(f"[Auth Refresh] Exception while refreshing token: {e}")
 
+# -----------------------------------------------
+# Close our connection for device_id if it was
+# registered before 'since' (the device registered
+# again on another worker process)
+# -----------------------------------------------
+def evict_device(device_id, since):
+    session = device_sessions.get(device_id)
+    if session is None or session.registered_at >= since:
+        return
+
+    print(f"[Async] Closing old connection for ID={device_id} (IP={session.ip}), it reconnected to another worker.")
+    system_log.log_to_redis(f"[Async] Closing old connection for ID={device_id} (IP={session.ip}), it reconnected to another worker.")
+    session.writer.close()
+
+# -----------------------------------------------
+# Bind device_id to this connection and close an
+# older connection of the same device
+# -----------------------------------------------
+def register_session(session, device_id):
+    old_id = session.device_id
+    previous = device_sessions.register(session, device_id)
+
+    if old_id is not None and old_id != device_id and device_sessions.get(old_id) is None:
+        ingest_pipeline.forget(old_id)  # The device changed its ID on this connection
+
+    if previous is not None:
+        print(f"[Async] Closed old connection for ID={device_id} (IP={previous.ip})")
+        system_log.log_to_redis(f"[Async] Closed old connection for ID={device_id} (IP={previous.ip})")
+        previous.writer.close()
+
+    # The same device may still be connected to another worker process
+    tcp_workers.broadcast_evict(device_id)
+
 # -----------------------------------------------
 # Handle MQTT Publish
 # -----------------------------------------------
 def on_publish(client, userdata, mid):
-    environment_manager.update_status_aws_server(True)
+    status_registry.set_aws_status(True)  # Writes only when it was not connected
 
-    print(f"[MQTT] Successfully published message ID={mid}")
-    system_log.log_to_redis(f"[MQTT] Successfully published message ID={mid}")
+    # One per message: sampled at DEBUG (runs in the paho thread)
+    if system_log.is_enabled(system_log.DEBUG) and system_log.sample("puback"):
+        print(f"[MQTT] Successfully published message ID={mid}")
+        system_log.log_to_redis(f"[MQTT] Successfully published message ID={mid}", system_log.DEBUG)
+
+# -----------------------------------------------
+# Turn one parsed 28/36-byte sample into the dict
+# that is published
+# -----------------------------------------------
+def build_sample(client_id, parsed, checked=False):
+    if not checked:
+        handle_data.check_in_out_of_bed(parsed)
+
+    local_time = int(time.time())
+    index_data = {
+        "device_id": client_id,
+        "current_time": local_time,
+    }
+    index_data.update(parsed)  # merges the "parsed" data into index_data
+
+    # Full payload for captured devices, a sample of the rest at DEBUG
+    if system_log.is_captured(client_id):
+        json_data = json.dumps(index_data)
+        print(f"[Capture ID={client_id}] {json_data}")
+        system_log.log_to_redis(f"[Capture ID={client_id}] {json_data}")
+    elif system_log.is_enabled(system_log.DEBUG) and system_log.sample("sample"):
+        json_data = json.dumps(index_data)
+        print(json_data)
+        system_log.log_to_redis(json_data, system_log.DEBUG)
+
+    return index_data
+
+# -----------------------------------------------
+# Publish one sample dict, either straight away or
+# through the batcher (publish task of ingest_pipeline)
+# -----------------------------------------------
+def publish_sample(index_data):
+    client_id = index_data["device_id"]
+
+    if telemetry_batcher.enabled():
+        telemetry_batcher.add(client_id, index_data)
+        return
+
+    topic = http_client.generate_topic(client_id)
+    payload = telemetry_encoder.encode_sample(topic, index_data)
+
+    # Falls back to the disk spool if AWS IoT cannot take the message right now
+    if publish_spool.publish(topic, payload, qos=1):
+        if system_log.is_enabled(system_log.DEBUG) and system_log.sample("publish"):
+            print(f"Message successfully sent with {client_id}!")
+            system_log.log_to_redis(f"Message successfully sent with {client_id}!", system_log.DEBUG)
+    else:
+        print(f"Failed to send message with {client_id}, spooled for replay.")
+        system_log.log_to_redis(f"Failed to send message with {client_id}, spooled for replay.", system_log.WARNING)
+
+# -----------------------------------------------
+# Samples with a NaN or infinite field are dropped
+# by both decode paths, never published
+# -----------------------------------------------
+def drop_non_finite(client_id, count):
+    if not count:
+        return
+
+    metrics.count_parse_error("non_finite", count)
+    print(f"[!] Dropped {count} sample(s) of ID={client_id} with NaN or infinite values.")
+    system_log.log_to_redis(f"[!] Dropped {count} sample(s) of ID={client_id} with NaN or infinite values.", system_log.WARNING)
+
+# -----------------------------------------------
+# Decode the 28/36-byte records of one read into
+# sample dicts (process task of ingest_pipeline).
+# Large runs are decoded with NumPy in one go.
+# -----------------------------------------------
+def process_records(client_id, contents):
+    samples = []
+
+    # Devices send a fixed record size, but keep the order if sizes ever alternate
+    for record_size, group in itertools.groupby(contents, key=len):
+        group = list(group)
+
+        if record_size not in handle_data.RECORD_DTYPES:
+            metrics.count_parse_error("record_length")
+            print(f"[!] content_data length={record_size}, expected 28 or 36.")
+            system_log.log_to_redis(f"[!] content_data length={record_size}, expected 28 or 36.")
+            continue
+
+        if len(group) < handle_data.VECTORIZE_MIN_RECORDS:
+            parse = handle_data.parse_28_byte_content if record_size == 28 else handle_data.parse_36_byte_content
+            non_finite = 0
+            for content_data in group:
+                parsed = parse(content_data)
+                if not handle_data.is_finite_sample(parsed):
+                    non_finite += 1
+                    continue
+                samples.append(build_sample(client_id, parsed))
+            drop_non_finite(client_id, non_finite)
+            continue
+
+        records = handle_data.decode_records(group, record_size)
+        finite = handle_data.finite_mask(records)
+        if not finite.all():
+            drop_non_finite(client_id, len(records) - int(finite.sum()))
+            records = records[finite]
+        columns = handle_data.check_in_out_of_bed_batch(records)
+        for parsed in handle_data.columns_to_dicts(columns):
+            samples.append(build_sample(client_id, parsed, checked=True))
+
+    return samples
+
+# -----------------------------------------------
+# Per-connection state handed to the protocol
+# handlers
+# -----------------------------------------------
+class ClientContext:
+    __slots__ = ("session", "responses", "pending_records", "pending_client_id")
+
+    def __init__(self, session):
+        self.session = session
+        self.responses = protocol_codec.ResponseBuffer()  # Server frames of the current read
+        self.pending_records = []                         # 0x03e8 contents of the current read
+        self.pending_client_id = None
+
+# -----------------------------------------------
+# Queue the samples collected so far in this read
+# -----------------------------------------------
+def flush_pending_records(context):
+    if context.pending_records:
+        ingest_pipeline.submit(context.pending_client_id, context.pending_records)
+        context.pending_records = []
+
+# ---------------- Handle function=0x0001 (register ID, send count) ----------------
+@protocol_codec.register_handler(protocol_codec.FUNCTION_REGISTER)
+async def handle_register(context, request_id, content_data):
+    session = context.session
+
+    # Suppose the last 13 bytes are the ID
+    if len(content_data) >= 13:
+        new_id_hex = content_data[-13:].hex()
+    else:
+        new_id_hex = "TooShort"
+
+    new_device = await http_client.register_device(new_id_hex)
+
+    if new_device:
+        print(f"[Server] Device successfully registered: {new_device}")
+        system_log.log_to_redis(f"[Server] Device successfully registered: {new_device}")
+
+    register_session(session, new_id_hex)
+
+    # Registered devices only (of every worker process)
+    count = device_sessions.registered_count()
+
+    print(f"[Server] (1) Registered new: IP={session.ip}, ID={new_id_hex}. count={count}")
+    system_log.log_to_redis(f"[Server] (1) Registered new: IP={session.ip}, ID={new_id_hex}. count={count}")
+
+    # Response that contains 'count', sent at the end of the read
+    context.responses.register_response(request_id, count)
+    print(f"[Server] Sent response for function=1 with count={count}")
+    system_log.log_to_redis(f"[Server] Sent response for function=1 with count={count}")
+
+# ---------------- Handle function=0x03e8 (28 or 36 bytes of data) ----------------
+@protocol_codec.register_handler(protocol_codec.FUNCTION_SAMPLE)
+def handle_sample(context, request_id, content_data):
+    session = context.session
+    client_id = session.device_id
+    session.samples += 1
+
+    if client_id is None:
+        context.responses.request_id_request(request_id)
+
+        print(f"[Server] Sent request for function=0x0410 to IP={session.ip}")
+        system_log.log_to_redis(f"[Server] Sent request for function=0x0410 to IP={session.ip}")
+        return
+
+    if client_id != context.pending_client_id:
+        flush_pending_records(context)
+
+    context.pending_client_id = client_id
+    context.pending_records.append(content_data)
+
+# ---------------- Handle function=0x0410 (ID requested by the server) ----------------
+@protocol_codec.register_handler(protocol_codec.FUNCTION_REQUEST_ID)
+def handle_request_id(context, request_id, content_data):
+    session = context.session
+
+    new_id_hex = content_data[-13:].hex()
+    register_session(session, new_id_hex)
+    count = device_sessions.registered_count()
+
+    print(f"[Server] (1) Registered new: IP={session.ip}, ID={new_id_hex}. count={count}")
+    system_log.log_to_redis(f"[Server] (1) Registered new: IP={session.ip}, ID={new_id_hex}. count={count}")
 
 # -----------------------------------------------
 # Function to handle client connections
-# -----------------------------------------------        
+# -----------------------------------------------
 async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
-    global count
-
-    condition_regis_mqtt = True
+    global connections_rejected
 
-    mqtt_client = None
+    # Over the limit: reset the connection before any logging, lookup or allocation
+    limit = max_connections()
+    if limit is not None and device_sessions.connected_count() >= limit:
+        connections_rejected += 1
+        writer.transport.abort()
+        return
 
     client_address = writer.get_extra_info('peername')
     if not client_address:
@@ -178,30 +592,22 @@ async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWrit
     print(f"[Async] Handling new client from IP={client_ip}")
     system_log.log_to_redis(f"[Async] Handling new client from IP={client_ip}")
 
-    # If an existing writer for this IP exists, close it (enforcing "one IP - one connection")
-    if client_ip in ip_to_writer_map:
-        old_writer = ip_to_writer_map[client_ip]
-        try:
-            old_writer.close()
-        except:
-            pass
-        await old_writer.wait_closed()
-
-        print(f"[Async] Closed old connection for IP={client_ip}")
-        system_log.log_to_redis(f"[Async] Closed old connection for IP={client_ip}")
+    # Several devices may share an IP (NAT): an older connection is only
+    # closed once this one registers the same device ID (register_session)
+    session = device_sessions.open_session(writer, client_ip)
+    context = ClientContext(session)
 
-    # Record the new writer for this IP
-    ip_to_writer_map[client_ip] = writer
-
-    # Increase 'count' if this is the first time we see this IP
-    if client_ip not in ip_to_id_map:
-        count += 1
+    # Reassembles frames that TCP split across reads or coalesced into one read
+    decoder = protocol_codec.FrameDecoder()
 
     try:
         while True:
             # ----------------------------------------------------------
             #  Add exception handling for connection-reset errors
             # ----------------------------------------------------------
+            # Stop reading (TCP pushes back on the device) while the ingest queue is full
+            await ingest_pipeline.wait_for_capacity()
+
             try:
                 data = await reader.read(1024)
             except (ConnectionResetError, BrokenPipeError) as e:
@@ -210,206 +616,154 @@ async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWrit
                 break
 
             if not data:
-                # Client closed the connection
+                # Client closed the connection (or the reaper aborted it)
                 print(f"[Async] Client {client_ip} disconnected.")
                 system_log.log_to_redis(f"[Async] Client {client_ip} disconnected.")
                 break
 
-            print(f"Received data (hex): {data.hex()}")
-            system_log.log_to_redis(f"Received data (hex): {data.hex()}")
+            session.last_seen = time.monotonic()
+            session.bytes_received += len(data)
 
-            request_id, function, content_len, content_data = handle_data.parse_packet(data)
+            # Packet dumps: every read of a captured device, 1 in LOG_PACKET_SAMPLE at DEBUG
+            captured = system_log.is_captured(session.device_id)
+            dump = captured or (system_log.is_enabled(system_log.DEBUG) and system_log.sample("packet"))
+            if dump:
+                dump_prefix = f"[Capture ID={session.device_id}] " if captured else ""
+                dump_level = system_log.INFO if captured else system_log.DEBUG
 
-            print(f"[Parsed] function=0x{function:04x}, content_len={content_len}, content_data={content_data.hex()}")
-            system_log.log_to_redis(f"[Parsed] function=0x{function:04x}, content_len={content_len}, content_data={content_data.hex()}")
-            # ---------------- Handle function=0x0001 (register ID, send count) ----------------
-            if function == 0x0001:
-                # Suppose the last 13 bytes are the ID
-                if len(content_data) >= 13:
-                    new_id_hex = content_data[-13:].hex()
-                else:
-                    new_id_hex = "TooShort"
-
-                new_device = await http_client.register_device(new_id_hex)
-
-                # ---------------- MQTT Setup ----------------
-                if condition_regis_mqtt == True:
-                    condition_regis_mqtt = False
-                    mqtt_client = mqtt.Client(client_id=client_ip)
-
-                    mqtt_client.on_publish = on_publish
-
-                    # Configure SSL for secure connections to AWS IoT
-                    mqtt_client.tls_set(ca_certs=environment.root_ca_path,
-                                        certfile=environment.cert_path,
-                                        keyfile=environment.private_key_path,
-                                        tls_version=ssl.PROTOCOL_TLSv1_2)
-
-                    system_log.log_to_redis(environment.AWS_IOT_ENDPOINT)
-                    system_log.log_to_redis(environment.MQTT_PORT)
-                    # Connect to broker
-                    mqtt_client.connect(environment.AWS_IOT_ENDPOINT, environment.MQTT_PORT, 60)
-
-                    # Start a background thread to handle the network loop
-                    mqtt_client.loop_start()
-
-                if new_device:
-                    print(f"[Server] Device successfully registered: {new_device}")
-                    system_log.log_to_redis(f"[Server] Device successfully registered: {new_device}")
-
-                ip_to_id_map[client_ip] = new_id_hex
-
-                print(f"[Server] (1) Registered new: IP={client_ip}, ID={new_id_hex}. count={count}")
-                system_log.log_to_redis(f"[Server] (1) Registered new: IP={client_ip}, ID={new_id_hex}. count={count}")
-
-
-                # Build a response that contains 'count'
-                data_resp = [
-                    0x13, 0x01, 0x00, 0x02,
-                    (request_id >> 24) & 0xFF,
-                    (request_id >> 16) & 0xFF,
-                    (request_id >> 8) & 0xFF,
-                    (request_id >> 0) & 0xFF,
-                    0, 0, 0, 0, 0, 6, 0, 1,
-                    (count >> 24) & 0xFF,
-                    (count >> 16) & 0xFF,
-                    (count >> 8) & 0xFF,
-                    (count >> 0) & 0xFF
-                ]
-                writer.write(bytes(data_resp))
-                await writer.drain()
-                print(f"[Server] Sent response for function=1 with count={count}")
-                system_log.log_to_redis(f"[Server] Sent response for function=1 with count={count}")
-
-            # ---------------- Handle function=0x03e8 (28 or 36 bytes of data) ----------------
-            elif function == 0x03e8:
-
-                client_id = ip_to_id_map.get(client_ip, "UnknownID")
-
-                if client_id == "UnknownID":
-                    data_req = [
-                        0x13, 0x01, 0x01, 0x01,
-                        (request_id >> 24) & 0xFF,
-                        (request_id >> 16) & 0xFF,
-                        (request_id >> 8) & 0xFF,
-                        (request_id >> 0) & 0xFF,
-                        0, 0, 0, 0, 0, 6, 0x04, 0x10,
-                        0, 0, 0, 0
-                    ]
-                    writer.write(bytes(data_req))
-                    await writer.drain()
-
-                    print(f"[Server] Sent request for function=0x0410 with count={count}")
-                    system_log.log_to_redis(f"[Server] Sent request for function=0x0410 with count={count}")
+                print(f"{dump_prefix}Received data (hex): {data.hex()}")
+                system_log.log_to_redis(f"{dump_prefix}Received data (hex): {data.hex()}", dump_level)
 
+            try:
+                frames = decoder.feed(data)
+            except protocol_codec.FrameError as e:
+                # The stream is out of sync, there is no way to find the next header
+                metrics.count_parse_error("framing")
+                print(f"[Async] Dropping {client_ip}: {e}")
+                system_log.log_to_redis(f"[Async] Dropping {client_ip}: {e}", system_log.WARNING)
+                break
+
+            session.frames += len(frames)
+
+            for request_id, function, content_len, content_data in frames:
+                # Samples are queued in order with the control frames around them
+                if function != protocol_codec.FUNCTION_SAMPLE:
+                    flush_pending_records(context)
+
+                if dump:
+                    print(f"{dump_prefix}[Parsed] function=0x{function:04x}, content_len={content_len}, content_data={content_data.hex()}")
+                    system_log.log_to_redis(f"{dump_prefix}[Parsed] function=0x{function:04x}, content_len={content_len}, content_data={content_data.hex()}", dump_level)
+
+                metrics.count_frame(function)
+
+                entry = protocol_codec.get_handler(function)
+                if entry is None:
+                    metrics.count_parse_error("unknown_function")
+                    continue  # Unknown function code, ignored as before
+
+                handler, is_coroutine = entry
+                if is_coroutine:
+                    await handler(context, request_id, content_data)
                 else:
-                    if len(content_data) == 28:
-                        parsed = handle_data.parse_28_byte_content(content_data)
-
-                        handle_data.check_in_out_of_bed(parsed)
-
-                        local_time = int(time.time())
-                        # Publish the data to MQTT as JSON
-                        index_data = {
-                            "device_id": client_id,
-                            "current_time": local_time,
-                        }
-                        index_data.update(parsed)  # merges the "parsed" data into index_data
-
-                        json_data = json.dumps(index_data, indent=4)
-                        print(json_data)
-                        system_log.log_to_redis(json_data)
-
-                        print(f"[Before Publish] Preparing to publish data for device {client_id}")
-                        system_log.log_to_redis(f"[Before Publish] Preparing to publish data for device {client_id}")
-                        
-                        info = mqtt_client.publish(http_client.generate_topic(client_id), json_data, qos=1)
-                        
-                        if info.rc == mqtt.MQTT_ERR_SUCCESS:
-                            print(f"Message successfully sent with {client_id}!")
-                            system_log.log_to_redis("Message successfully sent!")
-                        else:
-                            print(f"Failed to send message with {client_id}:", info.rc)
-                            system_log.log_to_redis("Failed to send message")
-
-                    elif len(content_data) == 36:
-                        parsed = handle_data.parse_36_byte_content(content_data)
-
-                        handle_data.check_in_out_of_bed(parsed)
-
-                        local_time = int(time.time())
-                        # Publish the data to MQTT as JSON
-                        index_data = {
-                            "device_id": client_id,
-                            "current_time": local_time,
-                        }
-                        index_data.update(parsed)  # merges the "parsed" data into index_data
-
-                        json_data = json.dumps(index_data, indent=4)
-                        print(json_data)
-                        system_log.log_to_redis(json_data)
-
-                        print(f"[Before Publish] Preparing to publish data for device {client_id}")
-                        system_log.log_to_redis(f"[Before Publish] Preparing to publish data for device {client_id}")
-
-                        info = mqtt_client.publish(http_client.generate_topic(client_id), json_data, qos=1)
-                        
-                        if info.rc == mqtt.MQTT_ERR_SUCCESS:
-                            print(f"Message successfully sent with {client_id}!")
-                            system_log.log_to_redis("Message successfully sent!")
-                        else:
-                            print(f"Failed to send message with {client_id}:", info.rc)
-                            system_log.log_to_redis("Failed to send message:")
-
-                    else:
-                        print(f"[!] content_data length={len(content_data)}, expected 28 or 36.")
-                        system_log.log_to_redis(f"[!] content_data length={len(content_data)}, expected 28 or 36.")
-
-            elif function == 0x0410:
-                new_id_hex = content_data[-13:].hex()
-                ip_to_id_map[client_ip] = new_id_hex
-
-                print(f"[Server] (1) Registered new: IP={client_ip}, ID={new_id_hex}. count={count}")
-                system_log.log_to_redis(f"[Server] (1) Registered new: IP={client_ip}, ID={new_id_hex}. count={count}")
+                    handler(context, request_id, content_data)
+
+            flush_pending_records(context)
+
+            # Every response of this read in one write
+            if context.responses.flush(writer):
+                await writer.drain()
 
     except Exception as e:
         print(f"[Async] Exception for {client_ip}: {e}")
-        system_log.log_to_redis(f"[Async] Exception for {client_ip}: {e}")
+        system_log.log_to_redis(f"[Async] Exception for {client_ip}: {e}", system_log.ERROR)
 
     finally:
-        # Close connection and remove from maps
+        # Only a registered session lowers the registered count
+        device_sessions.close_session(session)
         writer.close()
         await writer.wait_closed()
-        if client_ip in ip_to_id_map:
-            del ip_to_id_map[client_ip]
 
-            print(f"[Async] Removed IP={client_ip} from ip_to_id_map.")
-            system_log.log_to_redis(f"[Async] Removed IP={client_ip} from ip_to_id_map.")
+        if session.device_id is not None and device_sessions.get(session.device_id) is None:
+            ingest_pipeline.forget(session.device_id)  # Closed or reaped, no newer connection
 
-        if ip_to_writer_map.get(client_ip) is writer:
-            del ip_to_writer_map[client_ip]
+        if session.device_id is not None:
+            print(f"[Async] Removed ID={session.device_id} (IP={client_ip}) from the session table.")
+            system_log.log_to_redis(f"[Async] Removed ID={session.device_id} (IP={client_ip}) from the session table.")
 
         print(f"[Async] Ended for {client_ip}.")
         system_log.log_to_redis(f"[Async] Ended for {client_ip}.")
-
-        # Decrease 'count' if close connection
-        count = count - 1
         
+# -----------------------------------------------
+# State of the TCP server, answered to the UI's
+# "status" command (in-memory only)
+# -----------------------------------------------
+def server_status():
+    running = tcp_workers.is_running() or (server is not None and server.is_serving())
+    ready, reason = readiness()
+    return {
+        "running": running,
+        "ready": ready,
+        "reason": reason,
+        "connections": device_sessions.connected_count(),
+        "workers": tcp_workers.get_stats() if tcp_workers.is_running() else None,
+    }
+
+# -----------------------------------------------
+# Commands from the UI (control_channel), run one
+# at a time as soon as they arrive
+# -----------------------------------------------
+async def handle_control(command):
+    if command == "start":
+        environment_manager.reload_environment()  # Settings changed in the UI while stopped
+        await start_tcp_server()
+
+        # Answer once the socket listens (or could not be opened), not when the task is created
+        for _ in range(50):
+            if server_status()["running"] or server_task is None or server_task.done():
+                break
+            await asyncio.sleep(0.1)
+        if not server_status()["running"]:
+            return {"success": False, "message": "TCP Server did not start, see the system log.", "status": server_status()}
+        message = "TCP Server started successfully!"
+    elif command == "stop":
+        await stop_tcp_server()
+        message = "TCP Server stopped successfully!"
+    elif command == "reload":
+        environment_manager.reload_environment()
+        mqtt_publisher.reload()  # New endpoint / certificates: rebuild the pool (workers: within POOL_CHECK_INTERVAL)
+        message = "Configuration reloaded."
+    else:
+        message = "ok"
+
+    return {"success": True, "message": message, "status": server_status()}
+
 async def main():
     try:
         if environment_manager.get_auth_token():
             asyncio.create_task(refresh_auth_token())
-        
-        while True:
 
-            environment_manager.reload_environment()
+        # Served independently of the TCP server, /readyz reports whether it runs
+        if environment.METRICS_PORT:
+            await start_metrics_server(environment.METRICS_PORT)
+
+        # Start / stop / reload / status from the UI
+        try:
+            await control_channel.start_server(handle_control)
+            print(f"[Control] Listening for commands on {environment.CONTROL_SOCKET}")
+            system_log.log_to_redis(f"[Control] Listening for commands on {environment.CONTROL_SOCKET}")
+        except OSError as e:
+            print(f"[ERROR] Failed to open the control socket: {e}")
+            system_log.log_to_redis(f"[ERROR] Failed to open the control socket: {e}", system_log.ERROR)
+
+        # State the UI last asked for, kept in environment.py across restarts
+        environment_manager.reload_environment()
+        if environment.START_SERVER and not environment.STOP_SERVER:
+            await start_tcp_server()
+
+        while True:
+            # Multi-process mode: respawn workers that crashed (no configuration polling)
+            tcp_workers.restart_dead()
 
-            if environment.START_SERVER:
-                await start_tcp_server()
-                
-            if environment.STOP_SERVER:
-                await stop_tcp_server()
-                
             await asyncio.sleep(1)
             
     except asyncio.CancelledError:
@@ -424,4 +778,10 @@ async def main():
         print("[INFO] Cleaning up before exit...")
         system_log.log_to_redis("[INFO] Cleaning up before exit...")
 
+        await control_channel.stop_server()
+        await metrics.stop_server()
+
+        # Nothing accepts devices once this process is gone
+        status_registry.set_tcp_status(False)
+
             
\ No newline at end of file
@@ -0,0 +1,156 @@
+# -----------------------------------------------
+# Per-device session registry
+#
+# One DeviceSession per open TCP connection,
+# indexed by writer (every connection), by device
+# ID (registered connections, at most one each)
+# and by IP (several devices may share one IP
+# behind a NAT).
+#
+# "One device - one connection" is enforced by
+# device ID: registering an ID that already has a
+# session returns the old session for the caller
+# to close.
+#
+# registered_count() is the exact number of
+# registered devices (across every worker process
+# in multi-process mode), the value the 0x0001
+# response carries.
+# -----------------------------------------------
+import time
+
+import app.services.tcp_workers as tcp_workers
+
+# -----------------------------------------------
+# One connection. __slots__ keeps it at a fixed,
+# small size (see Backend/benchmarks/bench_device_sessions.py)
+# -----------------------------------------------
+class DeviceSession:
+    __slots__ = (
+        "writer",          # asyncio.StreamWriter of the connection
+        "ip",
+        "device_id",       # Hex ID from 0x0001 / 0x0410, None until registered
+        "connected_at",    # time.time() when accepted
+        "registered_at",   # time.time() of the registration, None until registered
+        "last_seen",       # time.monotonic() of the last read with data
+        "frames",          # Frames received
+        "samples",         # 0x03e8 records received
+        "bytes_received",
+    )
+
+    def __init__(self, writer, ip):
+        self.writer = writer
+        self.ip = ip
+        self.device_id = None
+        self.connected_at = time.time()
+        self.registered_at = None
+        self.last_seen = time.monotonic()
+        self.frames = 0
+        self.samples = 0
+        self.bytes_received = 0
+
+    @property
+    def registered(self):
+        return self.device_id is not None
+
+    def __repr__(self):
+        return f"DeviceSession(ip={self.ip}, device_id={self.device_id})"
+
+# -----------------------------------------------
+# Global variables
+# -----------------------------------------------
+sessions = {}    # writer -> DeviceSession, every open connection
+by_id = {}       # device_id -> DeviceSession
+by_ip = {}       # ip -> [DeviceSession, ...]
+
+# -----------------------------------------------
+# Track a newly accepted connection
+# -----------------------------------------------
+def open_session(writer, ip):
+    session = DeviceSession(writer, ip)
+    sessions[writer] = session
+
+    same_ip = by_ip.get(ip)
+    if same_ip is None:
+        by_ip[ip] = [session]
+    else:
+        same_ip.append(session)
+    return session
+
+# -----------------------------------------------
+# Bind a device ID to a session. Returns the
+# session that held this ID before (still open,
+# for the caller to close), otherwise None.
+# -----------------------------------------------
+def register(session, device_id):
+    if session.device_id == device_id:
+        return None
+
+    if session.device_id is not None and by_id.get(session.device_id) is session:
+        del by_id[session.device_id]  # The device changed its ID on this connection
+
+    previous = by_id.get(device_id)
+    if previous is not None:
+        previous.device_id = None
+        previous.registered_at = None
+
+    by_id[device_id] = session
+    session.device_id = device_id
+    session.registered_at = time.time()
+
+    tcp_workers.set_registered_count(len(by_id))
+    return previous
+
+# -----------------------------------------------
+# Forget a closed connection
+# -----------------------------------------------
+def close_session(session):
+    if sessions.pop(session.writer, None) is None:
+        return  # Already closed
+
+    same_ip = by_ip.get(session.ip)
+    if same_ip is not None:
+        if session in same_ip:
+            same_ip.remove(session)
+        if not same_ip:
+            del by_ip[session.ip]
+
+    if session.device_id is not None and by_id.get(session.device_id) is session:
+        del by_id[session.device_id]
+        tcp_workers.set_registered_count(len(by_id))
+
+def get(device_id):
+    return by_id.get(device_id)
+
+def find_by_ip(ip):
+    return list(by_ip.get(ip, ()))
+
+def all_sessions():
+    return list(sessions.values())
+
+# -----------------------------------------------
+# Open connections of this process
+# -----------------------------------------------
+def connected_count():
+    return len(sessions)
+
+# -----------------------------------------------
+# Registered devices (of every worker process)
+# -----------------------------------------------
+def registered_count():
+    shared = tcp_workers.registered_count()
+    return len(by_id) if shared is None else shared
+
+def clear():
+    sessions.clear()
+    by_id.clear()
+    by_ip.clear()
+    tcp_workers.set_registered_count(0)
+
+def get_stats():
+    return {
+        "connected": connected_count(),
+        "registered": registered_count(),
+        "registered_local": len(by_id),
+        "ips": len(by_ip),
+    }
@@ -1,4 +1,8 @@
-import struct
+import math
+
+import numpy as np
+
+import app.services.protocol_codec as protocol_codec
 
 def check_in_out_of_bed(data):
 
@@ -12,12 +16,19 @@ def check_in_out_of_bed(data):
 
     return data
 
+def is_finite_sample(data):
+    """
+    False if any float field of a parsed record is NaN or infinite (a corrupt
+    sample: int() cannot truncate its rates and JSON cannot carry it).
+    """
+    return all(math.isfinite(value) for value in data.values() if isinstance(value, float))
+
 def parse_28_byte_content(data_28):
     """
     data_28: 28 bytes => 6 floats (24 bytes) + 1 uint (4 bytes).
     Big-endian format: '>ffffffI'
     """
-    fields = struct.unpack('>ffffffI', data_28)
+    fields = protocol_codec.RECORD_28.unpack(data_28)
     return {
         "breath_bpm": fields[0],
         "breath_curve": fields[1],
@@ -33,7 +44,7 @@ def parse_36_byte_content(data_36):
     data_36: 36 bytes => 6 floats (24 bytes) + 1 uint (4 bytes) + 2 floats (8 bytes) = 9 fields.
     Big-endian format: '>ffffffIff'
     """
-    fields = struct.unpack('>ffffffIff', data_36)
+    fields = protocol_codec.RECORD_36.unpack(data_36)
     return {
         "breath_bpm": fields[0],
         "breath_curve": fields[1],
@@ -46,29 +57,71 @@ def parse_36_byte_content(data_36):
         "body_move_range": fields[8],
     }
 
-def parse_packet(data):
-    """
-    Packet layout:
-      - Header (14 bytes, big-endian):
-          proto (1 byte)
-          ver   (1 byte)
-          ptype (1 byte)
-          cmd   (1 byte)
-          request_id (4 bytes, unsigned int)
-          timeout    (2 bytes, unsigned short)
-          content_len (4 bytes, unsigned int)
+# ------------------------------------------------------------------
+# Vectorized decoding of many 28/36-byte records at once.
+# Same fields as parse_28_byte_content / parse_36_byte_content,
+# as big-endian structured dtypes for np.frombuffer.
+# ------------------------------------------------------------------
+RECORD_28_DTYPE = np.dtype([
+    ("breath_bpm", ">f4"),
+    ("breath_curve", ">f4"),
+    ("heart_bpm", ">f4"),
+    ("heart_rate_curve", ">f4"),
+    ("target_distance", ">f4"),
+    ("signal_strength", ">f4"),
+    ("valid_bit_id", ">u4"),
+])
+
+RECORD_36_DTYPE = np.dtype(RECORD_28_DTYPE.descr + [
+    ("body_move_energy", ">f4"),
+    ("body_move_range", ">f4"),
+])
 
-        => struct.unpack('!BBBBIHI') => 14 bytes
+RECORD_DTYPES = {28: RECORD_28_DTYPE, 36: RECORD_36_DTYPE}
 
-      - Then 2 bytes for 'function' => total 16 bytes minimum before content_data.
+# Below this many records the per-record struct path is cheaper than numpy's setup cost
+VECTORIZE_MIN_RECORDS = 16
 
-    content_data = data[16 : 14 + content_len]
+def decode_records(contents, record_size):
     """
-    if len(data) < 16:
-        return (0, 0, 0, b"")  # Not enough data
+    contents: list of content_data (all record_size bytes long) or one bytes object
+    holding the records back to back.
+    Returns a structured array with one row per record, without copying the joined buffer.
+    """
+    if not isinstance(contents, (bytes, bytearray, memoryview)):
+        contents = b"".join(contents)
+    return np.frombuffer(contents, dtype=RECORD_DTYPES[record_size])
 
-    proto, ver, ptype, cmd, request_id, timeout, content_len = struct.unpack('!BBBBIHI', data[:14])
-    function = struct.unpack('!H', data[14:16])[0]
+def finite_mask(records):
+    """
+    Vectorized is_finite_sample: True for the records whose float fields are all finite.
+    """
+    mask = np.ones(len(records), dtype=bool)
+    for name in records.dtype.names:
+        if records.dtype[name].kind == "f":
+            mask &= np.isfinite(records[name])
+    return mask
+
+def check_in_out_of_bed_batch(records):
+    """
+    Vectorized check_in_out_of_bed: returns {field: column} with breath_bpm/heart_bpm
+    truncated to integers (like int()) and the 'out_of_bed' column added.
+    The records must be finite (filter them with finite_mask first).
+    """
+    columns = {name: records[name] for name in records.dtype.names}
 
-    content_data = data[16 : 14 + content_len]
-    return request_id, function, content_len, content_data
\ No newline at end of file
+    columns["breath_bpm"] = records["breath_bpm"].astype(np.int64)
+    columns["heart_bpm"] = records["heart_bpm"].astype(np.int64)
+
+    columns["out_of_bed"] = (columns["breath_bpm"] == 0) & (columns["heart_bpm"] == 0)
+    return columns
+
+def columns_to_dicts(columns):
+    """
+    Turn the columns from check_in_out_of_bed_batch into the same dicts the per-record
+    path produces (plain Python floats/ints/bools, same key order).
+    Only meant to be called at the sink, right before encoding.
+    """
+    names = list(columns)
+    values = [columns[name].tolist() for name in names]
+    return [dict(zip(names, row)) for row in zip(*values)]
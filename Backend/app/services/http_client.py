@@ -1,5 +1,10 @@
 import requests
 import json
+import os
+import time
+import fcntl
+import asyncio
+import threading
 
 import aiohttp
 
@@ -17,6 +22,17 @@ BASE_URL = f"http://{environment.IP_API}:8000"
 
 number_of_facility = 0
 
+# Keep-alive connection pool for the synchronous calls (login, facility list, ...)
+requests_session = requests.Session()
+
+# Long-lived aiohttp session shared by every coroutine, created on first use
+_session = None
+
+# device_id -> unix time of its successful registration, loaded from DEVICE_CACHE_PATH
+registered_devices = None
+_device_cache_mtime = None
+_device_cache_lock = threading.Lock()  # flock is per open file: the executor threads need this too
+
 def get_headers():
     return {
         "Authorization": f"Bearer {environment.AUTH_TOKEN}",
@@ -43,7 +59,7 @@ def login_access_token(user_name, password):
     }
 
     try:
-        response = requests.post(url, headers=header_login, data=data)  # Use `data` instead of `params`
+        response = requests_session.post(url, headers=header_login, data=data)  # Use `data` instead of `params`
         response.raise_for_status()
 
         print(response.json()["access_token"])
@@ -63,7 +79,7 @@ def get_facility_list(skip=0, limit=100):
     print(f"Fetching facility list from: {url}")  # Debugging
 
     try:
-        response = requests.get(url, headers=get_headers(), timeout=10)
+        response = requests_session.get(url, headers=get_headers(), timeout=10)
         print(f"Response status code: {response.status_code}")  # Debugging
 
         response.raise_for_status()  # Raise an error for non-200 responses
@@ -88,7 +104,7 @@ def get_device_list(skip=0, limit=100):
     url = f"{BASE_URL}/device/list?skip={skip}&limit={limit}"
 
     try:
-        response = requests.get(url, headers=get_headers(), timeout=10)
+        response = requests_session.get(url, headers=get_headers(), timeout=10)
         print(f"Response status code: {response.status_code}")  # Debugging
 
         response.raise_for_status()  # Raise an error for non-200 responses
@@ -126,7 +142,7 @@ def register_tcp_server(facility_id, unique_name):
         "tcp_server_name": unique_name
     }
     try:
-        response = requests.post(url, headers=get_headers(), params=params)  # Use `params`
+        response = requests_session.post(url, headers=get_headers(), params=params)  # Use `params`
         response.raise_for_status()
 
         register_tcp = response.json()
@@ -139,7 +155,138 @@ def register_tcp_server(facility_id, unique_name):
     except requests.RequestException as e:
         print("Request error:", e)
 
+# -----------------------------------------------
+# Shared aiohttp session (connection pooled)
+# -----------------------------------------------
+def get_session():
+    global _session
+
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit=environment.HTTP_POOL_SIZE, keepalive_timeout=60)
+        _session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=10))
+    return _session
+
+async def close_session():
+    global _session
+
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+# -----------------------------------------------
+# Registered-device cache, in memory and
+# persisted to DEVICE_CACHE_PATH
+# -----------------------------------------------
+def _load_device_cache():
+    global registered_devices, _device_cache_mtime
+
+    path = environment.DEVICE_CACHE_PATH
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        if registered_devices is None:
+            registered_devices = {}
+        return
+
+    if registered_devices is not None and mtime == _device_cache_mtime:
+        return  # Nothing changed on disk
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            registered_devices = json.load(f)
+        _device_cache_mtime = mtime
+    except (OSError, ValueError) as e:
+        print(f"[Device Cache] Could not read {path}: {e}")
+        if registered_devices is None:
+            registered_devices = {}
+
+# -----------------------------------------------
+# Merge changes into the file: read, apply, write
+# to a temp file and rename, all under a lock on
+# DEVICE_CACHE_PATH.lock, so worker processes and
+# the UI never lose each other's entries.
+# changes: device_id -> registration time, or None
+# to forget it; clear=True forgets every device.
+# Blocking: the backend runs it in an executor.
+# -----------------------------------------------
+def _update_device_cache(changes, clear=False):
+    global registered_devices, _device_cache_mtime
+
+    path = environment.DEVICE_CACHE_PATH
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    with _device_cache_lock, open(path + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            devices = {}
+            if not clear:
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        devices = json.load(f)
+                except FileNotFoundError:
+                    pass
+                except ValueError as e:
+                    print(f"[Device Cache] {path} is unreadable, starting over: {e}")
+
+            for device_id, registered_at in changes.items():
+                if registered_at is None:
+                    devices.pop(device_id, None)
+                else:
+                    devices[device_id] = registered_at
+
+            # Write to a temp file and rename, so a crash never leaves half a cache behind
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(devices, f)
+            os.replace(tmp_path, path)
+
+            registered_devices = devices
+            _device_cache_mtime = os.stat(path).st_mtime_ns
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def is_device_registered(device_id):
+    # A stat unless the file changed: picks up registrations and
+    # invalidations made by other processes
+    _load_device_cache()
+
+    registered_at = registered_devices.get(device_id)
+    if registered_at is None:
+        return False
+
+    return time.time() - registered_at < environment.DEVICE_CACHE_TTL
+
+async def mark_device_registered(device_id):
+    if registered_devices is None:
+        _load_device_cache()
+
+    registered_at = time.time()
+    registered_devices[device_id] = registered_at  # Seen at once by this process
+
+    # File lock and write off the event loop
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(None, _update_device_cache, {device_id: registered_at})
+    except OSError as e:
+        print(f"[Device Cache] Could not save {device_id}: {e}")
+
+# -----------------------------------------------
+# Forget one device (or every device if None), so
+# its next 0x0001 registers it again. Called when
+# the facility changes, and by
+# Backend/tools/device_cache.py.
+# -----------------------------------------------
+def invalidate_device(device_id=None):
+    if device_id is None:
+        _update_device_cache({}, clear=True)
+    else:
+        _update_device_cache({device_id: None})
+
 async def register_device(device_id):
+    # Known devices skip the HTTP call entirely
+    if is_device_registered(device_id):
+        return None
+
     url = f"{BASE_URL}/device/create"
 
     # Payload with Aerosense Device ID
@@ -149,22 +296,32 @@ async def register_device(device_id):
     }
 
     try:
-        async with aiohttp.ClientSession() as session:
-            
-            async with session.post(url, json=data, headers=get_headers()) as response:
+        session = get_session()
+
+        async with session.post(url, json=data, headers=get_headers()) as response:
+
+            if response.status == 409:
+                # DreamsEdge already knows this device
+                await mark_device_registered(device_id)
+                return None
 
-                response.raise_for_status()  # Raise an error for non-200 responses
+            response.raise_for_status()  # Raise an error for non-200 responses
 
-                new_device = await response.json()
+            new_device = await response.json()
 
-                print(json.dumps(new_device, indent=4, ensure_ascii=False))
+            print(json.dumps(new_device, indent=4, ensure_ascii=False))
 
-                # print("Device successfully registered:", new_device)
-                return new_device
+            await mark_device_registered(device_id)
+
+            # print("Device successfully registered:", new_device)
+            return new_device
 
     except Exception as e:
         print(f"Error registering device: {e}")
         return None
 
 def generate_topic(device_id):
-    return f"{environment.TCP_SERVER_NAME}/{device_id}"  # Format: [tcp_server_unique_name]/[device_id]
\ No newline at end of file
+    return f"{environment.TCP_SERVER_NAME}/{device_id}"  # Format: [tcp_server_unique_name]/[device_id]
+
+def generate_facility_topic():
+    return f"{environment.TCP_SERVER_NAME}/facility/{environment.FACILITY_ID}"  # Format: [tcp_server_unique_name]/facility/[facility_id]
\ No newline at end of file
@@ -0,0 +1,337 @@
+# -----------------------------------------------
+# Bounded ingest -> process -> publish pipeline
+#
+# handle_client only reads and frames; the 0x03e8
+# records of a read are queued here and decoded,
+# logged and published by background tasks:
+#
+#   handle_client --submit()--> process queue
+#       --process task--> publish queue (bounded)
+#       --publish task--> batcher / MQTT / spool
+#
+# Backpressure: above INGEST_QUEUE_HIGH_WATER
+# queued records, handle_client stops reading its
+# socket (wait_for_capacity) until the queue drains
+# below INGEST_QUEUE_LOW_WATER, so TCP flow control
+# slows the devices down.
+#
+# Load shedding: above INGEST_SHED_LIMIT queued
+# records new samples are dropped according to
+# INGEST_SHED_POLICY:
+#   "keep_transitions"  drop samples, except those where
+#                       the device's out_of_bed state changes
+#   "drop_all"          drop every new sample
+#   None                never drop (memory is not capped)
+# -----------------------------------------------
+import asyncio
+import struct
+from collections import deque
+
+import app.environment.environment as environment
+import app.routes.api.system_log as system_log
+import app.services.metrics as metrics
+
+SHED_POLICIES = (None, "keep_transitions", "drop_all")
+
+# breath_bpm and heart_bpm of a 28/36-byte record (bytes 0-3 and 8-11)
+_BPM = struct.Struct('>f4xf')
+
+# Log the queues this often while something is queued or dropped
+STATS_LOG_INTERVAL = 30
+
+# Publish this many samples before yielding to the event loop
+PUBLISH_CHUNK = 256
+
+# -----------------------------------------------
+# Global variables
+# -----------------------------------------------
+high_water = 5000
+low_water = 2500
+shed_limit = 20000
+shed_policy = "keep_transitions"
+
+process_queue = deque()    # (client_id, [content_data, ...]) waiting to be decoded
+process_depth = 0          # Records in process_queue
+publish_queue = None       # asyncio.Queue of sample dicts waiting to be published
+in_flight = deque()        # Samples of the item being moved to publish_queue, kept for stop()
+
+paused_readers = 0         # handle_client loops currently waiting for capacity
+shedding = False
+dropped = 0                # Samples dropped by the shedding policy since start
+kept_transitions = 0       # Samples kept while shedding because out_of_bed changed
+last_out_of_bed = {}       # device_id -> out_of_bed state of its last received sample
+
+_process_fn = None
+_publish_fn = None
+_tasks = []
+_capacity = None           # Set while the process queue is below the high-water mark
+_queued = None             # Set while process_queue is not empty
+
+# -----------------------------------------------
+# Start the process and publish tasks.
+# process(client_id, contents) returns the sample
+# dicts of one group of records,
+# publish(sample) publishes one of them.
+# -----------------------------------------------
+def start(process, publish):
+    global high_water, low_water, shed_limit, shed_policy
+    global publish_queue, _process_fn, _publish_fn, _capacity, _queued, shedding
+
+    if _tasks:
+        return  # Already running
+
+    high_water = max(1, int(environment.INGEST_QUEUE_HIGH_WATER))
+    low_water = min(high_water, max(0, int(environment.INGEST_QUEUE_LOW_WATER)))
+    shed_limit = max(high_water, int(environment.INGEST_SHED_LIMIT))
+
+    shed_policy = environment.INGEST_SHED_POLICY
+    if shed_policy not in SHED_POLICIES:
+        print(f"[Ingest] Unknown INGEST_SHED_POLICY={shed_policy!r}, using 'keep_transitions'.")
+        system_log.log_to_redis(f"[Ingest] Unknown INGEST_SHED_POLICY={shed_policy!r}, using 'keep_transitions'.")
+        shed_policy = "keep_transitions"
+
+    _process_fn = process
+    _publish_fn = publish
+    publish_queue = asyncio.Queue(maxsize=max(1, int(environment.INGEST_PUBLISH_QUEUE_SIZE)))
+
+    _capacity = asyncio.Event()
+    _capacity.set()
+    _queued = asyncio.Event()
+    shedding = False
+
+    _tasks.append(asyncio.create_task(_process_loop()))
+    _tasks.append(asyncio.create_task(_publish_loop()))
+    _tasks.append(asyncio.create_task(_stats_loop()))
+
+# -----------------------------------------------
+# Stop the tasks and publish everything that is
+# still queued (called after the clients are closed)
+# -----------------------------------------------
+async def stop():
+    global process_depth, _process_fn, _publish_fn
+
+    for task in _tasks:
+        task.cancel()
+    for task in _tasks:
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    _tasks.clear()
+
+    if _publish_fn is None:
+        return
+
+    while not publish_queue.empty():
+        _publish_one(publish_queue.get_nowait())
+
+    # The process task was cancelled while it waited to queue these
+    while in_flight:
+        _publish_one(in_flight.popleft())
+
+    while process_queue:
+        client_id, contents = process_queue.popleft()
+        for sample in _process_one(client_id, contents):
+            _publish_one(sample)
+    process_depth = 0
+    last_out_of_bed.clear()
+
+    _process_fn = None
+    _publish_fn = None
+
+def running():
+    return bool(_tasks)
+
+# -----------------------------------------------
+# Called by handle_client before every read:
+# returns at once unless the queue is above the
+# high-water mark
+# -----------------------------------------------
+async def wait_for_capacity():
+    global paused_readers
+
+    if _capacity is None or _capacity.is_set():
+        return
+
+    paused_readers += 1
+    try:
+        await _capacity.wait()
+    finally:
+        paused_readers -= 1
+
+# -----------------------------------------------
+# Queue the 0x03e8 records of one device
+# (never blocks, sheds instead)
+# -----------------------------------------------
+def submit(client_id, contents):
+    global process_depth, dropped, kept_transitions, shedding
+
+    if process_depth >= shed_limit and shed_policy is not None:
+        if not shedding:
+            shedding = True
+            print(f"[Ingest] {process_depth} records queued, shedding samples ({shed_policy}).")
+            system_log.log_to_redis(f"[Ingest] {process_depth} records queued, shedding samples ({shed_policy}).")
+
+        kept = _shed(client_id, contents)
+        dropped += len(contents) - len(kept)
+        kept_transitions += len(kept)
+        contents = kept
+    else:
+        _track_state(client_id, contents)
+
+    if not contents:
+        return
+
+    process_queue.append((client_id, contents))
+    process_depth += len(contents)
+    _queued.set()
+
+    if process_depth >= high_water and _capacity.is_set():
+        _capacity.clear()
+        print(f"[Ingest] {process_depth} records queued, pausing socket reads.")
+        system_log.log_to_redis(f"[Ingest] {process_depth} records queued, pausing socket reads.")
+
+# -----------------------------------------------
+# Drop the shedding state of a device whose
+# connection closed (or that changed its ID)
+# -----------------------------------------------
+def forget(client_id):
+    last_out_of_bed.pop(client_id, None)
+
+def reading_paused():
+    return _capacity is not None and not _capacity.is_set()
+
+# -----------------------------------------------
+# Queue depths and drop counters
+# -----------------------------------------------
+def get_stats():
+    return {
+        "process_queue_records": process_depth,
+        "publish_queue_samples": publish_queue.qsize() if publish_queue is not None else 0,
+        "paused_readers": paused_readers,
+        "reading_paused": reading_paused(),
+        "shedding": shedding,
+        "dropped_samples": dropped,
+        "kept_transitions": kept_transitions,
+    }
+
+
+def _is_out_of_bed(content_data):
+    if len(content_data) < _BPM.size:
+        return False
+    breath_bpm, heart_bpm = _BPM.unpack_from(content_data)
+    # Same rule as handle_data.check_in_out_of_bed: both rates truncate to 0
+    return -1.0 < breath_bpm < 1.0 and -1.0 < heart_bpm < 1.0
+
+
+def _track_state(client_id, contents):
+    last_out_of_bed[client_id] = _is_out_of_bed(contents[-1])
+
+
+def _shed(client_id, contents):
+    if shed_policy == "drop_all":
+        _track_state(client_id, contents)
+        return []
+
+    kept = []
+    state = last_out_of_bed.get(client_id)
+    for content_data in contents:
+        out_of_bed = _is_out_of_bed(content_data)
+        if out_of_bed != state:
+            kept.append(content_data)  # Bed exit / return: always delivered
+            state = out_of_bed
+    last_out_of_bed[client_id] = state
+    return kept
+
+# -----------------------------------------------
+# One queue item. If the callback fails on the
+# group, its records are processed one by one so
+# only the failing record is logged, counted and
+# skipped: the tasks must not die, or the readers
+# stay paused for good.
+# -----------------------------------------------
+def _process_one(client_id, contents):
+    if len(contents) > 1:
+        try:
+            return list(_process_fn(client_id, contents))
+        except Exception:
+            pass  # Find the failing record(s) below
+
+    samples = []
+    for content_data in contents:
+        try:
+            samples.extend(_process_fn(client_id, [content_data]))
+        except Exception as e:
+            metrics.count_parse_error("process")
+            print(f"[Ingest] Failed to process a record of ID={client_id}: {e!r}")
+            system_log.log_to_redis(f"[Ingest] Failed to process a record of ID={client_id}: {e!r}", system_log.ERROR)
+    return samples
+
+def _publish_one(sample):
+    try:
+        _publish_fn(sample)
+    except Exception as e:
+        metrics.count_parse_error("publish")
+        print(f"[Ingest] Failed to publish a sample of ID={sample.get('device_id')}: {e!r}")
+        system_log.log_to_redis(f"[Ingest] Failed to publish a sample of ID={sample.get('device_id')}: {e!r}", system_log.ERROR)
+
+async def _process_loop():
+    global process_depth, shedding
+
+    while True:
+        if not process_queue:
+            _queued.clear()
+            await _queued.wait()
+
+        client_id, contents = process_queue.popleft()
+        process_depth -= len(contents)
+
+        in_flight.extend(_process_one(client_id, contents))
+        while in_flight:
+            # Waits here while the publish queue is full, so process_queue grows instead.
+            # A put cancelled by stop() does not queue the sample, it stays in in_flight.
+            await publish_queue.put(in_flight[0])
+            in_flight.popleft()
+
+        if process_depth <= low_water and not _capacity.is_set():
+            _capacity.set()
+            print(f"[Ingest] Queue down to {process_depth} records, resuming socket reads.")
+            system_log.log_to_redis(f"[Ingest] Queue down to {process_depth} records, resuming socket reads.")
+
+        if shedding and process_depth < shed_limit:
+            shedding = False
+            print(f"[Ingest] Stopped shedding, {dropped} samples dropped so far.")
+            system_log.log_to_redis(f"[Ingest] Stopped shedding, {dropped} samples dropped so far.")
+
+        await asyncio.sleep(0)  # Let the readers and the publish task run
+
+# -----------------------------------------------
+# Hand sample dicts to the batcher / MQTT / spool
+# -----------------------------------------------
+async def _publish_loop():
+    while True:
+        sample = await publish_queue.get()
+        _publish_one(sample)
+
+        # get_nowait() does not yield, so give the loop a turn every PUBLISH_CHUNK samples
+        for _ in range(PUBLISH_CHUNK - 1):
+            if publish_queue.empty():
+                break
+            _publish_one(publish_queue.get_nowait())
+
+        await asyncio.sleep(0)
+
+# -----------------------------------------------
+# Report the queues while they are in use
+# -----------------------------------------------
+async def _stats_loop():
+    while True:
+        await asyncio.sleep(STATS_LOG_INTERVAL)
+        stats = get_stats()
+        if stats["process_queue_records"] or stats["publish_queue_samples"] or stats["shedding"]:
+            print(f"[Ingest] Queued: {stats['process_queue_records']} records, "
+                  f"{stats['publish_queue_samples']} samples to publish, "
+                  f"{stats['paused_readers']} reader(s) paused, {stats['dropped_samples']} dropped")
+            system_log.log_to_redis(f"[Ingest] Queued: {stats['process_queue_records']} records, "
+                                    f"{stats['publish_queue_samples']} samples to publish, "
+                                    f"{stats['paused_readers']} reader(s) paused, {stats['dropped_samples']} dropped")
@@ -0,0 +1,355 @@
+# -----------------------------------------------
+# Search index of the system log files
+#
+# Maintained by the log file thread of each process
+# while it writes (system_log.LogFileHandler), in one
+# SQLite database next to the log files:
+#
+#   files     one row per log file (active, rotated or
+#             gzipped): name, bytes indexed, compressed
+#   buckets   (file, minute) -> offset of the first line
+#             of that minute in the file
+#   postings  (term, minute, file) -> byte range from
+#             the first to the end of the last line
+#             mentioning the term; terms are device IDs
+#             ("id:<hex>") and IPs ("ip:<address>")
+#   chunks    gzipped files only: uncompressed offset ->
+#             offset of the gzip member holding it
+#
+# Rotated files are compressed as a series of
+# independent gzip members of CHUNK_SIZE bytes each
+# (still one valid .gz file for zcat), so a query
+# decompresses only the chunks of its byte ranges.
+#
+# search() answers "device X between T1 and T2" by
+# reading just the ranges the index points to, never
+# scanning whole files.
+# -----------------------------------------------
+import bisect
+import gzip
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime
+
+INDEX_FILE = "log_index.sqlite3"
+
+BUCKET_SECONDS = 60        # Time granularity of the index
+CHUNK_SIZE = 64 * 1024     # Uncompressed bytes per gzip member of a rotated file
+SEARCH_MAX_BYTES = 64 * 1024 * 1024  # Most log bytes one search reads
+COMMIT_INTERVAL = 1.0      # Seconds between index transactions of a writer (searches lag by this much)
+
+# Device IDs as the server logs them: ID=<hex>, "device_id": "<hex>", "... with <hex>"
+_DEVICE_PATTERN = re.compile(r'(?:ID=|"device_id": "|with )([0-9a-fA-F]{8,})\b')
+_IP_PATTERN = re.compile(r'\b(?:\d{1,3}\.){3}\d{1,3}\b')
+
+# Start of a formatted log line: "2025-01-31 03:00:12,345 - INFO - ..."
+_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+_TIME_LENGTH = 19
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL,
+    size INTEGER NOT NULL DEFAULT 0,
+    compressed INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS buckets (
+    file_id INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    PRIMARY KEY (file_id, bucket)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS buckets_by_time ON buckets (bucket);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    file_id INTEGER NOT NULL,
+    first INTEGER NOT NULL,
+    end INTEGER NOT NULL,
+    PRIMARY KEY (term, bucket, file_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_by_file ON postings (file_id);
+CREATE TABLE IF NOT EXISTS chunks (
+    file_id INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    compressed_offset INTEGER NOT NULL,
+    PRIMARY KEY (file_id, offset)
+) WITHOUT ROWID;
+"""
+
+
+def terms(message):
+    # Index terms of one log message
+    found = set()
+    if "ID=" in message or "device_id" in message or "with " in message:
+        for device_id in _DEVICE_PATTERN.findall(message):
+            found.add("id:" + device_id.lower())
+    if "." in message:
+        for ip in _IP_PATTERN.findall(message):
+            found.add("ip:" + ip)
+    return found
+
+
+class LogIndex:
+    """
+    Connection to the index database. One instance per thread that uses it (the log
+    file thread, the compressor thread, a search request); several processes share
+    the database (WAL mode, writers wait for each other).
+
+    Writer side: open_file() when a log file is opened, add() for every line written,
+    commit() after the lines have been flushed to disk, so the index never points past
+    what is on disk. commit(force=False) only writes every COMMIT_INTERVAL seconds: one
+    transaction per log batch would cost far more than writing the log lines.
+    """
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+        self.connection = sqlite3.connect(os.path.join(self.directory, INDEX_FILE),
+                                          timeout=5.0, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(_SCHEMA)
+
+        self.errors = 0
+        self._committed_at = time.monotonic()
+        self._sizes = {}        # file_id -> bytes written so far (committed as files.size)
+        self._buckets = {}      # (file_id, bucket) -> first offset, pending
+        self._last_bucket = {}  # file_id -> newest bucket already recorded
+        self._postings = {}     # (term, bucket, file_id) -> [first, end], pending
+
+    def close(self):
+        self.connection.close()
+
+    # -------------------------------------------
+    # Writer side
+    # -------------------------------------------
+    def open_file(self, name, size):
+        with self.connection:
+            self.connection.execute("INSERT OR IGNORE INTO files (name) VALUES (?)", (name,))
+            file_id, = self.connection.execute("SELECT id FROM files WHERE name = ?", (name,)).fetchone()
+            self.connection.execute("UPDATE files SET size = ? WHERE id = ?", (size, file_id))
+        self._sizes[file_id] = size
+        self._last_bucket[file_id] = None
+        return file_id
+
+    def add(self, file_id, created, offset, end, message):
+        bucket = int(created // BUCKET_SECONDS)
+        if bucket != self._last_bucket.get(file_id):
+            self._last_bucket[file_id] = bucket
+            self._buckets.setdefault((file_id, bucket), offset)
+
+        for term in terms(message):
+            posting = self._postings.get((term, bucket, file_id))
+            if posting is None:
+                self._postings[(term, bucket, file_id)] = [offset, end]
+            else:
+                posting[1] = end
+
+        self._sizes[file_id] = end
+
+    def commit(self, force=True):
+        if not force and time.monotonic() - self._committed_at < COMMIT_INTERVAL:
+            return True
+        self._committed_at = time.monotonic()
+
+        buckets, self._buckets = self._buckets, {}
+        postings, self._postings = self._postings, {}
+        try:
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO buckets (file_id, bucket, offset) VALUES (?, ?, ?)",
+                    [(file_id, bucket, offset) for (file_id, bucket), offset in buckets.items()])
+                # A term seen again in the same minute extends the range of the earlier batch
+                self.connection.executemany(
+                    "INSERT INTO postings (term, bucket, file_id, first, end) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (term, bucket, file_id) DO UPDATE SET end = excluded.end",
+                    [(term, bucket, file_id, first, end) for (term, bucket, file_id), (first, end) in postings.items()])
+                self.connection.executemany(
+                    "UPDATE files SET size = ? WHERE id = ?",
+                    [(size, file_id) for file_id, size in self._sizes.items()])
+            return True
+        except sqlite3.Error as e:
+            # The log file itself is fine, only these lines are not searchable
+            self.errors += 1
+            print(f"[Log] Could not update the log index: {e}")
+            return False
+
+    def rename_file(self, file_id, name):
+        with self.connection:
+            self.connection.execute("UPDATE files SET name = ? WHERE id = ?", (name, file_id))
+        self._sizes.pop(file_id, None)
+        self._last_bucket.pop(file_id, None)
+
+    def compressed_file(self, name, compressed_name, chunks):
+        with self.connection:
+            row = self.connection.execute("SELECT id FROM files WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                return  # Written before the index existed
+            self.connection.execute("UPDATE files SET name = ?, compressed = 1 WHERE id = ?", (compressed_name, row[0]))
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO chunks (file_id, offset, compressed_offset) VALUES (?, ?, ?)",
+                [(row[0], offset, compressed_offset) for offset, compressed_offset in chunks])
+
+    def remove_files(self, names):
+        with self.connection:
+            for name in names:
+                row = self.connection.execute("SELECT id FROM files WHERE name = ?", (name,)).fetchone()
+                if row is None:
+                    continue
+                for table in ("buckets", "postings", "chunks"):
+                    self.connection.execute(f"DELETE FROM {table} WHERE file_id = ?", row)
+                self.connection.execute("DELETE FROM files WHERE id = ?", row)
+
+    def prune(self):
+        # Forget files that are gone (deleted by hand, or before a crash)
+        names = [name for name, in self.connection.execute("SELECT name FROM files")]
+        self.remove_files([name for name in names if not os.path.exists(os.path.join(self.directory, name))])
+
+    # -------------------------------------------
+    # Query side
+    # -------------------------------------------
+    def _ranges(self, term, first_bucket, last_bucket):
+        # file_id -> sorted, merged [start, end) byte ranges
+        ranges = {}
+        if term:
+            rows = self.connection.execute(
+                "SELECT file_id, first, end FROM postings WHERE term = ? AND bucket BETWEEN ? AND ?",
+                (term, first_bucket, last_bucket))
+        else:
+            # Whole minutes: from the first line of the first bucket to the first line after the last one
+            rows = self.connection.execute(
+                "SELECT b.file_id, MIN(b.offset), "
+                "COALESCE((SELECT MIN(n.offset) FROM buckets n WHERE n.file_id = b.file_id AND n.bucket > ?), f.size) "
+                "FROM buckets b JOIN files f ON f.id = b.file_id "
+                "WHERE b.bucket BETWEEN ? AND ? GROUP BY b.file_id",
+                (last_bucket, first_bucket, last_bucket))
+
+        for file_id, start, end in rows:
+            ranges.setdefault(file_id, []).append([start, end])
+
+        for file_id, spans in ranges.items():
+            spans.sort()
+            merged = [spans[0]]
+            for start, end in spans[1:]:
+                if start <= merged[-1][1]:
+                    merged[-1][1] = max(merged[-1][1], end)
+                else:
+                    merged.append([start, end])
+            ranges[file_id] = merged
+        return ranges
+
+    def _read(self, file_id, spans):
+        # Raw bytes of each span, decompressing only the gzip members they fall in
+        name, compressed = self.connection.execute(
+            "SELECT name, compressed FROM files WHERE id = ?", (file_id,)).fetchone()
+        path = os.path.join(self.directory, name)
+
+        if not compressed:
+            with open(path, "rb") as file:
+                for start, end in spans:
+                    file.seek(start)
+                    yield file.read(end - start)
+            return
+
+        chunks = self.connection.execute(
+            "SELECT offset, compressed_offset FROM chunks WHERE file_id = ? ORDER BY offset", (file_id,)).fetchall()
+        offsets = [offset for offset, _ in chunks] or [0]
+        compressed_offsets = [compressed_offset for _, compressed_offset in chunks] or [0]
+
+        with open(path, "rb") as file:
+            for start, end in spans:
+                index = bisect.bisect_right(offsets, start) - 1
+                file.seek(compressed_offsets[index])
+                # GzipFile carries on into the following members
+                with gzip.GzipFile(fileobj=file, mode="rb") as reader:
+                    reader.read(start - offsets[index])
+                    yield reader.read(end - start)
+
+    def search(self, device="", ip="", start=None, end=None, text="", limit=1000):
+        """
+        Log lines mentioning device ID 'device' and/or IP 'ip' (or every line if both
+        are empty), logged between the timestamps start and end, containing 'text'.
+        Returns (lines, truncated), oldest first, at most 'limit' lines.
+        """
+        end = time.time() if end is None else end
+        start = end - 3600 if start is None else start
+
+        wanted = set()
+        if device:
+            wanted.add("id:" + device.lower())
+        if ip:
+            wanted.add("ip:" + ip)
+        # The first term narrows the byte ranges, every line must then have all of them
+        term = min(wanted) if wanted else None
+
+        first_second = datetime.fromtimestamp(start).strftime(_TIME_FORMAT)
+        last_second = datetime.fromtimestamp(end).strftime(_TIME_FORMAT)
+
+        found = []
+        budget = SEARCH_MAX_BYTES
+        truncated = False
+
+        for file_id, spans in self._ranges(term, int(start // BUCKET_SECONDS), int(end // BUCKET_SECONDS)).items():
+            for attempt in range(2):
+                try:
+                    lines, read = self._match(file_id, spans, first_second, last_second, wanted, text, limit, budget)
+                    break
+                except FileNotFoundError:
+                    # Rotated or compressed while being read: the index has the new name by now
+                    lines, read = [], 0
+                    time.sleep(0.05)
+
+            found += lines
+            budget -= read
+            if len(lines) >= limit or budget <= 0:
+                truncated = True
+            if budget <= 0:
+                break
+
+        # Several processes write their own files: merge them in time order
+        found.sort(key=lambda line: line[:23])
+        if len(found) > limit:
+            found = found[:limit]
+            truncated = True
+        return found, truncated
+
+    def _match(self, file_id, spans, first_second, last_second, wanted, text, limit, budget):
+        lines = []
+        read = 0
+        for data in self._read(file_id, spans):
+            read += len(data)
+            for line in data.decode("utf-8", errors="replace").splitlines():
+                if not first_second <= line[:_TIME_LENGTH] <= last_second:
+                    continue
+                if text and text not in line:
+                    continue
+                if wanted and not wanted <= terms(line):
+                    continue
+                lines.append(line)
+                if len(lines) >= limit:
+                    return lines, read
+            if read >= budget:
+                break
+        return lines, read
+
+
+def compress(path, target):
+    """
+    gzip 'path' into 'target' as independent members of CHUNK_SIZE uncompressed bytes.
+    Returns the (uncompressed offset, compressed offset) of every member.
+    """
+    chunks = []
+    offset = 0
+    with open(path, "rb") as source, open(target, "wb") as output:
+        while True:
+            data = source.read(CHUNK_SIZE)
+            if not data:
+                break
+            chunks.append((offset, output.tell()))
+            output.write(gzip.compress(data, compresslevel=6, mtime=0))
+            offset += len(data)
+        output.flush()
+        os.fsync(output.fileno())
+    return chunks
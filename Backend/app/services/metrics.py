@@ -0,0 +1,250 @@
+# -----------------------------------------------
+# Prometheus-style metrics and health probes
+#
+# Counters and histograms are plain in-memory
+# values updated on the hot path (no Redis, no
+# environment reload). A small aiohttp server on
+# METRICS_PORT exposes them:
+#
+#   GET /metrics   Prometheus text format
+#   GET /healthz   liveness: the event loop answers
+#   GET /readyz    readiness: the TCP server accepts
+#                  devices and samples can be published
+#
+# Each process serves its own endpoint: the main
+# process on METRICS_PORT, TCP worker N (multi-
+# process mode) on METRICS_PORT + N + 1.
+#
+# Queue / session / connection / spool figures are
+# read at scrape time from the get_stats() of the
+# modules that own them (register_collector).
+#
+# This module must not import system_log: system_log
+# reports its Redis latency here.
+# -----------------------------------------------
+import asyncio
+import bisect
+import threading
+import time
+
+from aiohttp import web
+
+PREFIX = "vital"
+
+# Seconds; publish acks, Redis round trips and event loop lag
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# How often the event loop lag is sampled
+LOOP_LAG_INTERVAL = 0.5
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram in the Prometheus sense. observe() is called from the
+    event loop and from the paho / logging threads, hence the lock.
+    """
+
+    __slots__ = ("buckets", "counts", "sum", "count", "lock")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot: +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.sum, self.count
+
+# -----------------------------------------------
+# Global variables
+# -----------------------------------------------
+frames = {}           # function code -> frames received
+parse_errors = {}     # reason -> count ("framing", "unknown_function", "record_length", "non_finite", "process", "publish")
+publishes = {}        # result -> count ("success", "spooled", "failed", "replayed")
+
+publish_latency = Histogram()   # publish() -> PUBACK, seconds
+redis_latency = Histogram()     # One pipelined log batch, seconds
+loop_lag = Histogram()          # Event loop wake-up delay, seconds
+loop_lag_last = 0.0
+
+started_at = time.time()
+
+_collectors = []        # (name, get_stats function)
+_readiness = None       # Function returning (ready, reason)
+_runner = None
+_lag_task = None
+
+# -----------------------------------------------
+# Hot path updates
+# -----------------------------------------------
+def count_frame(function):
+    frames[function] = frames.get(function, 0) + 1
+
+def count_parse_error(reason, count=1):
+    parse_errors[reason] = parse_errors.get(reason, 0) + count
+
+def count_publish(result):
+    publishes[result] = publishes.get(result, 0) + 1
+
+# -----------------------------------------------
+# Sources read at scrape time. get_stats() returns
+# a flat dict; numbers and booleans are exported
+# as vital_<name>_<key> gauges, None is skipped.
+# -----------------------------------------------
+def register_collector(name, get_stats):
+    for index, (existing, _) in enumerate(_collectors):
+        if existing == name:
+            _collectors[index] = (name, get_stats)
+            return
+    _collectors.append((name, get_stats))
+
+# check() returns (ready, reason) for /readyz
+def set_readiness_check(check):
+    global _readiness
+    _readiness = check
+
+# -----------------------------------------------
+# Prometheus text format
+# -----------------------------------------------
+def _format_value(value):
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _histogram_lines(name, help_text, histogram):
+    counts, total, count = histogram.snapshot()
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+
+    cumulative = 0
+    for bound, bucket_count in zip(histogram.buckets, counts):
+        cumulative += bucket_count
+        lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{le="+Inf"}} {count}')
+    lines.append(f"{name}_sum {total!r}")
+    lines.append(f"{name}_count {count}")
+    return lines
+
+
+def render():
+    lines = [
+        f"# HELP {PREFIX}_frames_total Device frames received, by function code",
+        f"# TYPE {PREFIX}_frames_total counter",
+    ]
+    for function, count in sorted(frames.items()):
+        lines.append(f'{PREFIX}_frames_total{{function="0x{function:04x}"}} {count}')
+
+    lines.append(f"# HELP {PREFIX}_parse_errors_total Frames or records that could not be decoded")
+    lines.append(f"# TYPE {PREFIX}_parse_errors_total counter")
+    for reason, count in sorted(parse_errors.items()):
+        lines.append(f'{PREFIX}_parse_errors_total{{reason="{reason}"}} {count}')
+
+    lines.append(f"# HELP {PREFIX}_publishes_total MQTT publishes, by result")
+    lines.append(f"# TYPE {PREFIX}_publishes_total counter")
+    for result, count in sorted(publishes.items()):
+        lines.append(f'{PREFIX}_publishes_total{{result="{result}"}} {count}')
+
+    lines += _histogram_lines(f"{PREFIX}_publish_latency_seconds", "Time from publish to PUBACK", publish_latency)
+    lines += _histogram_lines(f"{PREFIX}_redis_log_latency_seconds", "Pipelined Redis write of one log batch", redis_latency)
+    lines += _histogram_lines(f"{PREFIX}_event_loop_lag_seconds", "Delay of the event loop waking a sleeping task", loop_lag)
+
+    lines.append(f"# TYPE {PREFIX}_event_loop_lag_last_seconds gauge")
+    lines.append(f"{PREFIX}_event_loop_lag_last_seconds {loop_lag_last!r}")
+    lines.append(f"# TYPE {PREFIX}_uptime_seconds gauge")
+    lines.append(f"{PREFIX}_uptime_seconds {time.time() - started_at:.3f}")
+
+    for name, get_stats in _collectors:
+        try:
+            stats = get_stats()
+        except Exception as e:
+            lines.append(f"# {name}: {e}")
+            continue
+
+        for key, value in stats.items():
+            if value is None or not isinstance(value, (int, float)):
+                continue
+            metric = f"{PREFIX}_{name}_{key}"
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {_format_value(value)}")
+
+    return "\n".join(lines) + "\n"
+
+# -----------------------------------------------
+# Event loop lag: how late a 0.5 s sleep wakes up
+# -----------------------------------------------
+async def _loop_lag_loop():
+    global loop_lag_last
+
+    while True:
+        expected = time.monotonic() + LOOP_LAG_INTERVAL
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        loop_lag_last = max(0.0, time.monotonic() - expected)
+        loop_lag.observe(loop_lag_last)
+
+# -----------------------------------------------
+# HTTP handlers (no Redis, no environment reload)
+# -----------------------------------------------
+async def _metrics(request):
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+async def _healthz(request):
+    return web.Response(text="ok\n")
+
+async def _readyz(request):
+    if _readiness is None:
+        return web.Response(text="ok\n")
+
+    ready, reason = _readiness()
+    if ready:
+        return web.Response(text="ok\n")
+    return web.Response(status=503, text=f"{reason}\n")
+
+# -----------------------------------------------
+# Start / stop the endpoint of this process
+# -----------------------------------------------
+async def start_server(host, port):
+    global _runner, _lag_task
+
+    if _runner is not None:
+        return
+
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics)
+    app.router.add_get("/healthz", _healthz)
+    app.router.add_get("/readyz", _readyz)
+
+    runner = web.AppRunner(app, access_log=None)  # Probes hit this every second
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError:
+        await runner.cleanup()
+        raise
+
+    _runner = runner
+    _lag_task = asyncio.create_task(_loop_lag_loop())
+
+async def stop_server():
+    global _runner, _lag_task
+
+    if _lag_task is not None:
+        _lag_task.cancel()
+        _lag_task = None
+
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
+
+def running():
+    return _runner is not None
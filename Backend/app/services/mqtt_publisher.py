@@ -0,0 +1,347 @@
+# -----------------------------------------------
+# Shared MQTT publisher
+#
+# A small pool of long-lived MQTT connections to
+# AWS IoT that every handle_client coroutine
+# publishes through, instead of one paho client
+# (TLS session + network thread) per device.
+#
+# The "mqtt-pool" thread keeps the pool in shape
+# while it runs: connections whose TLS setup
+# failed (certificate missing or invalid) are
+# retried every POOL_CHECK_INTERVAL seconds, and
+# the pool is rebuilt when the endpoint or the
+# certificate files change (upload, "reload").
+# -----------------------------------------------
+import os
+import ssl
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+import app.environment.environment as environment
+import app.environment.environment_manager as environment_manager
+import app.routes.api.system_log as system_log
+import app.services.metrics as metrics
+import app.services.status_registry as status_registry
+
+# -----------------------------------------------
+# Global variables
+# -----------------------------------------------
+connections = []  # _PooledConnection objects, empty while the pool is stopped
+
+_on_publish_callback = None  # Extra callback fired for every acknowledged message
+_pool_lock = threading.Lock()
+
+# Seconds between checks of the pool (missing connections, changed certificates)
+POOL_CHECK_INTERVAL = 10
+
+_settings = None          # (pool_size, max_inflight, client_id_prefix) while the pool runs
+_signature = None         # _config_signature() the current connections were built with
+_check_thread = None
+_check_event = threading.Event()    # Set to check at once (reload / stop)
+_stopping = False
+
+pool_rebuilds = 0
+tls_errors = 0
+
+
+class _PooledConnection:
+    """
+    One paho client of the pool and the bookkeeping the pool needs about it.
+    'connected' and 'inflight' are updated from the paho network thread.
+    """
+
+    def __init__(self, client_id, max_inflight):
+        self.client_id = client_id
+        self.max_inflight = max_inflight
+        self.connected = False
+        self.inflight = 0
+        self.sent = {}  # mid -> (time.monotonic() of the publish, topic), for the PUBACK latency and last ack
+        self.lock = threading.Lock()
+
+        self.client = mqtt.Client(client_id=client_id, userdata=self)
+        self.client.on_connect = _on_connect
+        self.client.on_disconnect = _on_disconnect
+        self.client.on_publish = _on_publish
+
+        # paho keeps its own window too, keep it in line with ours
+        self.client.max_inflight_messages_set(max_inflight)
+
+        # Back off between 1 and 60 seconds while AWS IoT is unreachable
+        self.client.reconnect_delay_set(min_delay=1, max_delay=60)
+
+        # Configure SSL for secure connections to AWS IoT
+        self.client.tls_set(ca_certs=environment.root_ca_path,
+                            certfile=environment.cert_path,
+                            keyfile=environment.private_key_path,
+                            tls_version=ssl.PROTOCOL_TLSv1_2)
+
+    def try_acquire(self):
+        with self.lock:
+            if not self.connected or self.inflight >= self.max_inflight:
+                return False
+            self.inflight += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            if self.inflight > 0:
+                self.inflight -= 1
+
+# -----------------------------------------------
+# paho callbacks (run in the network thread of
+# each pooled client)
+# -----------------------------------------------
+def _on_connect(client, userdata, flags, rc):
+    if rc == 0:
+        userdata.connected = True
+        status_registry.set_aws_status(True)  # Written only if it was disconnected
+        print(f"[MQTT] {userdata.client_id} connected to {environment.AWS_IOT_ENDPOINT}")
+        system_log.log_to_redis(f"[MQTT] {userdata.client_id} connected to {environment.AWS_IOT_ENDPOINT}")
+    else:
+        print(f"[MQTT] {userdata.client_id} connection refused, rc={rc}")
+        system_log.log_to_redis(f"[MQTT] {userdata.client_id} connection refused, rc={rc}")
+
+def _on_disconnect(client, userdata, rc):
+    userdata.connected = False
+    userdata.sent.clear()  # Acks after the reconnect would measure the outage, not the broker
+
+    # The last pooled connection went down (or the pool was stopped)
+    if not is_connected():
+        status_registry.set_aws_status(False)
+
+    # paho reconnects on its own from loop_start(), unless we asked for the disconnect
+    if rc != 0:
+        print(f"[MQTT] {userdata.client_id} lost connection (rc={rc}), reconnecting...")
+        system_log.log_to_redis(f"[MQTT] {userdata.client_id} lost connection (rc={rc}), reconnecting...")
+
+def _on_publish(client, userdata, mid):
+    userdata.release()
+
+    sent = userdata.sent.pop(mid, None)
+    if sent is not None:
+        sent_at, topic = sent
+        metrics.publish_latency.observe(time.monotonic() - sent_at)
+        status_registry.record_ack(topic)
+
+    if _on_publish_callback is not None:
+        _on_publish_callback(client, userdata, mid)
+
+# -----------------------------------------------
+# What the connections depend on: endpoint, port
+# and the certificate files (path, size, mtime),
+# so an upload over the same file name counts too
+# -----------------------------------------------
+def _config_signature():
+    files = []
+    for path in (environment.root_ca_path, environment.cert_path, environment.private_key_path):
+        try:
+            stat = os.stat(path)
+            files.append((path, stat.st_size, stat.st_mtime_ns))
+        except (OSError, TypeError):
+            files.append((path, None, None))
+    return environment.AWS_IOT_ENDPOINT, environment.MQTT_PORT, tuple(files)
+
+# -----------------------------------------------
+# Open connection 'index'; None (logged) if the
+# TLS setup or the connect call fails
+# -----------------------------------------------
+def _open_connection(index):
+    global tls_errors
+
+    pool_size, max_inflight, client_id_prefix = _settings
+    client_id = f"{client_id_prefix}-{index}"
+    try:
+        connection = _PooledConnection(client_id, max_inflight)
+
+        # connect_async() never blocks the event loop, loop_start() completes the
+        # connection and keeps reconnecting in the background
+        connection.client.connect_async(environment.AWS_IOT_ENDPOINT, environment.MQTT_PORT, 60)
+        connection.client.loop_start()
+        return connection
+    except (OSError, ssl.SSLError, ValueError) as e:
+        tls_errors += 1
+        print(f"[MQTT] Cannot open {client_id}: {e}, retrying in {POOL_CHECK_INTERVAL}s.")
+        system_log.log_to_redis(f"[MQTT] Cannot open {client_id}: {e}, retrying in {POOL_CHECK_INTERVAL}s.", system_log.ERROR)
+        return None
+
+def _close_connections(closing):
+    for connection in closing:
+        try:
+            connection.client.disconnect()
+            connection.client.loop_stop()
+        except Exception as e:
+            print(f"[MQTT] Error closing {connection.client_id}: {e}")
+            system_log.log_to_redis(f"[MQTT] Error closing {connection.client_id}: {e}")
+
+# -----------------------------------------------
+# Bring the pool to what the configuration says.
+# Caller holds _pool_lock.
+# -----------------------------------------------
+def _check_pool():
+    global connections, _signature, pool_rebuilds
+
+    signature = _config_signature()
+    if signature != _signature and _signature is not None:
+        print("[MQTT] Endpoint or certificates changed, rebuilding the publisher pool.")
+        system_log.log_to_redis("[MQTT] Endpoint or certificates changed, rebuilding the publisher pool.")
+        closing, connections = connections, []
+        _close_connections(closing)
+        pool_rebuilds += 1
+    _signature = signature
+
+    pool_size = _settings[0]
+    if len(connections) >= pool_size:
+        return
+
+    # Fill the missing slots, keeping the client IDs of the open ones
+    open_ids = {connection.client_id for connection in connections}
+    opened = []
+    for index in range(pool_size):
+        if f"{_settings[2]}-{index}" in open_ids:
+            continue
+        connection = _open_connection(index)
+        if connection is not None:
+            opened.append(connection)
+
+    if opened:
+        connections = connections + opened  # publish() iterates the old list lock-free
+        print(f"[MQTT] Publisher pool has {len(connections)}/{pool_size} connection(s) to {environment.AWS_IOT_ENDPOINT}:{environment.MQTT_PORT}")
+        system_log.log_to_redis(f"[MQTT] Publisher pool has {len(connections)}/{pool_size} connection(s) to {environment.AWS_IOT_ENDPOINT}:{environment.MQTT_PORT}")
+
+def _check_loop():
+    while True:
+        _check_event.wait(POOL_CHECK_INTERVAL)
+        _check_event.clear()
+        if _stopping:
+            return
+
+        environment_manager.refresh()  # Certificate paths / endpoint saved by the UI
+        with _pool_lock:
+            if _settings is None:
+                return
+            _check_pool()
+
+# -----------------------------------------------
+# Start the pool: open pool_size connections and
+# one network thread per connection. Connections
+# that cannot be opened yet are retried by the
+# "mqtt-pool" thread, start() itself never raises
+# for a certificate problem.
+# -----------------------------------------------
+def start(pool_size=None, max_inflight=None, on_publish=None, client_id_prefix=None):
+    global _settings, _signature, _on_publish_callback, _check_thread, _stopping
+
+    with _pool_lock:
+        if _settings is not None:
+            return  # Already running
+
+        _settings = (
+            pool_size or environment.MQTT_POOL_SIZE,
+            max_inflight or environment.MQTT_MAX_INFLIGHT,
+            client_id_prefix or environment.TCP_SERVER_NAME,
+        )
+        _signature = None
+        _on_publish_callback = on_publish
+
+        status_registry.start()  # Writes the last ack time of each device
+
+        _check_pool()
+
+        _stopping = False
+        _check_event.clear()
+        _check_thread = threading.Thread(target=_check_loop, name="mqtt-pool", daemon=True)
+        _check_thread.start()
+
+# -----------------------------------------------
+# Check the endpoint / certificates now instead of
+# within POOL_CHECK_INTERVAL ("reload" command)
+# -----------------------------------------------
+def reload():
+    if _settings is not None:
+        _check_event.set()
+
+# -----------------------------------------------
+# Stop the pool and its network threads
+# -----------------------------------------------
+def stop():
+    global connections, _settings, _check_thread, _stopping
+
+    _stopping = True
+    _check_event.set()
+    if _check_thread is not None:
+        _check_thread.join(timeout=5)
+        _check_thread = None
+
+    with _pool_lock:
+        _close_connections(connections)
+
+        if _settings is not None:
+            print("[MQTT] Publisher pool stopped.")
+            system_log.log_to_redis("[MQTT] Publisher pool stopped.")
+
+        connections = []
+        _settings = None
+
+    status_registry.stop()
+
+# -----------------------------------------------
+# Publish through the least loaded connected
+# client. Returns the paho rc:
+# - MQTT_ERR_SUCCESS: queued on a connection
+# - MQTT_ERR_NO_CONN: no connection is up
+# - MQTT_ERR_QUEUE_SIZE: every connection is at
+#   its in-flight limit
+# -----------------------------------------------
+def publish(topic, payload, qos=1):
+    candidates = sorted(connections, key=lambda c: c.inflight)
+
+    if not any(c.connected for c in candidates):
+        return mqtt.MQTT_ERR_NO_CONN
+
+    for connection in candidates:
+        if not connection.try_acquire():
+            continue
+
+        sent_at = time.monotonic()
+        info = connection.client.publish(topic, payload, qos=qos)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            connection.release()  # Not sent, _on_publish will not run for it
+        elif qos > 0:
+            # A PUBACK that beat this line leaves a stale entry behind, keep the dict bounded
+            if len(connection.sent) > connection.max_inflight * 2:
+                connection.sent.clear()
+            connection.sent[info.mid] = (sent_at, topic)
+        return info.rc
+
+    return mqtt.MQTT_ERR_QUEUE_SIZE
+
+# -----------------------------------------------
+# Return True if at least one pooled connection
+# is up
+# -----------------------------------------------
+def is_connected():
+    return any(c.connected for c in connections)
+
+# -----------------------------------------------
+# Snapshot of the pool for status pages / logs
+# -----------------------------------------------
+def get_pool_status():
+    return [
+        {"client_id": c.client_id, "connected": c.connected, "inflight": c.inflight}
+        for c in connections
+    ]
+
+# -----------------------------------------------
+# Pool totals for /metrics
+# -----------------------------------------------
+def get_stats():
+    return {
+        "connections": len(connections),
+        "connected": sum(1 for c in connections if c.connected),
+        "inflight": sum(c.inflight for c in connections),
+        "rebuilds": pool_rebuilds,
+        "tls_errors": tls_errors,
+    }
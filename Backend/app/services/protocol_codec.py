@@ -0,0 +1,211 @@
+# -----------------------------------------------
+# Device protocol codec
+#
+# Frame layout (big-endian):
+#   header (14 bytes):
+#     proto (1 byte, 0x13) | ver (1 byte) | ptype (1 byte) | cmd (1 byte)
+#     request_id (4 bytes) | timeout (2 bytes) | content_len (4 bytes)
+#   function (2 bytes, counted in content_len)
+#   content_data (content_len - 2 bytes)
+#
+# - Decoding: precompiled struct.Struct objects read
+#   straight from memoryviews, one unpack per frame.
+# - Encoding: the 0x0001 response and the 0x0410
+#   request are packed in place into a reusable
+#   per-connection ResponseBuffer and written once
+#   per read.
+# - Dispatch: handlers are registered per function
+#   code (register_handler) instead of an if/elif chain.
+# -----------------------------------------------
+import inspect
+import struct
+
+PROTO = 0x13
+VERSION = 0x01
+
+FUNCTION_REGISTER = 0x0001      # Device -> server: 13-byte ID, answered with the count
+FUNCTION_SAMPLE = 0x03e8        # Device -> server: 28- or 36-byte sample
+FUNCTION_REQUEST_ID = 0x0410    # Server -> device: "send your ID", device answers with it
+
+# Size of the fixed packet header (proto, ver, ptype, cmd, request_id, timeout, content_len)
+HEADER_LEN = 14
+
+# Header + function: the smallest valid frame
+FRAME_MIN_LEN = HEADER_LEN + 2
+
+# Upper bound for content_len. The largest frame a device sends is 0x03e8 with 36 bytes of
+# data (+ 2 bytes for 'function'), so anything far above this is garbage or a desynced stream.
+MAX_CONTENT_LEN = 4096
+
+HEADER = struct.Struct('!BBBBIHI')
+FUNCTION = struct.Struct('!H')
+
+# request_id, content_len and function of a frame in one call (proto/ver/ptype/cmd/timeout skipped)
+_FRAME_START = struct.Struct('!4xI2xIH')
+
+# Sample contents, see handle_data.parse_28_byte_content / parse_36_byte_content
+RECORD_28 = struct.Struct('>ffffffI')
+RECORD_36 = struct.Struct('>ffffffIff')
+
+# Server frames: header + function + 4-byte value
+#   0x0001 response: ptype=0x00, cmd=0x02, value = registered device count
+#   0x0410 request:  ptype=0x01, cmd=0x01, value = 0
+_SERVER_FRAME = struct.Struct('!BBBBIHIHI')
+SERVER_FRAME_LEN = _SERVER_FRAME.size
+
+
+class FrameError(ValueError):
+    """
+    Raised by FrameDecoder when a header announces an impossible content_len.
+    The stream cannot be resynchronised after this, the connection should be dropped.
+    """
+
+
+def parse_packet(data):
+    """
+    Decode one complete frame: (request_id, function, content_len, content_data).
+    Returns (0, 0, 0, b"") if data is shorter than header + function.
+    """
+    if len(data) < FRAME_MIN_LEN:
+        return (0, 0, 0, b"")  # Not enough data
+
+    # One unpack for the fields that are used, one copy for the content
+    request_id, content_len, function = _FRAME_START.unpack_from(data)
+    return request_id, function, content_len, data[FRAME_MIN_LEN : HEADER_LEN + content_len]
+
+
+class FrameDecoder:
+    """
+    Incremental framer for the device TCP protocol.
+
+    One instance per connection. feed() appends the bytes returned by reader.read()
+    to a reassembly buffer and returns every complete frame found in it as a list of
+    (request_id, function, content_len, content_data) tuples, the same shape
+    parse_packet() returns. Partial frames stay buffered until the next feed().
+
+    Frame size = HEADER_LEN + content_len (content_len counts the 2 'function' bytes).
+    """
+
+    __slots__ = ("buffer", "max_content_len")
+
+    def __init__(self, max_content_len=MAX_CONTENT_LEN):
+        self.buffer = bytearray()
+        self.max_content_len = max_content_len
+
+    def feed(self, data):
+        buffer = self.buffer
+        buffer += data
+
+        frames = []
+        offset = 0
+        available = len(buffer)
+
+        with memoryview(buffer) as view:
+            # content_len >= 2, so a complete frame is never shorter than FRAME_MIN_LEN
+            while available - offset >= FRAME_MIN_LEN:
+                # Only the frame start is inspected here, nothing is copied until the frame is complete
+                request_id, content_len, function = _FRAME_START.unpack_from(view, offset)
+
+                if content_len < 2 or content_len > self.max_content_len:
+                    view.release()
+                    buffer.clear()
+                    raise FrameError(f"invalid content_len={content_len}")
+
+                frame_end = offset + HEADER_LEN + content_len
+                if frame_end > available:
+                    break  # Wait for the rest of this frame
+
+                content_data = view[offset + FRAME_MIN_LEN : frame_end].tobytes()
+                frames.append((request_id, function, content_len, content_data))
+
+                offset = frame_end
+
+        if offset:
+            del buffer[:offset]  # Drop every consumed frame in one go
+
+        return frames
+
+
+class ResponseBuffer:
+    """
+    Reusable output buffer of one connection. The server frames produced while
+    handling one read are packed into it in place and sent with a single
+    writer.write() by flush().
+    """
+
+    __slots__ = ("buffer", "length")
+
+    def __init__(self, capacity=SERVER_FRAME_LEN * 8):
+        self.buffer = bytearray(capacity)
+        self.length = 0
+
+    def _reserve(self, size):
+        needed = self.length + size
+        if needed > len(self.buffer):
+            self.buffer.extend(bytes(max(needed - len(self.buffer), len(self.buffer))))
+        offset = self.length
+        self.length = needed
+        return offset
+
+    def register_response(self, request_id, count):
+        # 0x0001 response carrying the registered device count
+        _SERVER_FRAME.pack_into(self.buffer, self._reserve(SERVER_FRAME_LEN),
+                                PROTO, VERSION, 0x00, 0x02, request_id & 0xFFFFFFFF, 0, 6,
+                                FUNCTION_REGISTER, int(count) & 0xFFFFFFFF)
+
+    def request_id_request(self, request_id):
+        # 0x0410: ask an unknown device for its ID
+        _SERVER_FRAME.pack_into(self.buffer, self._reserve(SERVER_FRAME_LEN),
+                                PROTO, VERSION, 0x01, 0x01, request_id & 0xFFFFFFFF, 0, 6,
+                                FUNCTION_REQUEST_ID, 0)
+
+    def flush(self, writer):
+        """
+        Write everything packed since the last flush. Returns True if something was
+        written (the caller then awaits writer.drain()).
+        """
+        if not self.length:
+            return False
+
+        # Slicing copies: the transport may keep a reference to what it is given,
+        # and the buffer is reused right away
+        writer.write(self.buffer[:self.length])
+        self.length = 0
+        return True
+
+
+def encode_register_response(request_id, count):
+    return _SERVER_FRAME.pack(PROTO, VERSION, 0x00, 0x02, request_id & 0xFFFFFFFF, 0, 6,
+                              FUNCTION_REGISTER, int(count) & 0xFFFFFFFF)
+
+
+def encode_request_id_request(request_id):
+    return _SERVER_FRAME.pack(PROTO, VERSION, 0x01, 0x01, request_id & 0xFFFFFFFF, 0, 6,
+                              FUNCTION_REQUEST_ID, 0)
+
+# -----------------------------------------------
+# Function code dispatch table
+#
+# handler(context, request_id, content_data), either a
+# plain function or a coroutine function
+# -----------------------------------------------
+handlers = {}   # function -> (handler, is_coroutine)
+
+def register_handler(function, handler=None):
+    """
+    Register the handler of a function code. Usable as a decorator:
+
+        @protocol_codec.register_handler(protocol_codec.FUNCTION_SAMPLE)
+        def handle_sample(context, request_id, content_data): ...
+    """
+    def add(handler):
+        handlers[function] = (handler, inspect.iscoroutinefunction(handler))
+        return handler
+
+    if handler is None:
+        return add
+    return add(handler)
+
+def get_handler(function):
+    # (handler, is_coroutine), or None for an unknown function code
+    return handlers.get(function)
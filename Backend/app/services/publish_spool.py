@@ -0,0 +1,460 @@
+# -----------------------------------------------
+# Disk-backed store-and-forward spool
+#
+# When AWS IoT is unreachable (or every pooled
+# connection is at its in-flight limit) messages
+# are appended to segment files on disk instead of
+# being dropped, and replayed in order with a rate
+# limit once the broker accepts messages again.
+#
+# Record layout (big-endian):
+#   timestamp (8 bytes, double) | topic_len (2 bytes) | payload_len (4 bytes)
+#   topic (topic_len bytes) | payload (payload_len bytes)
+#
+# Delivery is at-least-once: a record replayed just
+# before a crash may be sent again after restart.
+# -----------------------------------------------
+import asyncio
+import os
+import struct
+import time
+
+import paho.mqtt.client as mqtt
+
+import app.environment.environment as environment
+import app.services.mqtt_publisher as mqtt_publisher
+import app.services.metrics as metrics
+import app.routes.api.system_log as system_log
+
+_RECORD_HEADER = struct.Struct('>dHI')
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".spool"
+CURSOR_FILE = "cursor"
+
+# Log the backlog this often while the spool is not empty
+STATS_LOG_INTERVAL = 30
+
+# -----------------------------------------------
+# Global variables
+# -----------------------------------------------
+spool_dir = None
+segment_bytes = 4 * 1024 * 1024
+fsync_interval = 1.0
+replay_rate = 50
+
+segments = []          # Sequence numbers of the segment files on disk, oldest first
+write_file = None      # Unbuffered handle on the newest segment
+write_size = 0
+unsynced = False       # True if write_file has data that was not fsynced yet
+
+read_seq = None        # Segment being replayed and the offset of its next record
+read_offset = 0
+
+depth_records = 0      # Records spooled and not replayed yet
+depth_bytes = 0
+
+live_credit = 0        # Live messages spooled behind the backlog while connected, replayed on top of replay_rate
+
+_tasks = []
+_wakeup = None         # Set when a record is appended, wakes the replay task
+_closing_syncs = set() # fsyncs of rolled segments still running in the executor
+
+
+def _segment_path(seq):
+    return os.path.join(spool_dir, f"{SEGMENT_PREFIX}{seq:010d}{SEGMENT_SUFFIX}")
+
+# -----------------------------------------------
+# Open the spool directory and recover any
+# backlog left by a previous run
+# -----------------------------------------------
+def start(directory=None):
+    global spool_dir, segment_bytes, fsync_interval, replay_rate
+    global segments, read_seq, read_offset, depth_records, depth_bytes, _wakeup
+
+    if _tasks:
+        return  # Already running
+
+    spool_dir = os.path.abspath(directory or environment.SPOOL_DIR)
+    segment_bytes = int(environment.SPOOL_SEGMENT_BYTES)
+    fsync_interval = float(environment.SPOOL_FSYNC_INTERVAL)
+    replay_rate = max(1, int(environment.SPOOL_REPLAY_RATE))
+
+    os.makedirs(spool_dir, exist_ok=True)
+
+    segments = sorted(
+        int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+        for name in os.listdir(spool_dir)
+        if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+    )
+
+    read_seq, read_offset = _load_cursor()
+    if read_seq not in segments:
+        read_seq = segments[0] if segments else None
+        read_offset = 0
+
+    # Count what is left to replay
+    depth_records = 0
+    depth_bytes = 0
+    for seq in segments:
+        if seq < read_seq:
+            continue
+        records, size = _scan_segment(seq, read_offset if seq == read_seq else 0)
+        depth_records += records
+        depth_bytes += size
+
+    if not depth_records:
+        # Nothing left to replay, drop empty or fully replayed segments
+        for seq in segments:
+            os.remove(_segment_path(seq))
+        segments = []
+        read_seq = None
+        read_offset = 0
+        _save_cursor()
+
+    _wakeup = asyncio.Event()
+    if depth_records:
+        _wakeup.set()
+        print(f"[Spool] Recovered {depth_records} spooled messages from {spool_dir}")
+        system_log.log_to_redis(f"[Spool] Recovered {depth_records} spooled messages from {spool_dir}")
+
+    _tasks.append(asyncio.create_task(_replay_loop()))
+    _tasks.append(asyncio.create_task(_fsync_loop()))
+    _tasks.append(asyncio.create_task(_stats_loop()))
+
+# -----------------------------------------------
+# Stop replaying, make everything durable
+# -----------------------------------------------
+async def stop():
+    global write_file
+
+    for task in _tasks:
+        task.cancel()
+    for task in _tasks:
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    _tasks.clear()
+
+    if _closing_syncs:
+        await asyncio.gather(*_closing_syncs, return_exceptions=True)
+
+    if write_file is not None:
+        _sync()
+        write_file.close()
+        write_file = None
+
+    if spool_dir is not None:
+        _save_cursor()
+
+# -----------------------------------------------
+# Publish through the MQTT pool, or spool the
+# message if that is not possible right now.
+# While a backlog is spooled, new messages are
+# appended behind it so AWS IoT receives them in
+# order. Those arriving while connected are
+# replayed on top of replay_rate (live_credit):
+# the broker sees the live rate plus replay_rate,
+# so the backlog drains even when devices send
+# faster than the replay limit.
+# Returns True if the message was handed to MQTT,
+# False if it was spooled.
+# -----------------------------------------------
+def publish(topic, payload, qos=1):
+    global live_credit
+
+    if depth_records and _wakeup is not None:
+        if mqtt_publisher.is_connected():
+            live_credit += 1
+        metrics.count_publish("spooled")
+        append(topic, payload)
+        return False
+
+    rc = mqtt_publisher.publish(topic, payload, qos=qos)
+    if rc == mqtt.MQTT_ERR_SUCCESS:
+        metrics.count_publish("success")
+        return True
+
+    if spool_dir is None or _wakeup is None:
+        metrics.count_publish("failed")
+        return False  # Spool not started, the message is lost as before
+
+    metrics.count_publish("spooled")
+
+    if depth_records == 0:
+        print(f"[Spool] Publish failed (rc={rc}), spooling messages to disk.")
+        system_log.log_to_redis(f"[Spool] Publish failed (rc={rc}), spooling messages to disk.")
+
+    append(topic, payload)
+    return False
+
+# -----------------------------------------------
+# Append one message to the active segment.
+# The data reaches the OS immediately, fsync is
+# batched by _fsync_loop().
+# -----------------------------------------------
+def append(topic, payload):
+    global write_file, write_size, unsynced, depth_records, depth_bytes, read_seq, read_offset
+
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    topic_bytes = topic.encode("utf-8")
+
+    record = _RECORD_HEADER.pack(time.time(), len(topic_bytes), len(payload)) + topic_bytes + payload
+
+    if write_file is None or write_size + len(record) > segment_bytes:
+        _roll_segment()
+
+    write_file.write(record)
+    write_size += len(record)
+    unsynced = True
+
+    if read_seq is None:
+        read_seq = segments[-1]
+        read_offset = 0
+
+    depth_records += 1
+    depth_bytes += len(record)
+    _wakeup.set()
+
+# -----------------------------------------------
+# Backlog visible to operators
+# -----------------------------------------------
+def get_stats():
+    oldest_age = None
+
+    if depth_records and read_seq is not None:
+        timestamp = _peek_timestamp(read_seq, read_offset)
+        if timestamp is not None:
+            oldest_age = max(0.0, time.time() - timestamp)
+
+    return {
+        "records": depth_records,
+        "bytes": depth_bytes,
+        "segments": len(segments),
+        "oldest_age_seconds": oldest_age,
+    }
+
+
+def _roll_segment():
+    global write_file, write_size, unsynced
+
+    if write_file is not None:
+        if unsynced:
+            # fsync a duplicate of the descriptor in the executor, not on the event loop
+            future = asyncio.get_running_loop().run_in_executor(None, _fsync_and_close, os.dup(write_file.fileno()))
+            _closing_syncs.add(future)
+            future.add_done_callback(_closing_syncs.discard)
+            unsynced = False
+        write_file.close()
+
+    seq = segments[-1] + 1 if segments else 1
+    segments.append(seq)
+
+    write_file = open(_segment_path(seq), "ab", buffering=0)
+    write_size = 0
+
+
+def _fsync_and_close(fd):
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _sync():
+    global unsynced
+    if write_file is not None and unsynced:
+        os.fsync(write_file.fileno())
+        unsynced = False
+
+
+def _read_record(handle):
+    header = handle.read(_RECORD_HEADER.size)
+    if len(header) < _RECORD_HEADER.size:
+        return None  # End of segment (or a record still being written)
+
+    timestamp, topic_len, payload_len = _RECORD_HEADER.unpack(header)
+    body = handle.read(topic_len + payload_len)
+    if len(body) < topic_len + payload_len:
+        return None  # Torn record at the end of a segment
+
+    topic = body[:topic_len].decode("utf-8")
+    return timestamp, topic, body[topic_len:], _RECORD_HEADER.size + len(body)
+
+
+def _read_records(seq, offset, count):
+    # Up to 'count' records from 'offset' (replay task, runs in the executor)
+    records = []
+    with open(_segment_path(seq), "rb") as handle:
+        handle.seek(offset)
+        while len(records) < count:
+            record = _read_record(handle)
+            if record is None:
+                break
+            records.append(record)
+    return records
+
+
+def _scan_segment(seq, offset):
+    records = 0
+    size = 0
+    with open(_segment_path(seq), "rb") as handle:
+        handle.seek(offset)
+        while True:
+            record = _read_record(handle)
+            if record is None:
+                break
+            records += 1
+            size += record[3]
+    return records, size
+
+
+def _peek_timestamp(seq, offset):
+    try:
+        with open(_segment_path(seq), "rb") as handle:
+            handle.seek(offset)
+            header = handle.read(_RECORD_HEADER.size)
+    except OSError:
+        return None
+    if len(header) < _RECORD_HEADER.size:
+        return None
+    return _RECORD_HEADER.unpack(header)[0]
+
+
+def _load_cursor():
+    try:
+        with open(os.path.join(spool_dir, CURSOR_FILE), "r", encoding="utf-8") as f:
+            seq, offset = f.read().split()
+            return int(seq), int(offset)
+    except (OSError, ValueError):
+        return None, 0
+
+
+def _save_cursor():
+    path = os.path.join(spool_dir, CURSOR_FILE)
+    if read_seq is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(f"{read_seq} {read_offset}")
+    os.replace(path + ".tmp", path)
+
+# -----------------------------------------------
+# Move the cursor past a fully replayed segment
+# -----------------------------------------------
+def _finish_segment():
+    global read_seq, read_offset, write_file
+
+    finished = read_seq
+    segments.remove(finished)
+
+    if write_file is not None and not segments:
+        # The active segment itself is drained, start over with a fresh one
+        write_file.close()
+        write_file = None
+
+    os.remove(_segment_path(finished))
+
+    read_seq = segments[0] if segments else None
+    read_offset = 0
+    _save_cursor()
+
+# -----------------------------------------------
+# Replay spooled messages in order, at most
+# replay_rate per second, while MQTT accepts them
+# -----------------------------------------------
+async def _replay_loop():
+    global read_offset, depth_records, depth_bytes, live_credit
+
+    tick = 0.1
+    budget_per_tick = max(1, int(replay_rate * tick))
+
+    while True:
+        if depth_records == 0:
+            _wakeup.clear()
+            await _wakeup.wait()
+
+        if not mqtt_publisher.is_connected():
+            await asyncio.sleep(1)
+            continue
+
+        replayed = 0
+        blocked = False
+
+        # Read in a worker thread, a slow disk must not stall the device connections.
+        # Appends (and a segment roll) can happen meanwhile.
+        budget = budget_per_tick + live_credit
+        was_active = read_seq == segments[-1] and write_file is not None
+        records = await asyncio.to_thread(_read_records, read_seq, read_offset, budget)
+
+        for timestamp, topic, payload, size in records:
+            rc = mqtt_publisher.publish(topic, payload, qos=1)
+            if rc != mqtt.MQTT_ERR_SUCCESS:
+                blocked = True  # Disconnected again or in-flight window full, retry later
+                break
+
+            read_offset += size
+            depth_records -= 1
+            depth_bytes -= size
+            replayed += 1
+            metrics.count_publish("replayed")
+
+        live_credit = max(0, live_credit - max(0, replayed - budget_per_tick))
+
+        # A segment that was rolled during the read is read again to its end first
+        active = read_seq == segments[-1] and write_file is not None
+        drained = (len(records) < budget and not blocked and
+                   (not active or read_offset >= write_size) and active == was_active)
+
+        if drained:
+            _finish_segment()
+        elif replayed:
+            _save_cursor()
+
+        if depth_records == 0:
+            live_credit = 0
+
+        if depth_records == 0 and replayed:
+            print("[Spool] Backlog replayed, publishing directly again.")
+            system_log.log_to_redis("[Spool] Backlog replayed, publishing directly again.")
+
+        await asyncio.sleep(1 if blocked else tick)
+
+# -----------------------------------------------
+# Batch fsyncs of the active segment
+# -----------------------------------------------
+async def _fsync_loop():
+    global unsynced
+
+    while True:
+        await asyncio.sleep(fsync_interval)
+        if write_file is None or not unsynced:
+            continue
+
+        # fsync a duplicate of the descriptor in a worker thread, so a segment
+        # roll on the event loop can close the original meanwhile
+        fd = os.dup(write_file.fileno())
+        unsynced = False
+        try:
+            await asyncio.to_thread(os.fsync, fd)
+        finally:
+            os.close(fd)
+
+# -----------------------------------------------
+# Report the backlog while there is one
+# -----------------------------------------------
+async def _stats_loop():
+    while True:
+        await asyncio.sleep(STATS_LOG_INTERVAL)
+        if depth_records:
+            stats = get_stats()
+            age = stats["oldest_age_seconds"]
+            age_text = f"{age:.1f}s" if age is not None else "unknown"
+            print(f"[Spool] Backlog: {stats['records']} messages, {stats['bytes']} bytes, "
+                  f"{stats['segments']} segment(s), oldest {age_text}")
+            system_log.log_to_redis(f"[Spool] Backlog: {stats['records']} messages, {stats['bytes']} bytes, "
+                                    f"{stats['segments']} segment(s), oldest {age_text}")
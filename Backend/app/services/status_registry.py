@@ -0,0 +1,354 @@
+# -----------------------------------------------
+# Live server status, shared through Redis
+#
+# TCP server and AWS IoT state live in the Redis
+# hash STATUS_KEY (fields tcp / aws:<pool>: "1" or
+# "0", updated_at) instead of environment.py. Each
+# MQTT pool (aws:main, or aws:w<N> for TCP worker
+# N) has its own field and AWS IoT counts as
+# connected while any of them is. The backend
+# processes write only when a state actually
+# changes; every process keeps the last value it
+# knows, so the per-ack call from the paho thread
+# is a dict lookup.
+#
+# The time of the last PUBACK of each device topic
+# is collected in memory and written to the hash
+# ACK_KEY (field: device ID, or facility/<id> for
+# facility batches) every STATUS_ACK_FLUSH_INTERVAL
+# seconds by the "status-flush" thread, one HSET
+# for all of them.
+#
+# The Flask status endpoints read both hashes
+# (get_status / get_last_acks), never the disk.
+#
+# Every transition also bumps the "version" field
+# and is announced on the pub/sub channel
+# STATUS_CHANNEL. In the UI process one
+# "status-watch" thread listens to it and keeps the
+# current state under a Condition: /check_status_server
+# answers from it at once, or long-polls until the
+# version moves past the one the page already has
+# (wait_for_change).
+# -----------------------------------------------
+import json
+import threading
+import time
+
+import app.environment.environment as environment
+import app.routes.api.system_log as system_log
+import app.services.tcp_workers as tcp_workers
+
+STATUS_KEY = "server_status"
+ACK_KEY = "device_last_ack"
+STATUS_CHANNEL = "server_status_events"
+AWS_FIELD_PREFIX = "aws:"
+
+# The watcher re-reads STATUS_KEY this often even without events
+# (missed messages while Redis was unreachable)
+WATCH_RESYNC_INTERVAL = 30
+
+# -----------------------------------------------
+# Global variables
+# -----------------------------------------------
+_known = {}                # name -> last value written or read back from Redis, this process
+_pending_acks = {}         # device -> time.time() of its last PUBACK, not written yet
+_acks_lock = threading.Lock()  # paho threads add to _pending_acks, the flush thread swaps it
+_lock = threading.Lock()
+_retry_at = 0.0            # Redis failed: no status write before this time.monotonic()
+
+_flush_thread = None
+_stop_event = threading.Event()
+
+transitions = 0            # State changes written to Redis
+acks_recorded = 0
+ack_flushes = 0            # HSETs of ACK_KEY
+redis_errors = 0
+
+# -----------------------------------------------
+# "1" / "0" in Redis, True / False / None here
+# -----------------------------------------------
+def _decode(value):
+    if value is None or value == "":
+        return None
+    return value == "1"
+
+def _encode(value):
+    return "1" if value else "0"
+
+# Field of this process' MQTT pool in STATUS_KEY
+def _aws_field():
+    index = tcp_workers.worker_index
+    return AWS_FIELD_PREFIX + ("main" if index is None else f"w{index}")
+
+# -----------------------------------------------
+# Set one state (name: "tcp" or an aws field). Writes to
+# Redis only if it differs from what this process
+# last saw, or always with force=True (processes
+# without the flush thread, e.g. the UI, do not
+# see changes made by others). Returns True if it
+# was written.
+# -----------------------------------------------
+def set_status(name, value, force=False):
+    global transitions, redis_errors, _retry_at
+
+    value = bool(value)
+    if _known.get(name) == value and not force:
+        return False
+
+    with _lock:
+        if (_known.get(name) == value and not force) or time.monotonic() < _retry_at:
+            return False
+
+        try:
+            pipe = system_log.redis_client.pipeline()  # MULTI: the state and its version together
+            pipe.hset(STATUS_KEY, mapping={name: _encode(value), "updated_at": f"{time.time():.3f}"})
+            pipe.hincrby(STATUS_KEY, "version", 1)
+            pipe.publish(STATUS_CHANNEL, json.dumps({"name": name, "value": value}))
+            pipe.execute()
+        except Exception as e:
+            redis_errors += 1
+            _retry_at = time.monotonic() + system_log.REDIS_RETRY_INTERVAL
+            print(f"[Status] Could not save {name}={value}: {e}")
+            system_log.log_to_redis(f"[Status] Could not save {name}={value}: {e}", system_log.WARNING)
+            return False
+
+        _known[name] = value
+        transitions += 1
+
+    print(f"[Status] {name} -> {value}")
+    system_log.log_to_redis(f"[Status] {name} -> {value}")
+    return True
+
+def set_tcp_status(value, force=False):
+    return set_status("tcp", value, force)
+
+def set_aws_status(value, force=False):
+    return set_status(_aws_field(), value, force)
+
+# -----------------------------------------------
+# Every MQTT pool at once: value False marks them
+# disconnected (new certificates: the UI), None
+# removes their fields ('fields': only those).
+# The pools pick the change up at their next
+# flush(). Returns True if something was written.
+# -----------------------------------------------
+def reset_aws_status(value=False, fields=None):
+    global transitions, redis_errors
+
+    try:
+        if fields is None:
+            fields = [name for name in system_log.redis_client.hkeys(STATUS_KEY) if name.startswith(AWS_FIELD_PREFIX)]
+        if not fields:
+            return False
+
+        pipe = system_log.redis_client.pipeline()
+        if value is None:
+            pipe.hdel(STATUS_KEY, *fields)
+        else:
+            pipe.hset(STATUS_KEY, mapping={**{name: _encode(value) for name in fields}, "updated_at": f"{time.time():.3f}"})
+        pipe.hincrby(STATUS_KEY, "version", 1)
+        pipe.publish(STATUS_CHANNEL, json.dumps({"name": "aws", "value": value}))
+        pipe.execute()
+    except Exception as e:
+        redis_errors += 1
+        print(f"[Status] Could not reset the AWS IoT status: {e}")
+        system_log.log_to_redis(f"[Status] Could not reset the AWS IoT status: {e}", system_log.WARNING)
+        return False
+
+    with _lock:
+        for name in fields:
+            _known.pop(name, None)
+        transitions += 1
+    return True
+
+# -----------------------------------------------
+# Current state from Redis: {"tcp": bool or None,
+# "aws": bool or None, "updated_at": float or None,
+# "version": int} (None: never reported). "aws" is
+# True if any MQTT pool is connected.
+# -----------------------------------------------
+def get_status():
+    values = system_log.redis_client.hgetall(STATUS_KEY)
+    updated_at = values.get("updated_at")
+    pools = [_decode(value) for name, value in values.items() if name.startswith(AWS_FIELD_PREFIX)]
+    return {
+        "tcp": _decode(values.get("tcp")),
+        "aws": any(pools) if pools else None,
+        "updated_at": float(updated_at) if updated_at else None,
+        "version": int(values.get("version", 0)),
+    }
+
+# -----------------------------------------------
+# Last PUBACK per device, called from the paho
+# thread for every acknowledged message (memory
+# only). 'topic' is <TCP_SERVER_NAME>/<device>.
+# -----------------------------------------------
+def record_ack(topic):
+    global acks_recorded
+
+    device = topic.split("/", 1)[1] if "/" in topic else topic
+    with _acks_lock:
+        _pending_acks[device] = time.time()
+        acks_recorded += 1
+
+# {device: time.time() of its last PUBACK}, across every process
+def get_last_acks():
+    return {device: float(value) for device, value in system_log.redis_client.hgetall(ACK_KEY).items()}
+
+# -----------------------------------------------
+# Write the collected ack times in one HSET and
+# pick up states set by other processes (e.g. the
+# UI resetting aws after a certificate upload), so
+# the next transition here is not missed.
+# -----------------------------------------------
+def flush():
+    global _pending_acks, ack_flushes, redis_errors
+
+    with _acks_lock:
+        acks, _pending_acks = _pending_acks, {}
+
+    try:
+        pipe = system_log.redis_client.pipeline(transaction=False)
+        if acks:
+            pipe.hset(ACK_KEY, mapping={device: f"{at:.3f}" for device, at in acks.items()})
+        pipe.hgetall(STATUS_KEY)
+        results = pipe.execute()
+    except Exception as e:
+        redis_errors += 1
+        # Keep them for the next flush, newer acks win
+        with _acks_lock:
+            for device, at in acks.items():
+                _pending_acks.setdefault(device, at)
+        print(f"[Status] Could not save the last ack times: {e}")
+        system_log.log_to_redis(f"[Status] Could not save the last ack times: {e}", system_log.WARNING)
+        return False
+
+    if acks:
+        ack_flushes += 1
+
+    with _lock:
+        for name in ("tcp", _aws_field()):
+            _known[name] = _decode(results[-1].get(name))  # None: removed, written again on the next change
+    return True
+
+def _flush_loop():
+    while not _stop_event.wait(environment.STATUS_ACK_FLUSH_INTERVAL):
+        flush()
+
+# -----------------------------------------------
+# Start / stop the "status-flush" thread (with the
+# MQTT publisher pool, see mqtt_publisher)
+# -----------------------------------------------
+def start():
+    global _flush_thread
+
+    if _flush_thread is not None and _flush_thread.is_alive():
+        return
+
+    _stop_event.clear()
+    _flush_thread = threading.Thread(target=_flush_loop, name="status-flush", daemon=True)
+    _flush_thread.start()
+
+def stop():
+    global _flush_thread
+
+    if _flush_thread is not None:
+        _stop_event.set()
+        _flush_thread.join(timeout=5)
+        _flush_thread = None
+
+    flush()  # Acks of the last messages
+    reset_aws_status(None, [_aws_field()])  # This pool no longer counts
+
+# -----------------------------------------------
+# UI side: state kept current by the "status-watch"
+# thread, started by the first request. However
+# many pages are open, Redis sees one subscriber.
+# -----------------------------------------------
+_watch_condition = threading.Condition()
+_watch_status = None       # Last get_status() result, None until the first read
+_watch_thread = None
+_waiters = None            # BoundedSemaphore(STATUS_MAX_WAITERS), long-polls in progress
+
+def _watch_load():
+    global _watch_status
+
+    status = get_status()
+    with _watch_condition:
+        if _watch_status is None or status != _watch_status:
+            _watch_status = status
+            _watch_condition.notify_all()
+
+def _watch_loop():
+    while True:
+        pubsub = system_log.redis_client.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(STATUS_CHANNEL)
+            _watch_load()  # After subscribing: no transition falls in between
+            resync_at = time.monotonic() + WATCH_RESYNC_INTERVAL
+
+            while True:
+                message = pubsub.get_message(timeout=1.0)
+                if message is not None or time.monotonic() >= resync_at:
+                    _watch_load()
+                    resync_at = time.monotonic() + WATCH_RESYNC_INTERVAL
+        except Exception as e:
+            print(f"[Status] Status watcher cannot read Redis: {e}")
+            time.sleep(system_log.REDIS_RETRY_INTERVAL)
+        finally:
+            try:
+                pubsub.close()
+            except Exception:
+                pass
+
+def _ensure_watcher():
+    global _watch_thread, _waiters
+
+    with _watch_condition:
+        if _watch_thread is None:
+            _waiters = threading.BoundedSemaphore(environment.STATUS_MAX_WAITERS)
+            _watch_thread = threading.Thread(target=_watch_loop, name="status-watch", daemon=True)
+            _watch_thread.start()
+
+# Current state, None if Redis could not be read within 'timeout' seconds
+def current_status(timeout=2.0):
+    _ensure_watcher()
+    with _watch_condition:
+        _watch_condition.wait_for(lambda: _watch_status is not None, timeout)
+        return _watch_status
+
+# -----------------------------------------------
+# Long-poll: return once the version differs from
+# 'since' or after 'timeout' seconds, with
+# (status, waited). Only STATUS_MAX_WAITERS
+# requests wait at a time; beyond that the current
+# state is returned at once with waited=False and
+# the page polls again later.
+# -----------------------------------------------
+def wait_for_change(since, timeout):
+    status = current_status()
+    if status is None or status["version"] != since:
+        return status, True
+
+    if not _waiters.acquire(blocking=False):
+        return status, False
+
+    try:
+        with _watch_condition:
+            _watch_condition.wait_for(lambda: _watch_status["version"] != since, timeout)
+            return _watch_status, True
+    finally:
+        _waiters.release()
+
+# -----------------------------------------------
+# Totals for /metrics
+# -----------------------------------------------
+def get_stats():
+    return {
+        "transitions": transitions,
+        "acks_recorded": acks_recorded,
+        "acks_pending": len(_pending_acks),
+        "ack_flushes": ack_flushes,
+        "redis_errors": redis_errors,
+    }
@@ -0,0 +1,201 @@
+# -----------------------------------------------
+# Multi-process TCP ingest
+#
+# With TCP_WORKER_PROCESSES > 1 the control loop
+# starts N worker processes. Each one runs its own
+# asyncio TCP server bound to TCP_SERVER_PORT with
+# SO_REUSEPORT, so the kernel spreads incoming
+# device connections across them, and each one has
+# its own MQTT pool, spool and batcher.
+#
+# State that has to stay correct across workers:
+# - 'count' (sent back in the 0x0001 response): each
+#   worker publishes its number of registered devices
+#   in its own slot of a shared array, the count is
+#   their sum. The parent zeroes the slot of a worker
+#   that died.
+# - "one device - one connection": a worker
+#   registering a device ID tells every other worker
+#   to close its older connection for that ID.
+# -----------------------------------------------
+import asyncio
+import multiprocessing
+import signal
+import threading
+import time
+
+import app.environment.environment as environment
+import app.routes.api.system_log as system_log
+
+# spawn: a fresh interpreter per worker, nothing inherited from the running event loop
+_context = multiprocessing.get_context("spawn")
+
+# -----------------------------------------------
+# Global variables (parent process)
+# -----------------------------------------------
+processes = []         # One multiprocessing.Process per worker
+_shared_counts = None  # Registered devices per worker
+_evict_queues = []
+
+# -----------------------------------------------
+# Global variables (inside a worker process)
+# -----------------------------------------------
+worker_index = None    # None in the parent / single-process mode
+shared_counts = None
+evict_queues = []
+
+# -----------------------------------------------
+# Parent: start N workers
+# -----------------------------------------------
+def start(worker_count):
+    global _shared_counts, _evict_queues
+
+    if processes:
+        return  # Already running
+
+    # One slot per worker, each written by its own worker only: no lock needed
+    _shared_counts = _context.Array('L', worker_count, lock=False)
+    _evict_queues = [_context.Queue() for _ in range(worker_count)]
+
+    for index in range(worker_count):
+        processes.append(_spawn(index))
+
+    print(f"[Workers] Started {worker_count} TCP worker processes on port {environment.TCP_SERVER_PORT} (SO_REUSEPORT)")
+    system_log.log_to_redis(f"[Workers] Started {worker_count} TCP worker processes on port {environment.TCP_SERVER_PORT} (SO_REUSEPORT)")
+
+def _spawn(index):
+    process = _context.Process(
+        target=_worker_main,
+        args=(index, _shared_counts, _evict_queues),
+        name=f"tcp-worker-{index}",
+        daemon=True,
+    )
+    process.start()
+    return process
+
+# -----------------------------------------------
+# Parent: stop every worker (SIGTERM lets them
+# close clients and flush batches/spool first)
+# -----------------------------------------------
+async def stop(timeout=10):
+    global processes, _shared_counts, _evict_queues
+
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+
+    for process in processes:
+        await asyncio.to_thread(process.join, timeout)
+        if process.is_alive():
+            print(f"[Workers] {process.name} did not stop in {timeout}s, killing it.")
+            system_log.log_to_redis(f"[Workers] {process.name} did not stop in {timeout}s, killing it.")
+            process.kill()
+            await asyncio.to_thread(process.join)
+
+    for evict_queue in _evict_queues:
+        evict_queue.close()
+
+    if processes:
+        print("[Workers] All TCP worker processes stopped.")
+        system_log.log_to_redis("[Workers] All TCP worker processes stopped.")
+
+    processes = []
+    _shared_counts = None
+    _evict_queues = []
+
+def is_running():
+    return bool(processes)
+
+# -----------------------------------------------
+# Parent: bring back workers that died on their own
+# (called from the control loop)
+# -----------------------------------------------
+def restart_dead():
+    for index, process in enumerate(processes):
+        if process.is_alive():
+            continue
+
+        print(f"[Workers] {process.name} exited with code {process.exitcode}, restarting it.")
+        system_log.log_to_redis(f"[Workers] {process.name} exited with code {process.exitcode}, restarting it.")
+        _shared_counts[index] = 0  # Its devices are disconnected
+        processes[index] = _spawn(index)
+
+# -----------------------------------------------
+# Worker: shared registered-device count
+# -----------------------------------------------
+def set_registered_count(value):
+    if shared_counts is not None:
+        shared_counts[worker_index] = value
+
+def registered_count():
+    # None outside multi-process mode: the caller counts locally
+    if shared_counts is None:
+        return None
+    return sum(shared_counts)
+
+# -----------------------------------------------
+# Worker: ask the other workers to close their
+# connection for this device ID (older than now)
+# -----------------------------------------------
+def broadcast_evict(device_id):
+    if worker_index is None:
+        return
+
+    message = (device_id, time.time())
+    for index, evict_queue in enumerate(evict_queues):
+        if index != worker_index:
+            evict_queue.put_nowait(message)
+
+def _evict_listener(loop, evict_queue, on_evict):
+    while True:
+        try:
+            message = evict_queue.get()
+        except (EOFError, OSError):
+            return
+        if message is None:
+            return
+        loop.call_soon_threadsafe(on_evict, *message)
+
+# -----------------------------------------------
+# Worker process entry point
+# -----------------------------------------------
+def _worker_main(index, counts, queues):
+    global worker_index, shared_counts, evict_queues
+
+    worker_index = index
+    shared_counts = counts
+    evict_queues = queues
+
+    # Imported here so the parent does not need control_server to start workers
+    import app.services.control_server as control_server
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        stopping = asyncio.Event()
+        loop.add_signal_handler(signal.SIGTERM, stopping.set)
+        loop.add_signal_handler(signal.SIGINT, stopping.set)
+
+        threading.Thread(
+            target=_evict_listener,
+            args=(loop, evict_queues[index], control_server.evict_device),
+            name="evict-listener",
+            daemon=True,
+        ).start()
+
+        await control_server.start_worker_server(index)
+        await stopping.wait()
+        await control_server.stop_tcp_server()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+# -----------------------------------------------
+# Parent: worker processes for /metrics
+# -----------------------------------------------
+def get_stats():
+    return {
+        "processes": len(processes),
+        "alive": sum(1 for process in processes if process.is_alive()),
+    }
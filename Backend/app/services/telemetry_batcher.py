@@ -0,0 +1,137 @@
+# -----------------------------------------------
+# Time-window batching of telemetry publishes
+#
+# Collects samples per device topic or per
+# facility topic and publishes them as one MQTT
+# message carrying an array of samples, once the
+# window expires or the batch is full.
+#
+# Batch payload (see telemetry_encoder for the
+# binary and zlib variants):
+#   {"count": N, "samples": [{...}, {...}]}
+# -----------------------------------------------
+import asyncio
+import time
+
+import app.environment.environment as environment
+import app.services.http_client as http_client
+import app.services.publish_spool as publish_spool
+import app.services.telemetry_encoder as telemetry_encoder
+import app.routes.api.system_log as system_log
+
+BATCH_MODES = (None, "device", "facility")
+
+# -----------------------------------------------
+# Global variables
+# -----------------------------------------------
+batch_mode = None      # Active mode, None while batching is off
+batch_window = 1.0
+batch_size = 50
+
+pending = {}           # topic -> {"started": monotonic time, "samples": [...]}
+flush_task = None      # Background task publishing expired windows
+
+# -----------------------------------------------
+# Return True if samples should go through the
+# batcher instead of being published one by one
+# -----------------------------------------------
+def enabled():
+    return batch_mode is not None
+
+# -----------------------------------------------
+# Start batching with the settings from
+# environment.py (no-op when the mode is None)
+# -----------------------------------------------
+def start():
+    global batch_mode, batch_window, batch_size, flush_task
+
+    mode = environment.TELEMETRY_BATCH_MODE
+    if mode not in BATCH_MODES:
+        print(f"[Batch] Unknown TELEMETRY_BATCH_MODE={mode!r}, publishing one message per sample.")
+        system_log.log_to_redis(f"[Batch] Unknown TELEMETRY_BATCH_MODE={mode!r}, publishing one message per sample.")
+        mode = None
+
+    batch_mode = mode
+    batch_window = float(environment.TELEMETRY_BATCH_WINDOW)
+    batch_size = max(1, int(environment.TELEMETRY_BATCH_SIZE))
+
+    if batch_mode is None or flush_task is not None:
+        return
+
+    flush_task = asyncio.create_task(_flush_expired_loop())
+
+    print(f"[Batch] Batching per {batch_mode}: window={batch_window}s, size={batch_size}")
+    system_log.log_to_redis(f"[Batch] Batching per {batch_mode}: window={batch_window}s, size={batch_size}")
+
+# -----------------------------------------------
+# Publish what is left and stop the window task
+# -----------------------------------------------
+async def stop():
+    global batch_mode, flush_task
+
+    if flush_task is not None:
+        flush_task.cancel()
+        try:
+            await flush_task
+        except asyncio.CancelledError:
+            pass
+        flush_task = None
+
+    flush_all()
+    batch_mode = None
+
+# -----------------------------------------------
+# Add one sample (the same dict that used to be
+# published on its own) to its batch
+# -----------------------------------------------
+def add(device_id, index_data):
+    if batch_mode == "facility":
+        topic = http_client.generate_facility_topic()
+    else:
+        topic = http_client.generate_topic(device_id)
+
+    batch = pending.get(topic)
+    if batch is None:
+        batch = pending[topic] = {"started": time.monotonic(), "samples": []}
+
+    batch["samples"].append(index_data)
+
+    if len(batch["samples"]) >= batch_size:
+        flush(topic)
+
+# -----------------------------------------------
+# Publish the batch of one topic
+# -----------------------------------------------
+def flush(topic):
+    batch = pending.pop(topic, None)
+    if not batch or not batch["samples"]:
+        return
+
+    samples = batch["samples"]
+    payload = telemetry_encoder.encode_batch(topic, samples)
+
+    if publish_spool.publish(topic, payload, qos=1):
+        print(f"[Batch] Published {len(samples)} samples to {topic}")
+        system_log.log_to_redis(f"[Batch] Published {len(samples)} samples to {topic}")
+    else:
+        print(f"[Batch] Failed to publish {len(samples)} samples to {topic}, spooled for replay.")
+        system_log.log_to_redis(f"[Batch] Failed to publish {len(samples)} samples to {topic}, spooled for replay.")
+
+def flush_all():
+    for topic in list(pending):
+        flush(topic)
+
+# -----------------------------------------------
+# Publish every batch whose window has expired
+# -----------------------------------------------
+async def _flush_expired_loop():
+    # Check a few times per window so a batch never waits much longer than batch_window
+    interval = max(batch_window / 4, 0.05)
+
+    while True:
+        await asyncio.sleep(interval)
+
+        now = time.monotonic()
+        for topic, batch in list(pending.items()):
+            if now - batch["started"] >= batch_window:
+                flush(topic)
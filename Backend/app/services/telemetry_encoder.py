@@ -0,0 +1,190 @@
+# -----------------------------------------------
+# Payload encodings for upstream telemetry
+#
+# Modes (TELEMETRY_ENCODING, overridable per topic
+# prefix with TELEMETRY_ENCODING_BY_TOPIC):
+#   json         compact JSON (no whitespace)
+#   json_pretty  json.dumps(..., indent=4), the original format (default)
+#   json_zlib    compact JSON compressed with zlib
+#   binary       fixed-schema binary records (below)
+#   binary_zlib  binary records compressed with zlib
+#
+# JSON messages keep their shape: one sample is the
+# sample dict, a batch is {"count": N, "samples": [...]}.
+#
+# Binary message (big-endian):
+#   header: version (1 byte, =1) | record_size (1 byte, =50) | count (2 bytes)
+#   record: device_id (13 bytes) | current_time (uint32) | flags (uint8)
+#           breath_bpm (int16) | breath_curve (float32)
+#           heart_bpm (int16) | heart_rate_curve (float32)
+#           target_distance (float32) | signal_strength (float32)
+#           valid_bit_id (uint32)
+#           body_move_energy (float32) | body_move_range (float32)
+#   flags: bit 0 = out_of_bed, bit 1 = body_move_* present (36-byte sample)
+# -----------------------------------------------
+import json
+import struct
+import zlib
+
+import app.environment.environment as environment
+
+ENCODINGS = ("json", "json_pretty", "json_zlib", "binary", "binary_zlib")
+
+BINARY_VERSION = 1
+
+_BINARY_HEADER = struct.Struct('>BBH')
+_BINARY_RECORD = struct.Struct('>13sIBhfhfffIff')
+
+FLAG_OUT_OF_BED = 0x01
+FLAG_BODY_MOVE = 0x02
+
+# topic -> encoding, filled lazily because topics repeat for every sample
+_topic_cache = {}
+_cached_config = (None, None)  # (TELEMETRY_ENCODING, TELEMETRY_ENCODING_BY_TOPIC) the cache was built for
+
+# -----------------------------------------------
+# Return the encoding configured for a topic.
+# The longest matching prefix in
+# TELEMETRY_ENCODING_BY_TOPIC wins, otherwise
+# TELEMETRY_ENCODING applies.
+# -----------------------------------------------
+def encoding_for(topic):
+    global _topic_cache, _cached_config
+
+    # Compare the raw setting: "or {}" would be a new dict on every call when it is None
+    configured = environment.TELEMETRY_ENCODING_BY_TOPIC
+    if _cached_config[0] != environment.TELEMETRY_ENCODING or _cached_config[1] is not configured:
+        # environment.py was reloaded (or changed) since the last lookup
+        _topic_cache = {}
+        _cached_config = (environment.TELEMETRY_ENCODING, configured)
+
+    overrides = configured or {}
+
+    encoding = _topic_cache.get(topic)
+    if encoding is not None:
+        return encoding
+
+    encoding = environment.TELEMETRY_ENCODING
+    best = -1
+    for prefix, mode in overrides.items():
+        if topic.startswith(prefix) and len(prefix) > best:
+            encoding, best = mode, len(prefix)
+
+    if encoding not in ENCODINGS:
+        print(f"[Encoder] Unknown encoding {encoding!r} for {topic}, using json_pretty.")
+        encoding = "json_pretty"
+
+    _topic_cache[topic] = encoding
+    return encoding
+
+# -----------------------------------------------
+# Encode one sample dict (device_id, current_time
+# and the parsed fields)
+# -----------------------------------------------
+def encode_sample(topic, sample):
+    encoding = encoding_for(topic)
+
+    if encoding == "json":
+        return json.dumps(sample, separators=(",", ":"))
+    if encoding == "json_pretty":
+        return json.dumps(sample, indent=4)
+    if encoding == "json_zlib":
+        return zlib.compress(json.dumps(sample, separators=(",", ":")).encode("utf-8"))
+
+    payload = _encode_binary([sample])
+    return zlib.compress(payload) if encoding == "binary_zlib" else payload
+
+# -----------------------------------------------
+# Encode a batch of sample dicts as one message
+# -----------------------------------------------
+def encode_batch(topic, samples):
+    encoding = encoding_for(topic)
+
+    if encoding.startswith("json"):
+        batch = {"count": len(samples), "samples": samples}
+        if encoding == "json_pretty":
+            return json.dumps(batch, indent=4)
+        payload = json.dumps(batch, separators=(",", ":"))
+        return zlib.compress(payload.encode("utf-8")) if encoding == "json_zlib" else payload
+
+    payload = _encode_binary(samples)
+    return zlib.compress(payload) if encoding == "binary_zlib" else payload
+
+
+def _device_id_bytes(device_id):
+    try:
+        raw = bytes.fromhex(device_id)
+    except (TypeError, ValueError):
+        raw = str(device_id).encode("utf-8")
+    return raw[:13]  # struct pads shorter IDs with zero bytes
+
+
+def _int16(value):
+    return max(-0x8000, min(0x7FFF, int(value)))
+
+
+def _encode_binary(samples):
+    if len(samples) > 0xFFFF:
+        raise ValueError(f"binary batch too large: {len(samples)} samples")
+
+    out = bytearray(_BINARY_HEADER.size + _BINARY_RECORD.size * len(samples))
+    _BINARY_HEADER.pack_into(out, 0, BINARY_VERSION, _BINARY_RECORD.size, len(samples))
+
+    offset = _BINARY_HEADER.size
+    for sample in samples:
+        flags = FLAG_OUT_OF_BED if sample.get("out_of_bed") else 0
+        if "body_move_energy" in sample:
+            flags |= FLAG_BODY_MOVE
+
+        _BINARY_RECORD.pack_into(
+            out, offset,
+            _device_id_bytes(sample["device_id"]),
+            int(sample["current_time"]) & 0xFFFFFFFF,
+            flags,
+            _int16(sample["breath_bpm"]),
+            sample["breath_curve"],
+            _int16(sample["heart_bpm"]),
+            sample["heart_rate_curve"],
+            sample["target_distance"],
+            sample["signal_strength"],
+            sample["valid_bit_id"],
+            sample.get("body_move_energy", 0.0),
+            sample.get("body_move_range", 0.0),
+        )
+        offset += _BINARY_RECORD.size
+
+    return bytes(out)
+
+# -----------------------------------------------
+# Decode a binary (optionally zlib) message back
+# into sample dicts (reference decoder for
+# subscribers and the benchmark).
+# -----------------------------------------------
+def decode_binary(payload, compressed=False):
+    if compressed:
+        payload = zlib.decompress(payload)
+
+    version, record_size, count = _BINARY_HEADER.unpack_from(payload, 0)
+    if version != BINARY_VERSION or record_size != _BINARY_RECORD.size:
+        raise ValueError(f"unsupported binary telemetry version={version}, record_size={record_size}")
+
+    samples = []
+    for fields in _BINARY_RECORD.iter_unpack(payload[_BINARY_HEADER.size:_BINARY_HEADER.size + record_size * count]):
+        sample = {
+            "device_id": fields[0].hex(),
+            "current_time": fields[1],
+            "breath_bpm": fields[3],
+            "breath_curve": fields[4],
+            "heart_bpm": fields[5],
+            "heart_rate_curve": fields[6],
+            "target_distance": fields[7],
+            "signal_strength": fields[8],
+            "valid_bit_id": fields[9],
+        }
+        if fields[2] & FLAG_BODY_MOVE:
+            sample["body_move_energy"] = fields[10]
+            sample["body_move_range"] = fields[11]
+        sample["out_of_bed"] = bool(fields[2] & FLAG_OUT_OF_BED)
+        samples.append(sample)
+
+    return samples
@@ -0,0 +1,166 @@
+# -----------------------------------------------
+# Micro-benchmarks of protocol_codec against the
+# code it replaced in handle_client / handle_data:
+# - decode: parse_packet, frame start, sample content
+# - encode: 0x0001 response and 0x0410 request
+# - dispatch: if/elif chain against the handler table
+#
+# Run from the repository root:
+#   python3 Backend/benchmarks/bench_codec.py
+# -----------------------------------------------
+import os
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import app.services.protocol_codec as protocol_codec
+
+ITERATIONS = 500_000
+
+SAMPLE_CONTENT = struct.pack('>ffffffI', 15.0, 0.1, 70.0, -0.2, 0.8, 55.0, 0x3F)
+FRAME = (struct.pack('!BBBBIHI', 0x13, 0x01, 0x00, 0x01, 1234, 0, len(SAMPLE_CONTENT) + 2) +
+         struct.pack('!H', 0x03e8) + SAMPLE_CONTENT)
+
+# -----------------------------------------------
+# The previous implementations
+# -----------------------------------------------
+def old_parse_packet(data):
+    if len(data) < 16:
+        return (0, 0, 0, b"")
+    proto, ver, ptype, cmd, request_id, timeout, content_len = struct.unpack('!BBBBIHI', data[:14])
+    function = struct.unpack('!H', data[14:16])[0]
+    content_data = data[16 : 14 + content_len]
+    return request_id, function, content_len, content_data
+
+
+_OLD_HEADER = struct.Struct('!BBBBIHI')
+_OLD_FUNCTION = struct.Struct('!H')
+
+def old_frame_start(view, offset):
+    request_id, content_len = _OLD_HEADER.unpack_from(view, offset)[4::2]
+    function = _OLD_FUNCTION.unpack_from(view, offset + 14)[0]
+    return request_id, content_len, function
+
+
+def old_register_response(request_id, count):
+    data_resp = [
+        0x13, 0x01, 0x00, 0x02,
+        (request_id >> 24) & 0xFF,
+        (request_id >> 16) & 0xFF,
+        (request_id >> 8) & 0xFF,
+        (request_id >> 0) & 0xFF,
+        0, 0, 0, 0, 0, 6, 0, 1,
+        (count >> 24) & 0xFF,
+        (count >> 16) & 0xFF,
+        (count >> 8) & 0xFF,
+        (count >> 0) & 0xFF
+    ]
+    return bytes(data_resp)
+
+
+def old_request_id_request(request_id):
+    data_req = [
+        0x13, 0x01, 0x01, 0x01,
+        (request_id >> 24) & 0xFF,
+        (request_id >> 16) & 0xFF,
+        (request_id >> 8) & 0xFF,
+        (request_id >> 0) & 0xFF,
+        0, 0, 0, 0, 0, 6, 0x04, 0x10,
+        0, 0, 0, 0
+    ]
+    return bytes(data_req)
+
+
+class DevNullWriter:
+    # One write() system call per call, like a socket send
+    def __init__(self):
+        self.file = open(os.devnull, "wb", buffering=0)
+
+    def write(self, data):
+        self.file.write(data)
+
+
+def noop(context, request_id, content_data):
+    pass
+
+
+def old_dispatch(function):
+    if function == 0x0001:
+        noop(None, 0, b"")
+    elif function == 0x03e8:
+        noop(None, 0, b"")
+    elif function == 0x0410:
+        noop(None, 0, b"")
+
+
+def new_dispatch(function):
+    entry = protocol_codec.get_handler(function)
+    if entry is not None:
+        handler, is_coroutine = entry
+        handler(None, 0, b"")
+
+# -----------------------------------------------
+# Runner
+# -----------------------------------------------
+def timed(name, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"  {name:<34} {elapsed / ITERATIONS * 1e9:8.1f} ns")
+
+
+def loop(call, *args):
+    def run():
+        for _ in range(ITERATIONS):
+            call(*args)
+    return run
+
+
+if __name__ == "__main__":
+    assert old_parse_packet(FRAME) == protocol_codec.parse_packet(FRAME)
+    assert old_register_response(1234, 77) == protocol_codec.encode_register_response(1234, 77)
+    assert old_request_id_request(1234) == protocol_codec.encode_request_id_request(1234)
+
+    view = memoryview(bytearray(FRAME))
+    assert old_frame_start(view, 0) == protocol_codec._FRAME_START.unpack_from(view, 0)
+
+    print("decode")
+    timed("parse_packet (old, 2x unpack+slices)", loop(old_parse_packet, FRAME))
+    timed("parse_packet (codec)", loop(protocol_codec.parse_packet, FRAME))
+    timed("frame start (old, 2 unpack_from)", loop(old_frame_start, view, 0))
+    timed("frame start (codec, 1 unpack_from)", loop(protocol_codec._FRAME_START.unpack_from, view, 0))
+    timed("28-byte content struct.unpack(fmt)", loop(struct.unpack, '>ffffffI', SAMPLE_CONTENT))
+    timed("28-byte content RECORD_28.unpack", loop(protocol_codec.RECORD_28.unpack, SAMPLE_CONTENT))
+
+    print("\nencode")
+    timed("0x0001 response (old, list->bytes)", loop(old_register_response, 1234, 77))
+    timed("0x0001 response (codec, pack)", loop(protocol_codec.encode_register_response, 1234, 77))
+    timed("0x0410 request (old, list->bytes)", loop(old_request_id_request, 1234))
+    timed("0x0410 request (codec, pack)", loop(protocol_codec.encode_request_id_request, 1234))
+
+    # A read that answers several devices' frames (e.g. 4 samples from an unknown device):
+    # one write per response before, one write per read now
+    responses = protocol_codec.ResponseBuffer()
+    writer = DevNullWriter()
+
+    def old_writes():
+        for _ in range(ITERATIONS // 4):
+            for request_id in range(4):
+                writer.write(old_request_id_request(request_id))
+
+    def buffered_writes():
+        for _ in range(ITERATIONS // 4):
+            for request_id in range(4):
+                responses.request_id_request(request_id)
+            responses.flush(writer)
+
+    timed("4x 0x0410 + write each (old)", old_writes)
+    timed("4x 0x0410 ResponseBuffer + 1 write", buffered_writes)
+
+    print("\ndispatch (3 function codes)")
+    for code in (protocol_codec.FUNCTION_REGISTER, protocol_codec.FUNCTION_SAMPLE, protocol_codec.FUNCTION_REQUEST_ID):
+        protocol_codec.register_handler(code, noop)
+    timed("if/elif chain, 0x0410 (last branch)", loop(old_dispatch, 0x0410))
+    timed("handler table, 0x0410", loop(new_dispatch, 0x0410))
@@ -0,0 +1,61 @@
+# -----------------------------------------------
+# Cost of reading the configuration: a getter of
+# environment_manager with importlib.reload (the
+# previous behaviour) against the cached store
+# (stat only, re-executed when environment.py
+# changes), and the cost of picking up a change.
+#
+# environment.py is only read, never written.
+#
+# Run from the repository root:
+#   python3 Backend/benchmarks/bench_config.py
+# -----------------------------------------------
+import importlib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import app.environment.environment as environment
+import app.environment.environment_manager as environment_manager
+
+READS = 2_000
+
+
+def old_get_facility_list():
+    importlib.reload(environment)
+    return environment.FACILITY_LIST
+
+
+def timed(name, call, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        call()
+    elapsed = time.perf_counter() - start
+    print(f"  {name:<40} {elapsed / count * 1e6:10.1f} us")
+
+
+if __name__ == "__main__":
+    assert old_get_facility_list() == environment_manager.get_facility_list()
+
+    # Let the file age past the racy window, as it does between two edits
+    age = time.time() - os.stat(environment_manager.ENV_FILE_PATH).st_mtime
+    if age < environment_manager.RACY_WINDOW:
+        time.sleep(environment_manager.RACY_WINDOW - age + 0.1)
+    environment_manager.refresh()
+    environment_manager.refresh()
+
+    print(f"per read ({READS} reads)")
+    timed("importlib.reload + read (old)", old_get_facility_list, READS)
+    timed("get_facility_list (store)", environment_manager.get_facility_list, READS * 50)
+    timed("reload_environment (store)", environment_manager.reload_environment, READS * 50)
+
+    # A change: what a read costs right after environment.py was rewritten
+    def changed():
+        environment_manager._digest = None
+        environment_manager._signature = None
+        environment_manager.refresh()
+
+    timed("refresh after a change", changed, READS)
+    print(environment_manager.get_config_stats())
@@ -0,0 +1,132 @@
+# -----------------------------------------------
+# Cost of writing the configuration: Start Server
+# and a certificate upload done the previous way
+# (one in-place rewrite + fsync per key) against
+# one update_environment transaction, with the
+# fsyncs each needs, and whether concurrent
+# writers lose updates.
+#
+# Works on a copy of environment.py in a temporary
+# directory, the real file is not touched.
+#
+# Run from the repository root:
+#   python3 Backend/benchmarks/bench_config_write.py
+# -----------------------------------------------
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import app.environment.environment_manager as environment_manager
+
+OPERATIONS = 200
+THREADS = 4
+
+old_fsyncs = 0
+
+
+def old_update(name, value):
+    # One key: read, rewrite the line, write in place, fsync
+    global old_fsyncs
+
+    with open(environment_manager.ENV_FILE_PATH, "r", encoding="utf-8") as f:
+        lines = f.readlines()
+
+    lines = environment_manager._update_env_line(lines, name, value)
+
+    with open(environment_manager.ENV_FILE_PATH, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+        f.flush()
+        os.fsync(f.fileno())
+    old_fsyncs += 1
+    environment_manager.refresh()
+
+
+def start_server_values(index):
+    return {"START_SERVER": index % 2 == 0, "STOP_SERVER": index % 2 == 1}
+
+
+def upload_values(index):
+    return {
+        "root_ca_path": f"Backend/app/certs/root_{index}.pem",
+        "private_key_path": f"Backend/app/certs/key_{index}.key",
+        "cert_path": f"Backend/app/certs/cert_{index}.crt",
+    }
+
+
+def timed(name, call):
+    global old_fsyncs
+
+    old_fsyncs = 0
+    fsyncs_before = environment_manager.config_fsyncs
+    start = time.perf_counter()
+    for index in range(OPERATIONS):
+        call(index)
+    elapsed = time.perf_counter() - start
+    fsyncs = old_fsyncs + environment_manager.config_fsyncs - fsyncs_before
+    print(f"  {name:<36} {elapsed / OPERATIONS * 1e3:8.2f} ms  {fsyncs / OPERATIONS:4.1f} fsyncs per operation")
+
+
+def lost_updates(update):
+    # THREADS writers, each owns one key and counts it up. Returns the number of
+    # writers whose last value is missing, or a message if environment.py was left
+    # unreadable (the old writer can interleave two truncate + write sequences).
+    errors = []
+
+    def writer(number):
+        try:
+            for index in range(1, OPERATIONS // 4 + 1):
+                update(f"BENCH_WRITER_{number}", index)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer, args=(number,)) for number in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    try:
+        environment_manager.refresh()
+    except Exception as e:
+        errors.append(e)
+    if errors:
+        return f"environment.py corrupted ({type(errors[0]).__name__}: {errors[0]})"
+
+    return sum(
+        getattr(environment_manager.environment, f"BENCH_WRITER_{number}", 0) != OPERATIONS // 4
+        for number in range(THREADS)
+    )
+
+
+def reset_writers(source):
+    shutil.copy(source, environment_manager.ENV_FILE_PATH)
+    for number in range(THREADS):
+        environment_manager.update_environment({f"BENCH_WRITER_{number}": 0})
+
+
+if __name__ == "__main__":
+    source = os.path.join(os.path.dirname(environment_manager.__file__), "environment.py")
+    directory = tempfile.mkdtemp(prefix="bench_config_write_")
+    try:
+        environment_manager.ENV_FILE_PATH = os.path.join(directory, "environment.py")
+        environment_manager.LOCK_FILE_PATH = environment_manager.ENV_FILE_PATH + ".lock"
+        reset_writers(source)
+
+        print(f"per operation ({OPERATIONS} operations)")
+        timed("Start Server, key by key (old)", lambda index: [old_update(name, value) for name, value in start_server_values(index).items()])
+        timed("Start Server, one transaction", lambda index: environment_manager.update_environment(start_server_values(index)))
+        timed("certificate upload, key by key (old)", lambda index: [old_update(name, value) for name, value in upload_values(index).items()])
+        timed("certificate upload, one transaction", lambda index: environment_manager.update_environment(upload_values(index)))
+        timed("unchanged value", lambda index: environment_manager.update_environment({"START_SERVER": True}))
+
+        print(f"{THREADS} concurrent writers, writers that lost an update:")
+        print(f"  key by key (old)     {lost_updates(old_update)}")
+        reset_writers(source)  # The old writer may have left it unreadable
+        print(f"  update_environment   {lost_updates(lambda name, value: environment_manager.update_environment({name: value}))}")
+    finally:
+        shutil.rmtree(directory)
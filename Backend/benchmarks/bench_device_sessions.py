@@ -0,0 +1,108 @@
+# -----------------------------------------------
+# Memory and lookup cost of the device session
+# table at 10k connected devices, against the old
+# per-IP dicts (ip_to_id_map + ip_to_writer_map)
+# and a plain dict per device.
+#
+# Run from the repository root:
+#   python3 Backend/benchmarks/bench_device_sessions.py
+# -----------------------------------------------
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import app.services.device_sessions as device_sessions
+
+DEVICES = 10_000
+LOOKUPS = 1_000_000
+
+
+class FakeWriter:
+    # Stands in for asyncio.StreamWriter, whose own cost is the same in every variant
+    __slots__ = ()
+
+
+def make_inputs():
+    writers = [FakeWriter() for _ in range(DEVICES)]
+    ips = [f"10.{i >> 16 & 0xFF}.{i >> 8 & 0xFF}.{i & 0xFF}" for i in range(DEVICES)]
+    ids = [(0xAE0000000000000000000000 + i).to_bytes(13, "big").hex() for i in range(DEVICES)]
+    return writers, ips, ids
+
+
+def build_sessions(writers, ips, ids):
+    device_sessions.clear()
+    for writer, ip, device_id in zip(writers, ips, ids):
+        session = device_sessions.open_session(writer, ip)
+        device_sessions.register(session, device_id)
+    return device_sessions
+
+
+def build_old_maps(writers, ips, ids):
+    ip_to_id_map = {}
+    ip_to_writer_map = {}
+    for writer, ip, device_id in zip(writers, ips, ids):
+        ip_to_writer_map[ip] = writer
+        ip_to_id_map[ip] = device_id
+    return ip_to_id_map, ip_to_writer_map
+
+
+def build_dict_sessions(writers, ips, ids):
+    by_id = {}
+    by_ip = {}
+    for writer, ip, device_id in zip(writers, ips, ids):
+        session = {
+            "writer": writer, "ip": ip, "device_id": device_id,
+            "connected_at": time.time(), "registered_at": time.time(), "last_seen": time.monotonic(),
+            "frames": 0, "samples": 0, "bytes_received": 0,
+        }
+        by_id[device_id] = session
+        by_ip[ip] = [session]
+    return by_id, by_ip
+
+
+def measure(name, build, inputs):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    keep = build(*inputs)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    print(f"{name:<28} {size / 1024:10.1f} KiB  {size / DEVICES:8.1f} bytes/device")
+    return keep
+
+
+def bench_lookups(ids, ips):
+    start = time.perf_counter()
+    for i in range(LOOKUPS):
+        device_sessions.get(ids[i % DEVICES])
+    by_id = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(LOOKUPS):
+        device_sessions.by_ip.get(ips[i % DEVICES])
+    by_ip = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        device_sessions.registered_count()
+    count = time.perf_counter() - start
+
+    print(f"\nlookup by ID    {by_id / LOOKUPS * 1e9:8.1f} ns")
+    print(f"lookup by IP    {by_ip / LOOKUPS * 1e9:8.1f} ns")
+    print(f"registered_count {count / 1000 * 1e9:7.1f} ns  (= {device_sessions.registered_count()})")
+
+
+if __name__ == "__main__":
+    # IDs, IPs and writers exist in every variant, so they are built outside the measurement
+    inputs = make_inputs()
+    print(f"{DEVICES} connected, registered devices (excluding the ID/IP strings and writers)\n")
+
+    measure("old per-IP maps", build_old_maps, inputs)
+    measure("dict per device", build_dict_sessions, inputs)
+    measure("DeviceSession (__slots__)", build_sessions, inputs)
+
+    bench_lookups(inputs[2], inputs[1])
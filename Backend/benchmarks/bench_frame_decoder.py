@@ -0,0 +1,78 @@
+# -----------------------------------------------
+# Throughput of the incremental FrameDecoder
+# against the old "one read == one packet" loop.
+#
+# Run from the repository root:
+#   python3 Backend/benchmarks/bench_frame_decoder.py
+# -----------------------------------------------
+import os
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import app.services.protocol_codec as protocol_codec
+
+FRAMES = 200_000
+READ_SIZE = 1024
+
+
+def build_frame(function, content, request_id=1):
+    header = struct.pack('!BBBBIHI', 0x13, 0x01, 0x00, 0x01, request_id, 0, len(content) + 2)
+    return header + struct.pack('!H', function) + content
+
+
+def build_frames():
+    frames = []
+    for i in range(FRAMES):
+        content = os.urandom(28) if i % 2 else os.urandom(36)
+        frames.append(build_frame(0x03e8, content, i))
+    return frames
+
+
+def chunks(stream, size):
+    return [stream[i:i + size] for i in range(0, len(stream), size)]
+
+
+def run_old_loop(reads):
+    parsed = 0
+    for data in reads:
+        request_id, function, content_len, content_data = protocol_codec.parse_packet(data)
+        if function == 0x03e8 and len(content_data) in (28, 36):
+            parsed += 1
+    return parsed
+
+
+def run_frame_decoder(reads):
+    decoder = protocol_codec.FrameDecoder()
+    parsed = 0
+    for data in reads:
+        for request_id, function, content_len, content_data in decoder.feed(data):
+            parsed += 1
+    return parsed
+
+
+def bench(name, func, reads, total_bytes):
+    start = time.perf_counter()
+    parsed = func(reads)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<16} {parsed:>9} frames ({parsed / FRAMES:6.1%} recovered)  "
+          f"{parsed / elapsed:>12,.0f} frames/s  {total_bytes / elapsed / 1e6:8.1f} MB/s")
+
+
+if __name__ == "__main__":
+    frames = build_frames()
+    stream = b"".join(frames)
+    print(f"{FRAMES} frames, {len(stream)} bytes")
+
+    # Best case for the old loop: every read returns exactly one frame
+    print("\nread size = one frame per read")
+    bench("old read loop", run_old_loop, frames, len(stream))
+    bench("FrameDecoder", run_frame_decoder, frames, len(stream))
+
+    for size in (READ_SIZE, 4096, 65536):
+        reads = chunks(stream, size)
+        print(f"\nread size = {size} bytes ({len(reads)} reads)")
+        bench("old read loop", run_old_loop, reads, len(stream))
+        bench("FrameDecoder", run_frame_decoder, reads, len(stream))
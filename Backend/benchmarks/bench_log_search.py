@@ -0,0 +1,106 @@
+# -----------------------------------------------
+# "Device X between T1 and T2" over a day of log
+# files: log_index.search against reading every
+# current and rotated (gzipped) file, and the cost
+# of maintaining the index while writing.
+#
+# Writes into a temporary directory, the real log
+# files are not touched.
+#
+# Run from the repository root:
+#   python3 Backend/benchmarks/bench_log_search.py
+# -----------------------------------------------
+import glob
+import gzip
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import app.services.log_index as log_index
+import app.routes.api.system_log as system_log
+
+RECORDS = 300_000
+DEVICES = 500
+SPACING = 0.25          # Seconds between records: 300k records ~ 21 hours
+MAX_BYTES = 1024 * 1024
+BATCH = 500             # Records per listener batch (one flush + index commit)
+
+
+def write_logs(directory, device_ids, start):
+    # What the log file thread does: emit every record, flush once per batch
+    records = []
+    for index in range(RECORDS):
+        device_id = device_ids[index % DEVICES]
+        if index % 2:
+            message = f"[Async] Removed ID={device_id} (IP=10.0.{index % DEVICES // 250}.{index % 250}) from the session table."
+        else:
+            message = f"Received data (hex): 13010001000004d2000000000000001e03e8{index:040x}"
+        record = logging.LogRecord("root", logging.INFO, "", 0, message, None, None)
+        record.created = start + index * SPACING
+        records.append(record)
+
+    compressor = system_log._LogCompressor(directory, 100)
+    handler = system_log.LogFileHandler(directory, MAX_BYTES, compressor)
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+
+    begin = time.perf_counter()
+    for index, record in enumerate(records, 1):
+        handler.handle(record)
+        if index % BATCH == 0:
+            handler.flush()
+    handler.close()
+    return time.perf_counter() - begin
+
+
+def full_scan(directory, device_id, start, end):
+    first = datetime.fromtimestamp(start).strftime("%Y-%m-%d %H:%M:%S")
+    last = datetime.fromtimestamp(end).strftime("%Y-%m-%d %H:%M:%S")
+    found = []
+    for path in glob.glob(os.path.join(directory, system_log.LOG_FILE_PREFIX + "*")):
+        with (gzip.open(path, "rt") if path.endswith(".gz") else open(path)) as file:
+            for line in file:
+                if device_id in line and first <= line[:19] <= last:
+                    found.append(line.rstrip("\n"))
+    return sorted(found)
+
+
+if __name__ == "__main__":
+    directory = tempfile.mkdtemp(prefix="bench_log_search_")
+    device_ids = [f"00ae{index:022x}" for index in range(DEVICES)]
+    start = time.time() - RECORDS * SPACING
+
+    # Same writes with the index switched off
+    original = log_index.LogIndex.add, log_index.LogIndex.commit
+    log_index.LogIndex.add = lambda *args: None
+    log_index.LogIndex.commit = lambda *args, **kwargs: True
+    plain_elapsed = write_logs(tempfile.mkdtemp(prefix="bench_log_search_plain_"), device_ids, start)
+
+    log_index.LogIndex.add, log_index.LogIndex.commit = original
+    indexed_elapsed = write_logs(directory, device_ids, start)
+    time.sleep(3)  # Let the compressor finish
+
+    index = log_index.LogIndex(directory)
+    query_start, query_end = start + 40_000, start + 44_000
+
+    begin = time.perf_counter()
+    lines, _ = index.search(device=device_ids[77], start=query_start, end=query_end)
+    search_elapsed = time.perf_counter() - begin
+
+    begin = time.perf_counter()
+    expected = full_scan(directory, device_ids[77], query_start, query_end)
+    scan_elapsed = time.perf_counter() - begin
+
+    assert lines == expected, (len(lines), len(expected))
+
+    files = len(glob.glob(os.path.join(directory, system_log.LOG_FILE_PREFIX + "*")))
+    print(f"{RECORDS} records, {files} log files, index {os.path.getsize(os.path.join(directory, log_index.INDEX_FILE)) // 1024} KB")
+    print(f"  write, no index          {plain_elapsed / RECORDS * 1e6:8.1f} us per record")
+    print(f"  write + index            {indexed_elapsed / RECORDS * 1e6:8.1f} us per record")
+    print(f"  search (index), {len(lines)} lines {search_elapsed * 1e3:8.1f} ms")
+    print(f"  full scan of every file  {scan_elapsed * 1e3:8.1f} ms")
+    print(f"  (files left in {directory})")
@@ -0,0 +1,63 @@
+# -----------------------------------------------
+# Cost of system_log.log_to_redis for the caller
+# (the event loop), against the previous
+# synchronous version (lrange + rpush + ltrim +
+# ttl + file write per message), and how long the
+# writer thread takes to drain the same messages.
+#
+# Needs a Redis server on 127.0.0.1:6379. Uses its
+# own keys, the system logs are not touched.
+#
+# Run from the repository root:
+#   python3 Backend/benchmarks/bench_logging.py
+# -----------------------------------------------
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import app.routes.api.system_log as system_log
+
+MESSAGES = 5_000
+BENCH_KEY = "bench_system_logs"
+
+
+def old_log_to_redis(message):
+    redis_client = system_log.redis_client
+    logs = redis_client.lrange(BENCH_KEY, -10, -1)
+
+    if message not in logs:
+        redis_client.rpush(BENCH_KEY, message)
+        redis_client.ltrim(BENCH_KEY, -1000, -1)
+
+        system_log.logger.info(message)
+
+        if redis_client.ttl(BENCH_KEY) == -1:
+            redis_client.expire(BENCH_KEY, 7*24*60*60)
+
+
+if __name__ == "__main__":
+    system_log.LOG_STREAM_KEY = BENCH_KEY + "_stream"
+    messages = [f"Received data (hex): {index:08x}" for index in range(MESSAGES)]
+
+    start = time.perf_counter()
+    for message in messages:
+        old_log_to_redis(message)
+    old_elapsed = time.perf_counter() - start
+
+    system_log.redis_client.delete(BENCH_KEY)
+
+    start = time.perf_counter()
+    for message in messages:
+        system_log.log_to_redis(message + " ")
+    enqueue_elapsed = time.perf_counter() - start
+    system_log.flush_logs(timeout=60)
+    drain_elapsed = time.perf_counter() - start
+
+    system_log.redis_client.delete(system_log.LOG_STREAM_KEY)
+
+    print(f"{MESSAGES} messages")
+    print(f"  synchronous (old)        {old_elapsed / MESSAGES * 1e6:8.1f} us per call")
+    print(f"  queued, caller side      {enqueue_elapsed / MESSAGES * 1e6:8.1f} us per call")
+    print(f"  queued, written after    {drain_elapsed:8.3f} s (old: {old_elapsed:.3f} s)")
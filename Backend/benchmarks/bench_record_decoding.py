@@ -0,0 +1,69 @@
+# -----------------------------------------------
+# Per-record struct decoding against the
+# vectorized NumPy path in handle_data.
+#
+# Run from the repository root:
+#   python3 Backend/benchmarks/bench_record_decoding.py
+# -----------------------------------------------
+import os
+import random
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import app.services.handle_data as handle_data
+
+SIZES = (4, 8, 16, 1_000, 10_000, 100_000)
+
+
+def make_records(count, record_size):
+    records = []
+    for i in range(count):
+        values = [random.uniform(0, 30), random.uniform(-1, 1), random.uniform(0, 100), random.uniform(-1, 1),
+                  random.uniform(0, 2), random.uniform(0, 100), random.randint(0, 3)]
+        if i % 10 == 0:
+            values[0] = values[2] = 0.0  # Out of bed
+        if record_size == 28:
+            records.append(struct.pack('>ffffffI', *values))
+        else:
+            records.append(struct.pack('>ffffffIff', *values, random.uniform(0, 50), random.uniform(0, 1)))
+    return records
+
+
+def per_record(records, record_size):
+    parse = handle_data.parse_28_byte_content if record_size == 28 else handle_data.parse_36_byte_content
+    return [handle_data.check_in_out_of_bed(parse(content)) for content in records]
+
+
+def vectorized_columns(records, record_size):
+    return handle_data.check_in_out_of_bed_batch(handle_data.decode_records(records, record_size))
+
+
+def vectorized_dicts(records, record_size):
+    return handle_data.columns_to_dicts(vectorized_columns(records, record_size))
+
+
+def timed(func, records, record_size):
+    repeat = max(1, 200_000 // len(records))
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(records, record_size)
+    return (time.perf_counter() - start) / repeat / len(records) * 1e9  # ns per record
+
+
+if __name__ == "__main__":
+    random.seed(1)
+
+    for record_size in (28, 36):
+        print(f"\n{record_size}-byte records (ns per record)")
+        print(f"{'records':>8} {'per-record':>11} {'numpy cols':>11} {'numpy dicts':>12} {'speedup (cols)':>15}")
+        for count in SIZES:
+            records = make_records(count, record_size)
+            assert vectorized_dicts(records, record_size) == per_record(records, record_size)
+
+            base = timed(per_record, records, record_size)
+            cols = timed(vectorized_columns, records, record_size)
+            dicts = timed(vectorized_dicts, records, record_size)
+            print(f"{count:>8} {base:>11.0f} {cols:>11.0f} {dicts:>12.0f} {base / cols:>14.1f}x")
@@ -0,0 +1,65 @@
+# -----------------------------------------------
+# Bytes per sample and encode cost per sample for
+# every telemetry encoding, single and batched.
+#
+# Run from the repository root:
+#   python3 Backend/benchmarks/bench_telemetry_encoder.py
+# -----------------------------------------------
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import app.services.telemetry_encoder as telemetry_encoder
+
+SAMPLES = 20_000
+BATCH_SIZES = (1, 50)
+TOPIC = "another-tcp-server/0123456789abcdef0123456789"
+
+
+def make_sample(i):
+    sample = {
+        "device_id": "0123456789abcdef0123456789",
+        "current_time": 1742448708 + i,
+        "breath_bpm": random.randint(10, 25),
+        "breath_curve": random.uniform(-1, 1),
+        "heart_bpm": random.randint(50, 100),
+        "heart_rate_curve": random.uniform(-1, 1),
+        "target_distance": random.uniform(0.3, 1.5),
+        "signal_strength": random.uniform(0, 100),
+        "valid_bit_id": random.randint(0, 3),
+    }
+    if i % 2:
+        sample["body_move_energy"] = random.uniform(0, 50)
+        sample["body_move_range"] = random.uniform(0, 1)
+    sample["out_of_bed"] = False
+    return sample
+
+
+def bench(encoding, samples, batch_size):
+    telemetry_encoder.environment.TELEMETRY_ENCODING = encoding
+
+    total_bytes = 0
+    start = time.perf_counter()
+    if batch_size == 1:
+        for sample in samples:
+            total_bytes += len(telemetry_encoder.encode_sample(TOPIC, sample))
+    else:
+        for i in range(0, len(samples), batch_size):
+            total_bytes += len(telemetry_encoder.encode_batch(TOPIC, samples[i:i + batch_size]))
+    elapsed = time.perf_counter() - start
+
+    return total_bytes / len(samples), elapsed / len(samples) * 1e6
+
+
+if __name__ == "__main__":
+    random.seed(1)
+    samples = [make_sample(i) for i in range(SAMPLES)]
+
+    print(f"{'encoding':<12} {'batch':>5} {'bytes/sample':>13} {'us/sample':>10}")
+    for batch_size in BATCH_SIZES:
+        for encoding in telemetry_encoder.ENCODINGS:
+            size, cost = bench(encoding, samples, batch_size)
+            print(f"{encoding:<12} {batch_size:>5} {size:>13.1f} {cost:>10.2f}")
@@ -0,0 +1,52 @@
+# -----------------------------------------------
+# Inspect or invalidate the registered-device
+# cache (DEVICE_CACHE_PATH). A forgotten device is
+# registered again (POST /device/create) on its
+# next 0x0001; running backends pick the change
+# up on their next registration, no restart.
+#
+#   python3 Backend/tools/device_cache.py list
+#   python3 Backend/tools/device_cache.py forget 00ae0000000000000000000003
+#   python3 Backend/tools/device_cache.py forget --all
+#
+# Run from the repository root.
+# -----------------------------------------------
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import app.environment.environment as environment
+import app.services.http_client as http_client
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or invalidate the registered-device cache")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list", help="Cached devices and when they were registered")
+    forget = subparsers.add_parser("forget", help="Register these devices again on their next 0x0001")
+    forget.add_argument("device_ids", nargs="*", help="Device IDs (hex)")
+    forget.add_argument("--all", action="store_true", help="Forget every device")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        http_client._load_device_cache()
+        now = time.time()
+        for device_id, registered_at in sorted(http_client.registered_devices.items()):
+            state = "valid" if now - registered_at < environment.DEVICE_CACHE_TTL else "expired"
+            print(f"{device_id}  {datetime.fromtimestamp(registered_at):%Y-%m-%d %H:%M:%S}  {state}")
+        print(f"{len(http_client.registered_devices)} device(s) in {environment.DEVICE_CACHE_PATH}")
+        sys.exit(0)
+
+    if args.all:
+        http_client.invalidate_device()
+        print("Forgot every device.")
+    elif args.device_ids:
+        for device_id in args.device_ids:
+            http_client.invalidate_device(device_id.lower())
+            print(f"Forgot {device_id.lower()}.")
+    else:
+        parser.error("forget needs device IDs or --all")
@@ -0,0 +1,344 @@
+# -----------------------------------------------
+# Aerosense device simulator / load generator
+#
+# Opens many concurrent TCP connections to the
+# server and speaks the device protocol:
+# - 0x0001 registration with a 13-byte ID, the
+#   server answers with the connection count
+# - 0x03e8 samples (28- or 36-byte content) at a
+#   fixed rate per device
+# - answers the server's 0x0410 request with its ID
+#
+# Each simulated device binds a source address from
+# --source-net (default 127.0.0.0/16: every
+# 127.x.y.z address is local on Linux), one per
+# device unless --devices-per-ip puts several
+# devices behind one address, like beds behind a
+# NAT. Against a remote server, add IP aliases to
+# this host and pass their range.
+#
+# Note: every new device ID is registered with
+# DreamsEdge by the server (once, then cached), so
+# use a dedicated --id-base against a real backend.
+#
+# Run from the repository root, e.g.:
+#   python3 Backend/tools/device_simulator.py --devices 2000 --rate 1 --duration 60
+# -----------------------------------------------
+import argparse
+import asyncio
+import ipaddress
+import itertools
+import os
+import random
+import resource
+import sys
+import time
+from collections import Counter
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import app.environment.environment as environment
+import app.services.protocol_codec as protocol_codec
+
+FUNCTION_REGISTER = protocol_codec.FUNCTION_REGISTER
+FUNCTION_SAMPLE = protocol_codec.FUNCTION_SAMPLE
+FUNCTION_REQUEST_ID = protocol_codec.FUNCTION_REQUEST_ID
+
+# -----------------------------------------------
+# Counters shared by every simulated device
+# -----------------------------------------------
+class Stats:
+    def __init__(self):
+        self.connected = 0            # Currently open connections
+        self.registered = 0           # Devices that got their 0x0001 response
+        self.samples_sent = 0
+        self.bytes_sent = 0
+        self.id_requests = 0          # 0x0410 requests answered
+        self.connect_latency = []     # Seconds from connect() to established
+        self.handshake_latency = []   # Seconds from connect() to the 0x0001 response
+        self.response_latency = []    # Seconds from any request to the server's answer (same request_id)
+        self.errors = Counter()
+
+stats = Stats()
+
+
+def build_frame(function, content, request_id):
+    return (protocol_codec.HEADER.pack(protocol_codec.PROTO, protocol_codec.VERSION, 0x00, 0x01,
+                                       request_id, 0, len(content) + 2) +
+            protocol_codec.FUNCTION.pack(function) + content)
+
+
+def build_sample(record_size, rng, out_of_bed_ratio):
+    if rng.random() < out_of_bed_ratio:
+        breath_bpm = heart_bpm = 0.0
+    else:
+        breath_bpm = rng.uniform(10, 25)
+        heart_bpm = rng.uniform(50, 100)
+
+    fields = (breath_bpm, rng.uniform(-1, 1), heart_bpm, rng.uniform(-1, 1),
+              rng.uniform(0.3, 2.0), rng.uniform(0, 100), 0x3F)
+
+    if record_size == 28:
+        return protocol_codec.RECORD_28.pack(*fields)
+    return protocol_codec.RECORD_36.pack(*fields, rng.uniform(0, 1000), rng.uniform(0, 100))
+
+
+def device_id_bytes(index, id_base):
+    return (id_base + index).to_bytes(13, "big")
+
+
+def source_addresses(network, count):
+    hosts = ipaddress.ip_network(network).hosts()
+    # Skip 127.0.0.1 so a real device on the loopback is not kicked out by the simulator
+    addresses = [str(ip) for ip in itertools.islice(hosts, count + 1) if str(ip) != "127.0.0.1"]
+    if len(addresses) < count:
+        raise SystemExit(f"--source-net {network} has only {len(addresses)} addresses for {count} devices")
+    return addresses[:count]
+
+# -----------------------------------------------
+# One simulated device
+# -----------------------------------------------
+async def run_device(index, args, source_ip, connect_limit, deadline):
+    rng = random.Random(args.seed + index)
+    device_id = device_id_bytes(index, args.id_base)
+    record_size = args.record_size if args.record_size != "mixed" else rng.choice((28, 36))
+    register = rng.random() >= args.unregistered_ratio
+
+    request_ids = itertools.count(1)
+    outstanding = {}          # request_id -> send time, waiting for the server's answer
+    registered = asyncio.Event()
+
+    loop = asyncio.get_running_loop()
+    connect_start = loop.time()
+
+    try:
+        async with connect_limit:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(args.host, args.port, local_addr=(source_ip, 0)),
+                timeout=args.timeout,
+            )
+    except asyncio.TimeoutError:
+        stats.errors["connect_timeout"] += 1
+        return
+    except OSError as e:
+        stats.errors[f"connect_{type(e).__name__}"] += 1
+        return
+
+    stats.connect_latency.append(loop.time() - connect_start)
+    stats.connected += 1
+
+    async def send(function, content, wait_answer):
+        request_id = next(request_ids) & 0xFFFFFFFF
+        if wait_answer:
+            outstanding[request_id] = loop.time()
+        frame = build_frame(function, content, request_id)
+        writer.write(frame)
+        stats.bytes_sent += len(frame)
+        await writer.drain()
+
+    async def read_loop():
+        decoder = protocol_codec.FrameDecoder()
+        while True:
+            data = await reader.read(4096)
+            if not data:
+                stats.errors["closed_by_server"] += 1
+                return
+
+            try:
+                frames = decoder.feed(data)
+            except protocol_codec.FrameError:
+                stats.errors["bad_frame_from_server"] += 1
+                return
+
+            now = loop.time()
+            for request_id, function, content_len, content_data in frames:
+                sent_at = outstanding.pop(request_id, None)
+                if sent_at is not None:
+                    stats.response_latency.append(now - sent_at)
+
+                if function == FUNCTION_REGISTER:
+                    if not registered.is_set():
+                        stats.handshake_latency.append(now - connect_start)
+                        stats.registered += 1
+                        registered.set()
+
+                elif function == FUNCTION_REQUEST_ID:
+                    # The server does not know us (yet): answer with the ID
+                    stats.id_requests += 1
+                    await send(FUNCTION_REQUEST_ID, device_id, wait_answer=False)
+                    registered.set()  # Known from now on, samples get no answer
+
+                else:
+                    stats.errors[f"unexpected_function_0x{function:04x}"] += 1
+
+    reader_task = asyncio.create_task(read_loop())
+
+    try:
+        if register:
+            await send(FUNCTION_REGISTER, device_id, wait_answer=True)
+            try:
+                await asyncio.wait_for(asyncio.shield(registered.wait()), timeout=args.timeout)
+            except asyncio.TimeoutError:
+                stats.errors["register_timeout"] += 1
+
+        interval = 1.0 / args.rate
+        next_send = loop.time() + rng.uniform(0, interval)  # Spread devices over the interval
+
+        while loop.time() < deadline and not reader_task.done():
+            await asyncio.sleep(max(0.0, next_send - loop.time()))
+            next_send += interval
+
+            content = build_sample(record_size, rng, args.out_of_bed_ratio)
+            # Unregistered devices get a 0x0410 answer, so time those samples too
+            await send(FUNCTION_SAMPLE, content, wait_answer=not registered.is_set())
+            stats.samples_sent += 1
+
+    except (ConnectionResetError, BrokenPipeError):
+        stats.errors["connection_reset"] += 1
+
+    finally:
+        reader_task.cancel()
+        try:
+            await reader_task
+        except asyncio.CancelledError:
+            pass
+        except (ConnectionResetError, BrokenPipeError):
+            stats.errors["connection_reset"] += 1
+
+        if outstanding:
+            stats.errors["no_response"] += len(outstanding)
+
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        stats.connected -= 1
+
+# -----------------------------------------------
+# Progress and summary output
+# -----------------------------------------------
+async def report_loop(interval):
+    last_samples = 0
+    last_time = time.perf_counter()
+
+    while True:
+        await asyncio.sleep(interval)
+        now = time.perf_counter()
+        rate = (stats.samples_sent - last_samples) / (now - last_time)
+        last_samples, last_time = stats.samples_sent, now
+
+        errors = sum(stats.errors.values())
+        print(f"[Sim] connected={stats.connected} registered={stats.registered} "
+              f"samples/s={rate:,.0f} total={stats.samples_sent} errors={errors}")
+
+
+def percentiles(name, values):
+    if not values:
+        print(f"  {name:<20} no data")
+        return
+    ms = np.asarray(values) * 1000.0
+    p50, p90, p99 = np.percentile(ms, (50, 90, 99))
+    print(f"  {name:<20} n={len(ms):<8} p50={p50:8.2f} ms  p90={p90:8.2f} ms  "
+          f"p99={p99:8.2f} ms  max={ms.max():8.2f} ms")
+
+
+def print_summary(args, elapsed):
+    print("\n===== Simulator summary =====")
+    print(f"  target               {args.host}:{args.port}")
+    print(f"  devices              {args.devices} x {args.rate} samples/s "
+          f"(expected {args.devices * args.rate:,.0f} samples/s)")
+    print(f"  duration             {elapsed:.1f} s")
+    print(f"  samples sent         {stats.samples_sent} ({stats.samples_sent / elapsed:,.0f} samples/s, "
+          f"{stats.bytes_sent / elapsed / 1e6:.2f} MB/s)")
+    print(f"  registered           {stats.registered}")
+    print(f"  0x0410 answered      {stats.id_requests}")
+    percentiles("connect latency", stats.connect_latency)
+    percentiles("handshake latency", stats.handshake_latency)
+    percentiles("response latency", stats.response_latency)
+
+    if stats.errors:
+        print("  errors:")
+        for name, value in stats.errors.most_common():
+            print(f"    {name:<30} {value}")
+    else:
+        print("  errors               none")
+
+
+def raise_file_limit(needed):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = needed + 64
+    if soft >= wanted:
+        return
+    new_soft = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (new_soft, hard))
+    if new_soft < wanted:
+        print(f"[Sim] Warning: open file limit is {new_soft}, some of the {needed} connections will fail.")
+
+
+async def main(args):
+    raise_file_limit(args.devices)
+    addresses = source_addresses(args.source_net, -(-args.devices // args.devices_per_ip))
+
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    deadline = loop.time() + args.ramp + args.duration
+
+    connect_limit = asyncio.Semaphore(args.connect_concurrency)
+    reporter = asyncio.create_task(report_loop(args.report_interval))
+
+    async def delayed(index):
+        # Ramp up: start devices evenly over --ramp seconds
+        if args.ramp:
+            await asyncio.sleep(args.ramp * index / args.devices)
+        await run_device(index, args, addresses[index // args.devices_per_ip], connect_limit, deadline)
+
+    try:
+        await asyncio.gather(*(delayed(index) for index in range(args.devices)))
+    finally:
+        # Also on Ctrl+C, so an interrupted run still reports what it measured
+        reporter.cancel()
+        print_summary(args, time.perf_counter() - start)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Simulate Aerosense devices against the TCP server.")
+    parser.add_argument("--host", default=environment.TCP_SERVER_HOST if environment.TCP_SERVER_HOST != "0.0.0.0" else "127.0.0.1",
+                        help="server address (default: TCP_SERVER_HOST, 127.0.0.1 if it is 0.0.0.0)")
+    parser.add_argument("--port", type=int, default=environment.TCP_SERVER_PORT, help="server port (default: TCP_SERVER_PORT)")
+    parser.add_argument("--devices", type=int, default=100, help="number of concurrent devices")
+    parser.add_argument("--rate", type=float, default=1.0, help="samples per second per device")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to send samples after the ramp-up")
+    parser.add_argument("--ramp", type=float, default=5.0, help="seconds over which devices connect")
+    parser.add_argument("--record-size", choices=("28", "36", "mixed"), default="mixed",
+                        help="0x03e8 content size")
+    parser.add_argument("--unregistered-ratio", type=float, default=0.0,
+                        help="fraction of devices that skip 0x0001 and wait for the server's 0x0410 request")
+    parser.add_argument("--out-of-bed-ratio", type=float, default=0.05,
+                        help="fraction of samples with zero breath/heart rate")
+    parser.add_argument("--source-net", default="127.0.0.0/16",
+                        help="local addresses to connect from")
+    parser.add_argument("--devices-per-ip", type=int, default=1,
+                        help="devices sharing one source address (NAT)")
+    parser.add_argument("--id-base", type=lambda value: int(value, 0), default=0xAE0000000000000000000000,
+                        help="device IDs are id-base + index, as 13 bytes")
+    parser.add_argument("--connect-concurrency", type=int, default=200, help="connections being opened at once")
+    parser.add_argument("--timeout", type=float, default=10.0, help="connect / registration timeout in seconds")
+    parser.add_argument("--report-interval", type=float, default=5.0, help="seconds between progress lines")
+    parser.add_argument("--seed", type=int, default=1)
+
+    args = parser.parse_args()
+    if args.record_size != "mixed":
+        args.record_size = int(args.record_size)
+    if args.rate <= 0 or args.devices <= 0 or args.devices_per_ip <= 0:
+        parser.error("--rate, --devices and --devices-per-ip must be positive")
+    return args
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main(parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,36 @@
+# -----------------------------------------------
+# Send a command to the running TCP backend over
+# its control socket (what the web UI's Start /
+# Stop buttons do), e.g. after editing
+# environment.py by hand:
+#
+#   python3 Backend/tools/server_control.py status
+#   python3 Backend/tools/server_control.py reload
+#
+# Commands: start, stop, reload, status. Exits
+# with 1 if the command failed or the backend
+# could not be reached.
+# -----------------------------------------------
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import app.services.control_channel as control_channel
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Control the TCP backend")
+    parser.add_argument("command", choices=control_channel.COMMANDS)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    response = control_channel.send_command(args.command)
+    elapsed = time.perf_counter() - start
+
+    print(json.dumps(response, indent=2))
+    print(f"({elapsed * 1000:.1f} ms)")
+    sys.exit(0 if response.get("success") else 1)
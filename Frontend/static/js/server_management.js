@@ -1,6 +1,13 @@
 $(document).ready(function() {
+    const STATUS_WAIT = 25;          // Seconds the server holds the request when nothing changes
+    const STATUS_RETRY_DELAY = 5000; // After an error or when the server is busy
+    let statusVersion = null;        // Version of the status shown, null before the first answer
+
+    // Long-poll: the server answers when the status changes (or after STATUS_WAIT seconds)
     function fetchServerStatus() {
-        $.get("/check_status_server", function (response) {
+        let params = statusVersion === null ? {} : { since: statusVersion, wait: STATUS_WAIT };
+
+        $.ajax({ url: "/check_status_server", data: params, timeout: (STATUS_WAIT + 10) * 1000 }).done(function (response) {
             // Update the TCP Server status UI
             updateStatus("tcpServerStatus", "tcpStatusText", response.tcp_status, {
                 "running": "green",
@@ -14,8 +21,12 @@ $(document).ready(function() {
                 "disconnected": "red",
                 "timeout": "red"
             });
+
+            statusVersion = response.version;
+            setTimeout(fetchServerStatus, response.busy || response.version === null ? STATUS_RETRY_DELAY : 0);
         }).fail(function () {
             $("#tcpStatusText, #awsStatusText").text("Error");
+            setTimeout(fetchServerStatus, STATUS_RETRY_DELAY);
         });
     }
 
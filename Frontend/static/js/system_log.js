@@ -1,10 +1,24 @@
 $(document).ready(function () {
-    fetchLogs(); // Load logs initially
-    setInterval(fetchLogs, 1000); // Auto-refresh every 5 seconds
+    if (window.EventSource) {
+        openLogStream(); // Live tail pushed by the server
+    } else {
+        fetchLogs(); // Load logs initially
+        setInterval(fetchLogs, 1000); // Poll for new logs every second
+    }
 
     // Refresh logs manually
     $("#refreshLogs").click(function () {
-        fetchLogs();
+        if (window.EventSource) {
+            openLogStream();
+        } else {
+            fetchLogs();
+        }
+    });
+
+    // Reconnect the live tail with the new filters
+    $("#logFilterForm").submit(function (event) {
+        event.preventDefault();
+        openLogStream();
     });
 
     // Load current logging config when page loads
@@ -29,11 +43,36 @@ $(document).ready(function () {
         }, "json");
     });
 
+    // Load current log level / sampling / capture settings
+    $.get("/get_log_settings", function(response) {
+        if (response.success) {
+            $("#logLevel").val(response.level);
+            $("#packetSample").val(response.packet_sample);
+            $("#captureDevices").val(response.capture_devices.join(", "));
+        }
+    });
+
+    // Apply log settings (picked up by the TCP server without restart)
+    $("#logSettingsForm").submit(function(event) {
+        event.preventDefault();
+        $.post("/update_log_settings", $(this).serialize(), function(response) {
+            $("#logSettingsMessage").text(response.message).css("color", response.success ? "green" : "red");
+        }, "json").fail(function () {
+            $("#logSettingsMessage").text("Error connecting to the server.").css("color", "red");
+        });
+    });
+
+    // Search the log files, the last hour by default
+    $("#logSearchForm").submit(function (event) {
+        event.preventDefault();
+        searchLogs();
+    });
+
     // Clear logs
     $("#clearLogs").click(function () {
         $.post("/clear_logs", function (response) {
             if (response.success) {
-                $("#logMessages").html("<p>Logs cleared successfully.</p>");
+                $("#logMessages").html("<p class=\"log-status\">Logs cleared successfully.</p>");
             } else {
                 $("#logMessages").html("<p>Error clearing logs.</p>");
             }
@@ -43,52 +82,121 @@ $(document).ready(function () {
     });
 });
 
-// Function to fetch logs from the backend
+// Stream ID of the newest log shown; only entries after it are fetched
+let lastLogId = null;
+
+// Rows kept in the page, the oldest are removed beyond this
+const MAX_LOG_ROWS = 2000;
+
+// Live tail: one EventSource per page, filtered on the server
+let logStream = null;
+
+function openLogStream() {
+    if (logStream) {
+        logStream.close();
+    }
+
+    let params = $.param({
+        level: $("#filterLevel").val() || "DEBUG",
+        device: ($("#filterDevice").val() || "").trim(),
+        q: ($("#filterText").val() || "").trim()
+    });
+
+    $("#logMessages").empty().append("<p class=\"log-status\">Waiting for logs...</p>");
+
+    // The browser reconnects on its own and resumes from the last event ID
+    logStream = new EventSource("/stream_logs?" + params);
+    logStream.onmessage = function (event) {
+        let entry = JSON.parse(event.data);
+        appendLogs([entry.message], [entry.level]);
+    };
+}
+
+// Append rows, keep at most MAX_LOG_ROWS, follow the bottom if the user is there
+function appendLogs(logs, levels) {
+    let logContainer = $("#logMessages");
+    let container = logContainer[0];
+    let shouldScroll = container.scrollHeight - container.scrollTop - container.clientHeight < 5;
+
+    logContainer.find(".log-status").remove();
+
+    let fragment = document.createDocumentFragment();
+    logs.forEach((log, index) => {
+        let row = document.createElement("p");
+        row.textContent = log;
+        row.className = "log-" + (levels[index] || "INFO").toLowerCase();
+        fragment.appendChild(row);
+    });
+    container.appendChild(fragment);
+
+    let rows = logContainer.children("p");
+    if (rows.length > MAX_LOG_ROWS) {
+        rows.slice(0, rows.length - MAX_LOG_ROWS).remove();
+    }
+
+    if (shouldScroll) {
+        logContainer.scrollTop(container.scrollHeight);
+    }
+}
+
+// Function to fetch new logs from the backend and append them (browsers without EventSource)
 function fetchLogs() {
-    $.get("/get_logs", function (response) {
+    let params = lastLogId ? { after: lastLogId } : {};
+
+    $.get("/get_logs", params, function (response) {
         let logContainer = $("#logMessages");
-        logContainer.empty();  // Clear old logs from UI first
 
-        if (response.success) {
+        if (!response.success) {
+            logContainer.find(".log-status").remove();
+            logContainer.append("<p class=\"log-status\">Error loading logs.</p>");
+            return;
+        }
+
+        if (lastLogId === null) {
+            logContainer.empty();
             if (response.logs.length === 0) {
-                logContainer.append("<p>No logs available.</p>");  // Show message when logs are expired
-            } else {
-                response.logs.forEach(log => {
-                    logContainer.append(`<p>${log}</p>`);
-                });
+                logContainer.append("<p class=\"log-status\">No logs available.</p>");  // Show message when logs are expired
             }
-        } else {
-            logContainer.append("<p>Error loading logs.</p>");
         }
+        lastLogId = response.last_id || lastLogId;
 
-        if (isScrolledToBottom) {
-            logContainer.scrollTop(logContainer[0].scrollHeight);
+        if (response.logs.length > 0) {
+            appendLogs(response.logs, response.levels);
         }
-        
     }).fail(function () {
-        $("#logMessages").empty().append("<p>Failed to connect to the server.</p>");
+        let logContainer = $("#logMessages");
+        logContainer.find(".log-status").remove();
+        logContainer.append("<p class=\"log-status\">Failed to connect to the server.</p>");
     });
 }
 
-// Function to update logs without duplicates
-function updateLogs(logs) {
-    let logContainer = $("#logMessages");
-    let existingLogs = logContainer.children("p").map(function () {
-        return $(this).text();
-    }).get();
-
-    let newLogs = logs.filter(log => !existingLogs.includes(log)); // Filter out duplicates
+// Search the current and rotated log files (device ID / IP / time range)
+function searchLogs() {
+    let results = $("#searchResults");
+    results.empty().append("<p class=\"log-status\">Searching...</p>");
 
-    if (newLogs.length > 0) {
-        let shouldScroll = logContainer[0].scrollHeight - logContainer.scrollTop() === logContainer.outerHeight();
+    $.get("/search_logs", $("#logSearchForm").serialize(), function (response) {
+        results.empty();
+        if (response.logs.length === 0) {
+            results.append("<p class=\"log-status\">No matching logs.</p>");
+            return;
+        }
 
-        newLogs.forEach(log => {
-            logContainer.append(`<p>${log}</p>`);
+        let fragment = document.createDocumentFragment();
+        response.logs.forEach((log) => {
+            let row = document.createElement("p");
+            row.textContent = log;
+            let level = log.split(" - ")[1] || "INFO";
+            row.className = "log-" + level.toLowerCase();
+            fragment.appendChild(row);
         });
+        results[0].appendChild(fragment);
 
-        // Auto-scroll only if the user is already at the bottom
-        if (shouldScroll) {
-            logContainer.scrollTop(logContainer[0].scrollHeight);
+        if (response.truncated) {
+            results.append("<p class=\"log-status\">Only the first " + response.logs.length + " matches are shown, narrow the search.</p>");
         }
-    }
-}
\ No newline at end of file
+    }).fail(function (xhr) {
+        let message = (xhr.responseJSON && xhr.responseJSON.message) || "Failed to connect to the server.";
+        results.empty().append($("<p class=\"log-status\"></p>").text(message));
+    });
+}